@@ -9,6 +9,10 @@ Script replay the rejected vulnerabilities by data depot. Simply export the logs
 Example
     $ python3 ./api-replay-failed-entities-from-csv.py --env staging --batchsize 100 --input failed-entities.csv  --sleep 10
 
+The same (gitHubInstallationId, jiraHost, vulnerabilityId) usually shows up in many log lines.
+Repeats are dropped before anything is sent, and every request only carries entities of a
+single installation and jiraHost.
+
 First time setup:
 
 1. virtualenv env -p python3
@@ -19,97 +23,30 @@ First time setup:
 import argparse
 import csv
 import logging
+import math
 import requests
-import subprocess
-import sys
-import time
-import json
-from requests import Request
-from requests.auth import AuthBase
-from typing import NamedTuple
-from dataclasses import dataclass
-from json import JSONEncoder
+from typing import Iterable, Iterator, NamedTuple
+from g4j_ops import (
+    TOKEN_PROVIDER,
+    AdminClient,
+    add_common_arguments,
+    add_throttle_arguments,
+    configure_logging,
+    create_client,
+)
+from g4j_ops.batchsize import AUTO, BatchSizeTuner, create_batch_size, parse_batch_size
+from g4j_ops.client import MAX_REPLAY_ENTITIES_BATCH
+from g4j_ops.checkpoint import ERROR, SUCCESS
+from g4j_ops.dedupe import Deduplicator, grouped_batches
+from g4j_ops.metrics import METRICS, add_metrics_arguments, start_reporting
 
 LOG = logging.getLogger(__name__)
 
-session = requests.Session()
-
-def configure_logging(level='DEBUG'):
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-    ch = logging.StreamHandler(sys.stdout)
-    ch.setFormatter(formatter)
-    ch.setLevel(level)
-
-    root = logging.getLogger()
-    root.setLevel(level)
-    root.addHandler(ch)
-
-class SLAuth(AuthBase):
-    def __init__(self, audience, group, environment):
-        self.audience = audience
-        self.group = group
-        self.environment = environment
-
-    def __call__(self, req: Request) -> Request:
-        cmd = ['atlas',
-               'slauth', 'token',
-               '-m',
-               '-g', self.group,
-               '-e', self.environment,
-               '-a', self.audience]
-        data = subprocess.check_output(cmd)
-        jwt = data.decode('utf-8').strip()
-
-        req.headers['Authorization'] = f'slauth {jwt}'
-        return req
-
-
-def create_slauth(env: str) -> SLAuth:
-    return SLAuth(
-        audience=f'github-for-jira',
-        group=f'micros-sv--github-for-jira-dl-admins',
-        environment=env
-    )
-
-
-class Environment(NamedTuple):
-    github_for_jira_url: str
-    github_for_jira_auth: object
-
-def create_environment(env: str) -> Environment:
-  print("Running for env", env)
-  if env == 'dev':
-      return Environment(
-          github_for_jira_url='https://github-for-jira.ap-southwest-2.dev.atl-paas.net',
-          github_for_jira_auth=create_slauth(env))
-  elif env == 'staging':
-      return Environment(
-          github_for_jira_url='https://github-for-jira.us-west-1.staging.atl-paas.net',
-          github_for_jira_auth=create_slauth(env))
-  elif env == 'prod':
-      return Environment(
-          github_for_jira_url='https://github-for-jira.sgw.prod.atl-paas.net',
-          github_for_jira_auth=create_slauth(env))
-  else:
-      raise ValueError(f'Invalid environment {env}')
-  
-@dataclass(frozen=True)
-class FailedEntity:
-    gitHubInstallationId: int
-    hashedJiraHost: str
-    identifiers: list
-
-    @staticmethod
-    def from_dict(d):
-        return FailedEntity(d['gitHubInstallationId'], d['jiraHost'], d['rejectedEntities{}.key.vulnerabilityId'].split("\n"))
 
-class ReplayEntity:
-    def __init__(self, gitHubInstallationId, hashedJiraHost, identifier):
-        self.gitHubInstallationId = gitHubInstallationId
-        self.hashedJiraHost = hashedJiraHost
-        self.identifier = identifier
+class ReplayEntity(NamedTuple):
+    gitHubInstallationId: str
+    hashedJiraHost: str
+    identifier: str
 
     def to_json(self):
         return {
@@ -118,52 +55,75 @@ class ReplayEntity:
             'identifier': self.identifier
         }
 
-def process_replayEntities(env: Environment, replayEntities: list) -> bool:
-    url = '{}/api/replay-rejected-entities-from-data-depot'.format(env.github_for_jira_url)
-    
-    replayEntitiesJson = []
-    for replayEntity in replayEntities:
-        replayEntitiesJson.append(replayEntity.to_json())
 
-    response = session.post(url,
-      auth=env.github_for_jira_auth,
-      json={
-        "replayEntities": replayEntitiesJson
-      },
-      headers = {"Content-Type": "application/json"})
+def parse_replayEntities(rows: Iterable[dict]) -> Iterator[ReplayEntity]:
+    # Each Splunk row carries all vulnerability ids rejected in one submission, one per line
+    for row in rows:
+        for identifier in row['rejectedEntities{}.key.vulnerabilityId'].split("\n"):
+            identifier = identifier.strip()
+            if identifier:
+                yield ReplayEntity(row['gitHubInstallationId'], row['jiraHost'], identifier)
+
+
+def process_replayEntities(client: AdminClient, replayEntities: list) -> requests.Response:
+    response = client.replay_rejected_entities(replayEntity.to_json() for replayEntity in replayEntities)
 
     LOG.info("Response status %s" , response.status_code)
     LOG.info("Response text %s" , response.text)
+    return response
     
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--env', choices=('dev', 'staging', 'prod'), required=True)
-    parser.add_argument('--batchsize', default=100, type=int, help='How many jiraHosts to process each iteration')
+    add_common_arguments(parser)
+    parser.add_argument('--batchsize', default=100, type=parse_batch_size,
+                        help=f'How many entities to replay per request, at most {MAX_REPLAY_ENTITIES_BATCH}, or {AUTO} to tune it to the measured latency')
     parser.add_argument('--input', type=argparse.FileType('r'), required=True)
-    parser.add_argument('--sleep', type=int, help='How long to wait between requests in seconds', required=True)
-    parser.add_argument('--level', default='INFO', choices=('INFO', 'ERROR', 'WARNING', 'DEBUG', 'CRITICAL'))
+    add_throttle_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
     configure_logging(level=args.level)
 
-    env = create_environment(args.env)
+    reporter = start_reporting(args, args.input)
+    client = create_client(args)
     input_file = args.input
 
-    input_reader = csv.DictReader(input_file)
-
-    replayEntities = []
-    for row in input_reader:
-        failedEntity = FailedEntity.from_dict(row)
-        for identifier in failedEntity.identifiers:
-            replayEntities.append(ReplayEntity(failedEntity.gitHubInstallationId, failedEntity.hashedJiraHost, identifier.strip()))
-    
-
-    LOG.info("Total failed entities to process %s", len(replayEntities))
-    for i in range(0, len(replayEntities), args.batchsize):
-        replayEntitiesBatch = replayEntities[i:i+args.batchsize]
-        LOG.info("processing batch from %s to %s", i+1, i+len(replayEntitiesBatch));
-        process_replayEntities(env, replayEntitiesBatch)
-        time.sleep(args.sleep)
+    batchSize = create_batch_size(args, MAX_REPLAY_ENTITIES_BATCH)
+    tuner = batchSize if isinstance(batchSize, BatchSizeTuner) else None
+    send = lambda replayEntitiesBatch: process_replayEntities(client, replayEntitiesBatch)
+    if tuner:
+        send = tuner.measured(send)
+
+    deduplicator = Deduplicator()
+    replayEntities = deduplicator.filter(parse_replayEntities(csv.DictReader(input_file)))
+    batches = grouped_batches(replayEntities,
+                              key=lambda replayEntity: (replayEntity.gitHubInstallationId, replayEntity.hashedJiraHost),
+                              size=batchSize)
+
+    processedCount = 0
+    requestCount = 0
+    for replayEntitiesBatch in batches:
+        LOG.info("processing batch from %s to %s for installation %s", processedCount+1,
+                 processedCount+len(replayEntitiesBatch), replayEntitiesBatch[0].gitHubInstallationId)
+        response = send(replayEntitiesBatch)
+        METRICS.count_items(SUCCESS if response.ok else ERROR, len(replayEntitiesBatch))
+        processedCount += len(replayEntitiesBatch)
+        requestCount += 1
+        METRICS.sleep(args.sleep)
+
+    deduplicator.close()
+    if tuner:
+        tuner.log()
+    # Without dedupe every entity read would have been sent, at the size the run ended with
+    savedAtSize = tuner.size if tuner else batchSize
+    undedupedRequests = math.ceil(deduplicator.seen / savedAtSize)
+    LOG.info("Total failed entities processed %s in %s requests", processedCount, requestCount)
+    LOG.info("Dropped %s duplicate entities out of %s read, saving as many GitHub API calls and installation client "
+             "lookups on the server. Sending every entity read would have taken %s requests at --batchsize %s, %s were sent",
+             deduplicator.duplicates, deduplicator.seen, undedupedRequests, savedAtSize, requestCount)
+    client.close()
+    TOKEN_PROVIDER.log_stats()
+    reporter.finish(duplicates=deduplicator.duplicates)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
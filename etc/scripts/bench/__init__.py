@@ -0,0 +1,4 @@
+"""
+Offline benchmarks: the admin scripts against a mock admin API (bench/run.py), and
+synthetic webhook load against a local app (bench/replay_webhooks.py).
+"""
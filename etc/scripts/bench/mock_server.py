@@ -0,0 +1,299 @@
+"""
+Local stand-in for the github-for-jira admin API, for benchmarking the scripts offline.
+
+Serves `/api/resync`, `/api/resync-failed-tasks`, `/api/replay-rejected-entities-from-data-depot`,
+`/api/configuration` and the `/api` ping with configurable latency, error rate and rate
+limiting, and enforces the same batch limits and SLAuth header check as the real service.
+Installation ids in `--poison` have no subscription. Like the real `/api/resync`, a
+resync leaves them out of its response and only answers 400 when none of its ids has one.
+`GET /__stats` returns what it has seen so far. `--outage START:DURATION` answers everything,
+the ping included, with a 503 for DURATION seconds from START seconds after it started.
+
+With `--subscriptions N` it also holds N FAILED subscriptions, two Jira sites per
+installation and last updated an hour ago, for
+resyncs by filter (no `installationIds`). Those select a `limit`/`offset` page by
+`statusTypes` and `inactiveForSeconds`, most recently updated first, and move it to PENDING
+like the real endpoint does.
+
+    $ python3 -m bench.mock_server --port 8090 --latency 0.05 --error-rate 0.01 --rate-limit 60
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, NamedTuple, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+MAX_RESYNC_FAILED_TASKS_BATCH = 500
+MAX_REPLAY_ENTITIES_BATCH = 5000
+MAX_CONFIGURATION_BATCH = 50
+
+
+class MockConfig(NamedTuple):
+    latency: float = 0.0
+    latency_per_item: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: Optional[int] = None
+    rate_limit_window: float = 60.0
+    poison: frozenset = frozenset()
+    subscriptions: int = 0
+    # (start, duration) in seconds after the server started
+    outage: Optional[Tuple[float, float]] = None
+
+
+class MockStats:
+    def __init__(self):
+        self.started_at = time.time()
+        self.first_request_at: Optional[float] = None
+        self.requests = 0
+        self.items = 0
+        self.status_counts = {}
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, status: int, items: int, latency: float):
+        with self._lock:
+            if self.first_request_at is None:
+                self.first_request_at = time.time()
+            self.requests += 1
+            self.items += items
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            self.latencies.append(latency)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                'first_request_at': self.first_request_at,
+                'requests': self.requests,
+                'items': self.items,
+                'status_counts': {str(k): v for k, v in self.status_counts.items()},
+                'p50_latency': percentile(latencies, 50),
+                'p99_latency': percentile(latencies, 99),
+            }
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class _RateLimiter:
+    """Fixed window per client, like express-rate-limit in front of the real admin API."""
+
+    def __init__(self, limit: Optional[int], window: float):
+        self.limit = limit
+        self.window = window
+        self._hits = deque()
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> Optional[float]:
+        if not self.limit:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            while self._hits and self._hits[0] <= now - self.window:
+                self._hits.popleft()
+            if len(self._hits) >= self.limit:
+                return self._hits[0] + self.window - now
+            self._hits.append(now)
+            return None
+
+
+class MockAdminApi(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.stats = MockStats()
+        self.limiter = _RateLimiter(config.rate_limit, config.rate_limit_window)
+        # (gitHubInstallationId, jiraHost) -> [syncStatus, updatedAt], two Jira sites per installation
+        self.subscriptions = {(1_000_000 + i // 2, f'https://site-{i % 2}.atlassian.net'): ['FAILED', time.time() - 3600 - i]
+                              for i in range(config.subscriptions)}
+        self.subscriptions_lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def in_outage(self) -> bool:
+        if not self.config.outage:
+            return False
+        start, duration = self.config.outage
+        return start <= time.monotonic() - self.started < start + duration
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'MockAdminApi':
+        threading.Thread(target=self.serve_forever, name='mock-admin-api', daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: MockAdminApi
+
+    def log_message(self, format, *args):
+        LOG.debug(format, *args)
+
+    def do_GET(self):
+        if self.path == '/__stats':
+            return self._send(200, self.server.stats.snapshot(), record=False)
+        if self.path.rstrip('/') == '/api':
+            return self._handle(lambda body: (200, {}, 0))
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        routes = {
+            '/api/resync': self._resync,
+            '/api/resync-failed-tasks': self._resync_failed_tasks,
+            '/api/replay-rejected-entities-from-data-depot': self._replay,
+            '/api/configuration': self._configuration,
+        }
+        route = routes.get(self.path.rstrip('/'))
+        if not route:
+            return self._send(404, {'error': 'not found'})
+        self._handle(route)
+
+    def _handle(self, route):
+        started = time.monotonic()
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if not (self.headers.get('Authorization') or '').startswith('slauth '):
+            return self._send(401, {'error': 'Open access not allowed'}, started=started)
+
+        retry_after = self.server.limiter.retry_after()
+        if retry_after is not None:
+            return self._send(429, 'Too many requests, please try again later.', started=started,
+                              headers={'Retry-After': str(max(1, round(retry_after)))})
+
+        if self.server.in_outage():
+            return self._send(503, 'Service Unavailable', started=started)
+
+        config = self.server.config
+        status, payload, items = route(body)
+        time.sleep(max(0.0, config.latency + config.latency_per_item * items + random.uniform(-1, 1) * config.jitter))
+        if status == 200 and random.random() < config.error_rate:
+            status, payload = 503, 'Service Unavailable'
+        self._send(status, payload, items=items, started=started)
+
+    def _resync(self, body):
+        if 'installationIds' not in body:
+            return self._resync_filtered(body)
+        ids = body.get('installationIds') or []
+        if not ids:
+            return 400, 'GitHub installation IDs missing or invalid format', 0
+        # Like the real endpoint, ids without a subscription are left out, and only a batch of nothing else is rejected
+        existing = [i for i in ids if str(i) not in self.server.config.poison]
+        if not existing:
+            return 400, 'No subscriptions exist for provided gitHubInstallation IDs', len(ids)
+        return 200, [{'gitHubInstallationId': i, 'syncStatus': 'PENDING'} for i in existing], len(existing)
+
+    def _resync_filtered(self, body):
+        if not (body.get('statusTypes') or body.get('limit') or body.get('inactiveForSeconds')):
+            return 400, 'Please provide at least one of the filter parameters!', 0
+        status_types = body.get('statusTypes') or ['FAILED', 'PENDING', 'ACTIVE']
+        updated_before = time.time() - (body.get('inactiveForSeconds') or 0)
+        offset = body.get('offset') or 0
+        with self.server.subscriptions_lock:
+            matching = sorted((key for key, (status, updated_at) in self.server.subscriptions.items()
+                               if status in status_types and updated_at < updated_before),
+                              key=lambda key: self.server.subscriptions[key][1], reverse=True)
+            page = matching[offset:offset + body['limit']] if body.get('limit') else matching[offset:]
+            for key in page:
+                self.server.subscriptions[key] = ['PENDING', time.time()]
+        return 200, [{'gitHubInstallationId': i, 'jiraHost': jira_host, 'syncStatus': 'PENDING'} for i, jira_host in page], len(page)
+
+    def _resync_failed_tasks(self, body):
+        ids = body.get('subscriptionsIds') or []
+        if not ids:
+            return 200, 'Please provide at least one subscription id!\n', 0
+        if len(ids) > MAX_RESYNC_FAILED_TASKS_BATCH:
+            return 200, f"Subscriptions can't be more than {MAX_RESYNC_FAILED_TASKS_BATCH}\n", 0
+        return 200, f'Starting backfill for {len(ids)} for tasks {json.dumps(body.get("targetTasks"))}\n', len(ids)
+
+    def _replay(self, body):
+        entities = body.get('replayEntities') or []
+        if len(entities) > MAX_REPLAY_ENTITIES_BATCH:
+            return 200, f"Max replay entries can't more than {MAX_REPLAY_ENTITIES_BATCH}\n", 0
+        return 200, f'Starting replay for {len(entities)} size\n', len(entities)
+
+    def _configuration(self, body):
+        hosts = body.get('jiraHosts') or []
+        if len(hosts) > MAX_CONFIGURATION_BATCH:
+            return 400, f'Calm down Cowboy, keep it under {MAX_CONFIGURATION_BATCH} at a time!', 0
+        return 200, {'message': 'jiraHosts Updated', 'jiraHosts': hosts}, len(hosts)
+
+    def _send(self, status, payload, items=0, started=None, headers=None, record=True):
+        data = (payload if isinstance(payload, str) else json.dumps(payload)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain' if isinstance(payload, str) else 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if record:
+            self.server.stats.record(status, items, time.monotonic() - (started or time.monotonic()))
+
+
+def parse_outage(value: str) -> Tuple[float, float]:
+    try:
+        start, duration = (float(part) for part in value.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected START:DURATION in seconds, got {value!r}')
+    return start, duration
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=0.02, help='Base response time in seconds')
+    parser.add_argument('--latency-per-item', type=float, default=0.0, help='Extra response time per id in the batch')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +/- jitter on the response time')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+    parser.add_argument('--rate-limit', type=int, help='Requests allowed per --rate-limit-window before answering 429')
+    parser.add_argument('--rate-limit-window', type=float, default=60.0)
+    parser.add_argument('--poison', default='',
+                        help='Comma separated installation ids without a subscription, a resync of nothing else is answered with a 400')
+    parser.add_argument('--subscriptions', type=int, default=0, help='FAILED subscriptions to serve resyncs by filter from, two per installation')
+    parser.add_argument('--outage', type=parse_outage, metavar='START:DURATION',
+                        help='Answer every request with a 503 for DURATION seconds from START seconds after starting')
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(latency=args.latency,
+                      latency_per_item=args.latency_per_item,
+                      jitter=args.jitter,
+                      error_rate=args.error_rate,
+                      rate_limit=args.rate_limit,
+                      rate_limit_window=args.rate_limit_window,
+                      poison=frozenset(p for p in args.poison.split(',') if p),
+                      subscriptions=args.subscriptions,
+                      outage=args.outage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockAdminApi((args.host, args.port), config_from_args(args))
+    LOG.info('Mock admin API listening on %s', server.url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
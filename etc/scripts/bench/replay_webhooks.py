@@ -0,0 +1,119 @@
+"""
+Replays signed webhook events at a local app instance and reports how it kept up.
+
+Reads the events written by `generate-github-test-data.py --webhooks` and posts them to the
+app's `/github/webhooks` endpoint, either at a fixed `--rate` or as fast as `--concurrency`
+parallel senders allow, then reports accepted events per second, latency percentiles and
+the status code mix. Run it against the docker-compose stack (app on port 8080, SQS on
+localstack); no github.com access is needed to accept the webhooks and queue their work.
+
+    $ cd etc/scripts
+    $ python3 -m bench.replay_webhooks --input events.jsonl --rate 50 --report webhooks.json
+    $ python3 -m bench.replay_webhooks --input events.jsonl --concurrency 32 --secret secret
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+from bench.mock_server import percentile
+from g4j_ops import AdaptiveRateLimiter, BatchDispatcher, configure_logging, create_session
+from github_testdata.webhooks import WebhookEvent, read_events, sign
+from typing import List, Optional
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_URL = 'http://localhost:8080/github/webhooks'
+
+
+class ReplayStats:
+    def __init__(self):
+        self.status_counts = {}
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, status: Optional[int], latency: float):
+        with self._lock:
+            key = str(status) if status is not None else 'error'
+            self.status_counts[key] = self.status_counts.get(key, 0) + 1
+            self.latencies.append(latency)
+
+    def report(self, elapsed: float) -> dict:
+        sent = sum(self.status_counts.values())
+        accepted = sum(count for status, count in self.status_counts.items() if status.startswith('2'))
+        latencies = sorted(self.latencies)
+        return {
+            'sent': sent,
+            'accepted': accepted,
+            'seconds': round(elapsed, 3),
+            'accepted_per_second': round(accepted / elapsed, 1) if elapsed else None,
+            'error_rate': round(1 - accepted / sent, 4) if sent else None,
+            'p50_latency': _rounded(percentile(latencies, 50)),
+            'p90_latency': _rounded(percentile(latencies, 90)),
+            'p99_latency': _rounded(percentile(latencies, 99)),
+            'status_counts': self.status_counts,
+        }
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', type=argparse.FileType('r'), required=True, help='Events written by generate-github-test-data.py --webhooks')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Webhook endpoint of the app under test')
+    parser.add_argument('--rate', type=float, help='Events per second to send, as fast as --concurrency allows by default')
+    parser.add_argument('--concurrency', type=int, default=8, help='How many events to have in flight at once')
+    parser.add_argument('--secret', help='Re-sign the events with this secret instead of using the stored signatures')
+    parser.add_argument('--limit', type=int, help='Send at most this many events')
+    parser.add_argument('--report', help='Write the results as JSON to this file')
+    parser.add_argument('--level', default='INFO')
+    args = parser.parse_args()
+
+    configure_logging(level=args.level)
+
+    session = create_session(args.concurrency)
+    limiter = AdaptiveRateLimiter(target_rate=args.rate, initial_rate=args.rate) if args.rate else None
+    stats = ReplayStats()
+
+    def send(events: List[WebhookEvent]):
+        event = events[0]
+        if limiter:
+            limiter.acquire()
+        started = time.monotonic()
+        try:
+            response = session.post(args.url, data=event.body, timeout=30, headers={
+                'X-GitHub-Event': event.name,
+                'X-GitHub-Delivery': event.delivery,
+                'X-Hub-Signature-256': sign(event.body, args.secret) if args.secret else event.signature,
+            })
+        except Exception as e:
+            LOG.debug('Sending %s %s failed: %s', event.name, event.delivery, e)
+            stats.record(None, time.monotonic() - started)
+            return
+        stats.record(response.status_code, time.monotonic() - started)
+        if not response.ok:
+            LOG.debug('%s %s: %s %s', event.name, event.delivery, response.status_code, response.text)
+
+    events = itertools.islice(read_events(args.input), args.limit)
+    started = time.monotonic()
+    dispatcher = BatchDispatcher(send, concurrency=args.concurrency)
+    for count, _ in enumerate(dispatcher.run([event] for event in events)):
+        if count and count % 1000 == 0:
+            LOG.info('Sent %s events', count)
+    report = stats.report(time.monotonic() - started)
+    session.close()
+
+    LOG.info('Sent %(sent)s events in %(seconds)ss: %(accepted_per_second)s accepted/s, error rate %(error_rate)s, '
+             'latency p50 %(p50_latency)s p90 %(p90_latency)s p99 %(p99_latency)s', report)
+    LOG.info('Status codes: %s', report['status_counts'])
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
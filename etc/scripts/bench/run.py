@@ -0,0 +1,171 @@
+"""
+Offline benchmark of the admin scripts against the local mock admin API.
+
+Generates synthetic inputs of the requested sizes, runs each script against a fresh
+`bench.mock_server` with the `atlas` stub from bench/bin on the PATH, and reports
+throughput, p50/p99 request latency (as seen by the mock), peak RSS, time to first request
+and the number of SLAuth token fetches.
+
+    $ cd etc/scripts
+    $ python3 -m bench.run --sizes 1000,10000,100000 --latency 0.05 --error-rate 0.01
+    $ python3 -m bench.run --scripts resync --sizes 1000000 --script-args "--concurrency 8 --batchsize 100"
+"""
+
+import argparse
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from bench.mock_server import MockAdminApi, add_mock_arguments, config_from_args
+from typing import Callable, List, NamedTuple, TextIO
+
+LOG = logging.getLogger(__name__)
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_BIN_DIR = os.path.join(SCRIPTS_DIR, 'bench', 'bin')
+
+
+class Scenario(NamedTuple):
+    script: str
+    write_input: Callable[[TextIO, int], None]
+    args: List[str]
+
+
+def _write_column(header: str, value: Callable[[int], str]):
+    def write(f: TextIO, rows: int):
+        f.write(f'{header}\n')
+        for i in range(rows):
+            f.write(f'{value(i)}\n')
+    return write
+
+
+def _write_rejected_entities(f: TextIO, rows: int):
+    # Like a Splunk export: several vulnerability ids per row, and the same ids logged repeatedly.
+    # Every third row repeats the one before it, and each shares two ids with the last of its installation.
+    f.write('gitHubInstallationId,jiraHost,rejectedEntities{}.key.vulnerabilityId\n')
+    for i in range(rows):
+        source = i - 1 if i % 3 == 2 else i
+        installation = source % 97
+        ids = '\n'.join(f'd_{installation}_{(source + k) // 97}' for k in range(0, 3 * 97, 97))
+        f.write(f'{installation},hashed-host-{installation},"{ids}"\n')
+
+
+SCENARIOS = {
+    'resync': Scenario(
+        'resync-from-csv.py',
+        _write_column('installation_id', lambda i: str(1_000_000 + i)),
+        ['--output', '{workdir}/resync.db']),
+    'configuration': Scenario(
+        'sync-configured-state-from-csv.py',
+        _write_column('jiraHost', lambda i: f'https://site-{i}.atlassian.net'),
+        ['--output', '{workdir}/configuration.db']),
+    'resync-failed-tasks': Scenario(
+        'api-resync-failed-tasks.py',
+        _write_column('subscriptionId', lambda i: str(i + 1)),
+        ['--task', 'dependabotAlert']),
+    'replay': Scenario(
+        'api-replay-failed-entities-from-csv.py',
+        _write_rejected_entities,
+        []),
+}
+
+
+def generate_input(workdir: str, name: str, scenario: Scenario, rows: int) -> str:
+    path = os.path.join(workdir, f'{name}-{rows}.csv')
+    if not os.path.exists(path):
+        with open(path, 'w') as f:
+            scenario.write_input(f, rows)
+    return path
+
+
+def run_one(name: str, scenario: Scenario, rows: int, mock_args: argparse.Namespace, workdir: str, extra_args: List[str]) -> dict:
+    input_path = generate_input(workdir, name, scenario, rows)
+    run_dir = tempfile.mkdtemp(prefix=f'{name}-{rows}-', dir=workdir)
+    atlas_log = os.path.join(run_dir, 'atlas.log')
+    open(atlas_log, 'w').close()
+
+    server = MockAdminApi(('127.0.0.1', 0), config_from_args(mock_args)).start()
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, scenario.script),
+           '--env', 'dev', '--url', server.url, '--input', input_path, '--level', 'WARNING',
+           *(arg.format(workdir=run_dir) for arg in scenario.args), *extra_args]
+    env = dict(os.environ, PATH=f'{STUB_BIN_DIR}{os.pathsep}{os.environ.get("PATH", "")}', ATLAS_STUB_LOG=atlas_log)
+
+    LOG.info('Running %s with %s rows', name, rows)
+    started = time.time()
+    with open(os.path.join(run_dir, 'output.log'), 'w') as output:
+        process = subprocess.Popen(cmd, cwd=SCRIPTS_DIR, env=env, stdout=output, stderr=subprocess.STDOUT)
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.time() - started
+
+    stats = server.stats.snapshot()
+    server.shutdown()
+    server.server_close()
+    with open(atlas_log) as f:
+        token_fetches = sum(1 for _ in f)
+
+    return {
+        'script': name,
+        'rows': rows,
+        'exit_code': process.returncode,
+        'seconds': round(elapsed, 3),
+        'requests': stats['requests'],
+        'items': stats['items'],
+        'items_per_second': round(stats['items'] / elapsed, 1) if elapsed else None,
+        'p50_latency': stats['p50_latency'],
+        'p99_latency': stats['p99_latency'],
+        'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+        'time_to_first_request': round(stats['first_request_at'] - started, 3) if stats['first_request_at'] else None,
+        'token_fetches': token_fetches,
+        'status_counts': stats['status_counts'],
+        'log': os.path.join(run_dir, 'output.log'),
+    }
+
+
+def print_table(results: List[dict]):
+    columns = ('script', 'rows', 'exit_code', 'seconds', 'requests', 'items_per_second', 'p50_latency',
+               'p99_latency', 'peak_rss_mb', 'time_to_first_request', 'token_fetches')
+
+    def cell(value):
+        return f'{value:.4f}' if isinstance(value, float) and value < 1 else str(value)
+
+    rows = [[cell(result[column]) for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scripts', default=','.join(SCENARIOS), help=f'Comma separated, any of {", ".join(SCENARIOS)}')
+    parser.add_argument('--sizes', default='1000,10000', help='Comma separated input sizes in rows')
+    parser.add_argument('--script-args', default='', help='Extra arguments passed to every script')
+    parser.add_argument('--workdir', help='Where to keep generated inputs and run logs, a temporary directory by default')
+    parser.add_argument('--report', help='Write the results as JSON to this file')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    workdir = args.workdir or tempfile.mkdtemp(prefix='g4j-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    extra_args = shlex.split(args.script_args)
+
+    results = []
+    for name in args.scripts.split(','):
+        for rows in (int(size) for size in args.sizes.split(',')):
+            results.append(run_one(name, SCENARIOS[name], rows, args, workdir, extra_args))
+
+    print_table(results)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+        LOG.info('Report written to %s', args.report)
+
+
+if __name__ == '__main__':
+    main()
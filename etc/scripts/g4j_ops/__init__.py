@@ -0,0 +1,17 @@
+"""
+Shared helpers for the github-for-jira admin scripts in etc/scripts.
+"""
+
+from g4j_ops.auth import SLAuth, SLAuthTokenProvider, TOKEN_PROVIDER
+from g4j_ops.cli import (
+    add_common_arguments,
+    add_resync_arguments,
+    add_throttle_arguments,
+    configure_logging,
+    create_client,
+    create_rate_limiter,
+)
+from g4j_ops.client import AdminClient
+from g4j_ops.environment import ENVIRONMENTS, Environment, create_environment
+from g4j_ops.dispatch import BatchDispatcher, batched, batched_by
+from script_common import AdaptiveRateLimiter, RetryPolicy, create_session
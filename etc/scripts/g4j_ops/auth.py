@@ -0,0 +1,183 @@
+"""
+SLAuth token issuance for the admin scripts.
+
+Tokens are fetched with `atlas slauth token` and cached per (group, environment, audience)
+until shortly before the JWT `exp`, so a run of thousands of requests only forks the CLI
+a handful of times.
+"""
+
+import base64
+import json
+import logging
+import subprocess
+import threading
+import time
+from g4j_ops.metrics import METRICS
+from requests import Request
+from requests.auth import AuthBase
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+# Used when the token is not a JWT we can read `exp` from
+DEFAULT_TOKEN_TTL_SECONDS = 5 * 60
+
+# Start refreshing in the background once this much of the token lifetime is left
+DEFAULT_REFRESH_MARGIN_SECONDS = 60
+
+TokenKey = Tuple[str, str, str]
+
+
+def fetch_slauth_token(group: str, environment: str, audience: str) -> str:
+    cmd = ['atlas',
+           'slauth', 'token',
+           '-m',
+           '-g', group,
+           '-e', environment,
+           '-a', audience]
+    data = subprocess.check_output(cmd)
+    return data.decode('utf-8').strip()
+
+
+def jwt_expiry(jwt: str) -> Optional[float]:
+    """Returns the `exp` claim of the JWT as epoch seconds, or None if it can't be read."""
+    try:
+        payload = jwt.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class _CachedToken(NamedTuple):
+    jwt: str
+    expires_at: float
+    refresh_at: float
+
+
+class SLAuthTokenProvider:
+    def __init__(self,
+                 fetch: Callable[[str, str, str], str] = fetch_slauth_token,
+                 refresh_margin: float = DEFAULT_REFRESH_MARGIN_SECONDS,
+                 default_ttl: float = DEFAULT_TOKEN_TTL_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self._fetch = fetch
+        self._refresh_margin = refresh_margin
+        self._default_ttl = default_ttl
+        self._clock = clock
+        self._tokens: Dict[TokenKey, _CachedToken] = {}
+        self._key_locks: Dict[TokenKey, threading.Lock] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.hits = 0
+
+    def get_token(self, group: str, environment: str, audience: str) -> str:
+        key = (group, environment, audience)
+        now = self._clock()
+        cached = self._tokens.get(key)
+
+        if cached and now < cached.expires_at:
+            with self._lock:
+                self.hits += 1
+            if now >= cached.refresh_at:
+                self._refresh_in_background(key)
+            return cached.jwt
+
+        with self._lock_for(key):
+            # Another thread may have fetched it while we were waiting for the lock
+            cached = self._tokens.get(key)
+            if cached and self._clock() < cached.expires_at:
+                with self._lock:
+                    self.hits += 1
+                return cached.jwt
+            return self._fetch_and_store(key).jwt
+
+    def invalidate(self, group: str, environment: str, audience: str):
+        with self._lock:
+            self._tokens.pop((group, environment, audience), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'fetches': self.fetches, 'hits': self.hits, 'saved': self.hits}
+
+    def log_stats(self):
+        stats = self.stats()
+        LOG.info('SLAuth tokens fetched %s times, %s fetches saved by the cache',
+                 stats['fetches'], stats['saved'])
+
+    def _lock_for(self, key: TokenKey) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fetch_and_store(self, key: TokenKey) -> _CachedToken:
+        with METRICS.time('auth'):
+            jwt = self._fetch(*key)
+        now = self._clock()
+        expires_at = jwt_expiry(jwt) or now + self._default_ttl
+        # Short-lived tokens would otherwise be refreshed on every call
+        margin = min(self._refresh_margin, (expires_at - now) / 2)
+        token = _CachedToken(jwt, expires_at, expires_at - margin)
+        with self._lock:
+            self._tokens[key] = token
+            self.fetches += 1
+        LOG.debug('Fetched SLAuth token for %s, expires in %.0fs', key, expires_at - now)
+        return token
+
+    def _refresh_in_background(self, key: TokenKey):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._lock_for(key):
+                    cached = self._tokens.get(key)
+                    if cached and self._clock() < cached.refresh_at:
+                        return
+                    self._fetch_and_store(key)
+            except (OSError, subprocess.CalledProcessError):
+                # The cached token is still valid, the next call will try again
+                LOG.warning('Background refresh of SLAuth token for %s failed', key, exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='slauth-refresh', daemon=True).start()
+
+
+TOKEN_PROVIDER = SLAuthTokenProvider()
+
+
+class SLAuth(AuthBase):
+    def __init__(self, audience, group, environment, provider: SLAuthTokenProvider = TOKEN_PROVIDER):
+        self.audience = audience
+        self.group = group
+        self.environment = environment
+        self.provider = provider
+
+    def __call__(self, req: Request) -> Request:
+        jwt = self.provider.get_token(self.group, self.environment, self.audience)
+        req.headers['Authorization'] = f'slauth {jwt}'
+        req.register_hook('response', self._retry_on_401)
+        return req
+
+    def _retry_on_401(self, response, **kwargs):
+        # A revoked or clock-skewed token: drop it and resend once with a fresh one
+        if response.status_code != 401 or getattr(response.request, '_slauth_retried', False):
+            return response
+
+        self.provider.invalidate(self.group, self.environment, self.audience)
+        jwt = self.provider.get_token(self.group, self.environment, self.audience)
+
+        response.content
+        response.close()
+        retry = response.request.copy()
+        retry.headers['Authorization'] = f'slauth {jwt}'
+        retry._slauth_retried = True
+        new_response = response.connection.send(retry, **kwargs)
+        new_response.history.append(response)
+        new_response.request = retry
+        return new_response
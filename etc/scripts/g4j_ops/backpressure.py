@@ -0,0 +1,149 @@
+"""
+Closed-loop backpressure on the backfill backlog.
+
+Before every batch is sent, `Backpressure.wait` reads how much backfill work is already
+waiting, either as the depth of the backfill SQS queue (localstack locally) or as the
+number of ACTIVE/PENDING subscriptions in the app's database, at most once per
+`poll_interval`. Once the backlog reaches the high watermark, dispatch holds until it has
+drained to the low watermark, so a mass resync keeps the backfill workers busy without
+burying webhook processing under its own queue.
+
+The queue depth needs boto3 and the subscription count psycopg2; both are only imported
+when asked for.
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from g4j_ops.metrics import METRICS
+from typing import Callable, Optional, Sequence
+from urllib.parse import urlparse
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 15.0
+DEFAULT_REGION = 'us-west-1'
+BACKLOG_STATUSES = ('ACTIVE', 'PENDING')
+
+
+def sqs_queue_depth(queue_url: str, region: str = DEFAULT_REGION) -> Callable[[], int]:
+    """Messages in the queue, visible or being worked on."""
+    try:
+        import boto3
+    except ImportError:
+        raise SystemExit('--backlog-queue-url needs boto3: pip install boto3')
+    parsed = urlparse(queue_url)
+    # Anything but AWS itself, like localstack, is talked to at the queue's own host
+    endpoint_url = None if parsed.hostname.endswith('amazonaws.com') else f'{parsed.scheme}://{parsed.netloc}'
+    sqs = boto3.client('sqs', region_name=region, endpoint_url=endpoint_url)
+
+    def depth() -> int:
+        attributes = sqs.get_queue_attributes(
+            QueueUrl=queue_url,
+            AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible'])['Attributes']
+        return int(attributes['ApproximateNumberOfMessages']) + int(attributes['ApproximateNumberOfMessagesNotVisible'])
+    return depth
+
+
+def subscription_backlog(database_url: str, statuses: Sequence[str] = BACKLOG_STATUSES) -> Callable[[], int]:
+    """Subscriptions with a sync queued or running."""
+    from g4j_ops.postgres import connect
+    conn = connect(database_url)
+
+    def count() -> int:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute('select count(*) from "Subscriptions" where "syncStatus"::text = any(%s)', (list(statuses),))
+                return cursor.fetchone()[0]
+    return count
+
+
+class Backpressure:
+    def __init__(self,
+                 backlog: Callable[[], int],
+                 high: int,
+                 low: Optional[int] = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.backlog = backlog
+        self.high = high
+        self.low = high // 2 if low is None else low
+        if self.low > self.high:
+            raise ValueError(f'The low watermark {self.low} is above the high watermark {self.high}')
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.holding = False
+        self.held_seconds = 0.0
+        self.last_depth: Optional[int] = None
+        self._read_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # Fails fast on a wrong queue or database, later read errors only hold dispatch
+        self._read()
+
+    def _read(self) -> Optional[int]:
+        self._read_at = self.clock()
+        try:
+            self.last_depth = self.backlog()
+        except Exception as e:
+            if self.last_depth is None:
+                raise
+            LOG.warning('Reading the backlog failed, holding dispatch: %s', e)
+            return None
+        return self.last_depth
+
+    def _blocked(self) -> bool:
+        if self._read_at is not None and self.clock() - self._read_at < self.poll_interval:
+            return self.holding
+        depth = self._read()
+        if depth is None:
+            return True
+        if not self.holding and depth >= self.high:
+            self.holding = True
+            LOG.info('Backlog of %s reached the high watermark %s, holding dispatch until it is down to %s', depth, self.high, self.low)
+        elif self.holding and depth <= self.low:
+            self.holding = False
+            LOG.info('Backlog down to %s, resuming dispatch', depth)
+        return self.holding
+
+    def wait(self):
+        """Returns once the backlog allows another batch to be sent."""
+        # One caller polls while the others queue up behind it
+        with self._lock, METRICS.time('throttle'):
+            started = self.clock()
+            while self._blocked():
+                LOG.debug('Backlog at %s, waiting %.0fs', self.last_depth, self.poll_interval)
+                self.sleep(self.poll_interval)
+            self.held_seconds += self.clock() - started
+
+    def log(self):
+        if self.held_seconds:
+            LOG.info('Dispatch held for %.0fs in total waiting for the backlog to drain', self.held_seconds)
+
+
+def add_backpressure_arguments(parser: argparse.ArgumentParser):
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--backlog-queue-url',
+                        help='Hold dispatch while this SQS queue is too deep, e.g. the backfill queue on localstack '
+                             'http://127.0.0.1:4566/000000000000/backfill')
+    parser.add_argument('--backlog-region', default=os.environ.get('SQS_BACKFILL_QUEUE_REGION', DEFAULT_REGION))
+    source.add_argument('--backlog-database-url',
+                        help='Hold dispatch while too many subscriptions are ACTIVE or PENDING in this Postgres')
+    parser.add_argument('--backlog-high', type=int, help='Backlog at which dispatch holds')
+    parser.add_argument('--backlog-low', type=int, help='Backlog at which held dispatch resumes, half of --backlog-high by default')
+    parser.add_argument('--backlog-poll', type=float, default=DEFAULT_POLL_INTERVAL, help='Seconds between backlog readings')
+
+
+def create_backpressure(args: argparse.Namespace) -> Optional[Backpressure]:
+    if not args.backlog_queue_url and not args.backlog_database_url:
+        return None
+    if not args.backlog_high:
+        raise SystemExit('--backlog-high is required with --backlog-queue-url or --backlog-database-url')
+    if args.backlog_queue_url:
+        backlog = sqs_queue_depth(args.backlog_queue_url, args.backlog_region)
+    else:
+        backlog = subscription_backlog(args.backlog_database_url)
+    return Backpressure(backlog, args.backlog_high, args.backlog_low, args.backlog_poll)
@@ -0,0 +1,240 @@
+"""
+Batch sizes tuned to the latency the admin API is measured to have.
+
+Every endpoint takes a whole batch per request but does a different amount of work per item:
+/api/resync looks up the subscription of every installation id, the replay endpoint builds a
+GitHub client per entity. With `--batchsize auto` the latency of every successful request is
+recorded against its size, and the most recent ones are fitted by least squares to
+
+    latency = a + b·n + c·n²
+
+The quadratic term is only kept once three sizes have been seen and it comes out positive,
+that is when the server slows down more than linearly with bigger batches. Throughput
+n / latency then peaks at n = √(a/c); without it, it only grows with n, up to the largest
+batch predicted to answer within the latency ceiling. That ceiling is --max-latency, or
+DEFAULT_MAX_LATENCY, and never more than half the client's read timeout, so a batch doesn't
+time out on a slow response.
+
+Until there is a fit the size doubles, starting from DEFAULT_INITIAL_SIZE, while responses
+come back well within the ceiling, and the fit is never followed past twice the biggest size
+measured, so one noisy sample can't send batches far beyond what was seen. After that every
+PROBE_EVERY'th batch is a quarter bigger or smaller than the chosen size, so the fit keeps
+following the server. Requests that still fail after retries with a 5xx, a timeout or a
+connection error cap the size below theirs for the next DEFAULT_WINDOW requests, as they may
+have been too big to answer. A 4xx rejection says nothing about the size and is ignored.
+"""
+
+import argparse
+import logging
+import requests
+import threading
+from collections import deque
+from g4j_ops.dispatch import BatchSize
+from script_common.retry import is_retryable_status
+from script_common.session import DEFAULT_TIMEOUT_SECONDS
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+LOG = logging.getLogger(__name__)
+
+AUTO = 'auto'
+DEFAULT_INITIAL_SIZE = 10
+# The resync endpoint has no limit of its own
+DEFAULT_MAX_SIZE = 1000
+DEFAULT_MAX_LATENCY = 10.0
+DEFAULT_WINDOW = 50
+PROBE_EVERY = 8
+# Distinct sizes needed to fit the quadratic term
+QUADRATIC_SIZES = 3
+
+
+def parse_batch_size(value: str) -> Union[int, str]:
+    """argparse type of --batchsize: a positive number of items, or `auto`."""
+    if value == AUTO:
+        return AUTO
+    try:
+        size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected a whole number of items or {AUTO}, got {value!r}')
+    if size < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, got {size}')
+    return size
+
+
+class LatencyModel(NamedTuple):
+    a: float
+    b: float
+    c: float = 0.0
+
+    def predict(self, size: float) -> float:
+        return self.a + self.b * size + self.c * size * size
+
+    def best_size(self, ceiling: float, min_size: int, max_size: int) -> int:
+        """The size with the most items per second predicted to answer within `ceiling`."""
+        best = float(max_size)
+        if self.c > 0:
+            best = min(best, (self.a / self.c) ** 0.5)
+            # The positive root of predict(n) = ceiling
+            discriminant = self.b * self.b - 4 * self.c * (self.a - ceiling)
+            if discriminant >= 0:
+                best = min(best, (-self.b + discriminant ** 0.5) / (2 * self.c))
+        elif self.b > 0:
+            best = min(best, (ceiling - self.a) / self.b)
+        return max(min_size, min(max_size, int(best)))
+
+    def __str__(self):
+        terms = f'{self.a:.3f}s + {self.b * 1000:.3f}ms·n'
+        if self.c:
+            terms += f' + {self.c * 1e6:.3f}µs·n²'
+        return f'latency = {terms}'
+
+
+def _solve(matrix: List[List[float]], vector: List[float]) -> Optional[List[float]]:
+    """Gaussian elimination with partial pivoting, None if the system is singular."""
+    n = len(vector)
+    rows = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, n):
+            factor = rows[row][column] / rows[column][column]
+            for k in range(column, n + 1):
+                rows[row][k] -= factor * rows[column][k]
+    solution = [0.0] * n
+    for row in reversed(range(n)):
+        solution[row] = (rows[row][n] - sum(rows[row][k] * solution[k] for k in range(row + 1, n))) / rows[row][row]
+    return solution
+
+
+def _least_squares(samples: Sequence[Tuple[int, float]], degree: int, scale: float) -> Optional[List[float]]:
+    # Sizes are scaled to about 1 so that the normal equations stay well conditioned
+    powers = [[(size / scale) ** k for k in range(degree + 1)] for size, _ in samples]
+    matrix = [[sum(p[i] * p[j] for p in powers) for j in range(degree + 1)] for i in range(degree + 1)]
+    vector = [sum(p[i] * latency for p, (_, latency) in zip(powers, samples)) for i in range(degree + 1)]
+    coefficients = _solve(matrix, vector)
+    if coefficients is None:
+        return None
+    return [coefficient / scale ** k for k, coefficient in enumerate(coefficients)]
+
+
+def fit(samples: Sequence[Tuple[int, float]]) -> Optional[LatencyModel]:
+    """Fits (size, latency) samples, None until they cover two different sizes."""
+    sizes = {size for size, _ in samples}
+    if len(sizes) < 2:
+        return None
+    scale = max(sizes)
+    if len(sizes) >= QUADRATIC_SIZES:
+        quadratic = _least_squares(samples, 2, scale)
+        if quadratic and quadratic[2] > 0 and quadratic[0] >= 0:
+            return LatencyModel(*quadratic)
+    linear = _least_squares(samples, 1, scale)
+    if linear is None:
+        return None
+    a, b = linear
+    if b <= 0:
+        # Latency doesn't grow with the batch
+        return LatencyModel(sum(latency for _, latency in samples) / len(samples), 0.0)
+    return LatencyModel(max(0.0, a), b)
+
+
+class BatchSizeTuner:
+    """
+    Call it for the size of the next batch, and wrap the function sending a batch with
+    `measured` to feed it. Safe to share between the threads dispatching batches.
+    """
+
+    def __init__(self,
+                 max_size: int = DEFAULT_MAX_SIZE,
+                 max_latency: float = DEFAULT_MAX_LATENCY,
+                 initial_size: int = DEFAULT_INITIAL_SIZE,
+                 min_size: int = 1,
+                 window: int = DEFAULT_WINDOW):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.max_latency = max_latency
+        self.size = max(min_size, min(initial_size, self.max_size))
+        self.model: Optional[LatencyModel] = None
+        self._cap = self.max_size
+        self._capped_for = 0
+        self._samples = deque(maxlen=window)
+        self._batches = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> int:
+        with self._lock:
+            self._batches += 1
+            if self.model is None or self._batches % PROBE_EVERY:
+                return self.size
+            # Alternately a bit above and below, to keep measuring around the chosen size
+            factor = 1.25 if self._batches // PROBE_EVERY % 2 else 0.8
+            return self._clamp(self.size * factor)
+
+    def _clamp(self, size: float) -> int:
+        return max(self.min_size, min(self._cap, int(round(size))))
+
+    def record(self, size: int, latency: float):
+        """Records a successful request for `size` items that took `latency` seconds."""
+        with self._lock:
+            self._samples.append((size, latency))
+            if self._capped_for:
+                self._capped_for -= 1
+                if not self._capped_for:
+                    LOG.info('No batch failed for a while, lifting the cap of %s', self._cap)
+                    self._cap = self.max_size
+            model = fit(self._samples)
+            if model is None:
+                # Too few sizes to fit yet, so keep doubling while there is plenty of room
+                self.size = self._clamp(size * 2 if latency * 2 <= self.max_latency / 2 else size / 2)
+                return
+            previous = self.size
+            self.model = model
+            # The fit is only trusted up to twice the biggest size it has seen
+            measured = max(size for size, _ in self._samples)
+            self.size = self._clamp(min(model.best_size(self.max_latency, self.min_size, self.max_size), 2 * measured))
+            if abs(self.size - previous) > previous / 10:
+                LOG.info('Batch size %s -> %s: fitted %s, predicting %.2fs per request and %.1f items/s',
+                         previous, self.size, model, model.predict(self.size), self.size / max(model.predict(self.size), 1e-6))
+
+    def record_failure(self, size: int):
+        """Records a request for `size` items that failed with a 5xx, timeout or connection error."""
+        with self._lock:
+            if size <= self.min_size or size > self._cap:
+                return
+            self._cap = max(self.min_size, size * 3 // 4)
+            self._capped_for = self._samples.maxlen
+            self.size = min(self.size, self._cap)
+            LOG.warning('A batch of %s failed, batches are now kept to %s', size, self._cap)
+
+    def measured(self, send: Callable[[List], requests.Response]) -> Callable[[List], requests.Response]:
+        """Wraps `send`, recording the latency of every request it makes."""
+        def send_measured(items: List) -> requests.Response:
+            try:
+                response = send(items)
+            except requests.RequestException:
+                self.record_failure(len(items))
+                raise
+            if response.ok:
+                # How long the last attempt took to answer, without retries or rate limiting
+                self.record(len(items), response.elapsed.total_seconds())
+            elif response.status_code != 429 and is_retryable_status(response.status_code):
+                self.record_failure(len(items))
+            return response
+        return send_measured
+
+    def log(self):
+        if self.model is None:
+            LOG.info('Batch size ended at %s, too few different sizes were measured to fit the latency', self.size)
+            return
+        LOG.info('Batch size settled at %s for %s: %.2fs per request and %.1f items/s, within %.1fs',
+                 self.size, self.model, self.model.predict(self.size),
+                 self.size / max(self.model.predict(self.size), 1e-6), self.max_latency)
+
+
+def create_batch_size(args: argparse.Namespace, max_size: int = DEFAULT_MAX_SIZE) -> BatchSize:
+    """The fixed --batchsize, capped at what the endpoint takes, or a tuner for `auto`."""
+    if args.batchsize != AUTO:
+        return min(args.batchsize, max_size)
+    ceiling = min(args.max_latency or DEFAULT_MAX_LATENCY, DEFAULT_TIMEOUT_SECONDS[1] / 2)
+    LOG.info('Tuning the batch size between 1 and %s for requests within %.1fs', max_size, ceiling)
+    return BatchSizeTuner(max_size=max_size, max_latency=ceiling)
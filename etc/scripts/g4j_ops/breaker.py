@@ -0,0 +1,197 @@
+"""
+A circuit breaker that pauses a run while the service is degraded.
+
+Every request through the client is counted in a rolling window of the last `window`
+requests. Once that window is full and at least `--breaker-error-rate` of it failed (a 5xx
+or a connection failure) or took longer than `--breaker-latency`, the circuit opens. No
+request is sent while it is open. Instead, every `--breaker-cooldown` seconds one caller
+probes `GET /api`, the admin API's own ping, and everyone else waits. 429s are not counted,
+since the rate limiter and `Retry-After` already deal with them.
+
+A probe that answers 2xx within `--breaker-latency` half-opens the circuit. Only a quarter
+of the run's concurrency (at least one request) may then be in flight. After `window / 4`
+healthy requests in a row the circuit closes again and the run goes back to full speed.
+A bad request while half-open opens the circuit again, and the cooldown doubles each time
+up to `MAX_COOLDOWN_SECONDS`, so a long incident is probed less and less often. Every
+change of state is logged, with the error rate and latency that caused it.
+
+Requests wait rather than fail while the circuit is open. A long resync or replay left
+running unattended stops during an incident and picks up again when it is over.
+"""
+
+import argparse
+import logging
+import threading
+import time
+from collections import deque
+from g4j_ops.metrics import METRICS
+from typing import Callable, Deque, NamedTuple, Optional
+
+LOG = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_LATENCY = 10.0
+DEFAULT_WINDOW = 20
+DEFAULT_COOLDOWN = 30.0
+MAX_COOLDOWN_SECONDS = 300.0
+
+
+class Outcome(NamedTuple):
+    failed: bool
+    slow: bool
+
+
+class CircuitBreaker:
+    def __init__(self,
+                 probe: Callable[[], Optional[int]],
+                 error_rate: float = DEFAULT_ERROR_RATE,
+                 max_latency: float = DEFAULT_LATENCY,
+                 window: int = DEFAULT_WINDOW,
+                 cooldown: float = DEFAULT_COOLDOWN,
+                 concurrency: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        """`probe` sends the health check and returns its status code, or None when it couldn't connect."""
+        self.probe = probe
+        self.error_rate = error_rate
+        self.max_latency = max_latency
+        self.window = max(1, window)
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.half_open_concurrency = max(1, concurrency // 4)
+        self.half_open_successes = max(1, self.window // 4)
+        self.clock = clock
+        self.state = CLOSED
+        self.opened = 0
+        self.open_seconds = 0.0
+        self._outcomes: Deque[Outcome] = deque(maxlen=self.window)
+        self._in_flight = 0
+        self._successes = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self._probing = False
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Blocks until the circuit lets another request through. Every call must be followed by `record`."""
+        with self._condition:
+            if self._admits():
+                self._in_flight += 1
+                return
+        with METRICS.time('throttle'):
+            with self._condition:
+                while not self._admits():
+                    if self.state == OPEN and not self._probing and self.clock() >= self._probe_at:
+                        self._run_probe()
+                        continue
+                    timeout = self._probe_at - self.clock() if self.state == OPEN and not self._probing else None
+                    self._condition.wait(timeout=max(0.0, timeout) if timeout is not None else None)
+                self._in_flight += 1
+
+    def record(self, status_code: Optional[int], latency: float):
+        """Feeds back the outcome of a request let through by `acquire`; `status_code` is None for connection failures."""
+        outcome = Outcome(failed=status_code is None or status_code >= 500, slow=latency > self.max_latency)
+        with self._condition:
+            self._in_flight -= 1
+            # Requests that were still in flight when the circuit opened are not held against the next probe
+            if self.state == CLOSED:
+                self._outcomes.append(outcome)
+                if len(self._outcomes) == self.window and self._bad_share() >= self.error_rate:
+                    self._open(f'{self._describe()} of the last {self.window} requests')
+            elif self.state == HALF_OPEN:
+                if outcome.failed or outcome.slow:
+                    self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN_SECONDS)
+                    self._open('a request ' + ('failed' if outcome.failed else f'took {latency:.1f}s') + ' while half-open')
+                else:
+                    self._successes += 1
+                    if self._successes >= self.half_open_successes:
+                        self._close()
+            self._condition.notify_all()
+
+    def _admits(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN:
+            return self._in_flight < self.half_open_concurrency
+        return False
+
+    def _bad_share(self) -> float:
+        return sum(1 for outcome in self._outcomes if outcome.failed or outcome.slow) / len(self._outcomes)
+
+    def _describe(self) -> str:
+        failed = sum(1 for outcome in self._outcomes if outcome.failed)
+        slow = sum(1 for outcome in self._outcomes if outcome.slow and not outcome.failed)
+        return f'{failed} failed and {slow} slower than {self.max_latency}s'
+
+    def _open(self, reason: str):
+        # Reopening from half-open is still the same incident
+        if self.state == CLOSED:
+            self.opened += 1
+            self._opened_at = self.clock()
+        self.state = OPEN
+        self._probe_at = self.clock() + self.cooldown
+        LOG.warning('Circuit open: %s. Pausing requests and probing GET /api every %.0fs', reason, self.cooldown)
+
+    def _close(self):
+        paused = self.clock() - self._opened_at
+        self.open_seconds += paused
+        self.state = CLOSED
+        self.cooldown = self.base_cooldown
+        self._outcomes.clear()
+        LOG.info('Circuit closed after %s healthy requests, resuming at full concurrency. Paused for %.0fs',
+                 self._successes, paused)
+
+    def _run_probe(self):
+        """Probes the service with the lock released, so the others keep waiting rather than probing too."""
+        self._probing = True
+        self._condition.release()
+        started = self.clock()
+        try:
+            status_code = self.probe()
+        except Exception as e:
+            LOG.debug('Probe failed: %s', e)
+            status_code = None
+        latency = self.clock() - started
+        self._condition.acquire()
+        self._probing = False
+        if status_code is not None and 200 <= status_code < 300 and latency <= self.max_latency:
+            self.state = HALF_OPEN
+            self._successes = 0
+            LOG.info('Probe answered %s in %.2fs, circuit half-open: %s request(s) at a time until %s succeed',
+                     status_code, latency, self.half_open_concurrency, self.half_open_successes)
+        else:
+            self._probe_at = self.clock() + self.cooldown
+            LOG.warning('Probe %s, circuit open for %.0fs so far, next probe in %.0fs',
+                        f'answered {status_code} in {latency:.2f}s' if status_code is not None else 'could not connect',
+                        self.clock() - self._opened_at, self.cooldown)
+        self._condition.notify_all()
+
+    def log(self):
+        if self.opened:
+            LOG.info('The circuit opened %s time(s), requests were paused for %.0fs in total', self.opened, self.open_seconds)
+
+
+def add_breaker_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--circuit-breaker', action='store_true',
+                        help='Pause requests while too many fail or are slow, probing GET /api until the service recovers')
+    parser.add_argument('--breaker-error-rate', type=float, default=DEFAULT_ERROR_RATE,
+                        help='Share of failed or slow requests in the window that opens the circuit')
+    parser.add_argument('--breaker-latency', type=float,
+                        help=f'Responses slower than this many seconds count against the circuit, --max-latency or {DEFAULT_LATENCY:.0f} by default')
+    parser.add_argument('--breaker-window', type=int, default=DEFAULT_WINDOW, help='How many of the last requests the error rate is taken over')
+    parser.add_argument('--breaker-cooldown', type=float, default=DEFAULT_COOLDOWN,
+                        help='Seconds between probes while the circuit is open, doubling each time it opens again while half-open')
+
+
+def create_breaker(args: argparse.Namespace, probe: Callable[[], Optional[int]], concurrency: int = 1) -> Optional[CircuitBreaker]:
+    if not args.circuit_breaker:
+        return None
+    return CircuitBreaker(probe,
+                          error_rate=args.breaker_error_rate,
+                          max_latency=args.breaker_latency or args.max_latency or DEFAULT_LATENCY,
+                          window=args.breaker_window,
+                          cooldown=args.breaker_cooldown,
+                          concurrency=concurrency)
@@ -0,0 +1,133 @@
+"""
+A request rate budget shared by every process running against the same environment.
+
+When a job is split with --shard across several processes, each has its own rate limiter,
+but the admin API counts requests from all of them. With --rate-budget RPS they also
+reserve every request from one shared schedule, so all of them together stay within RPS,
+however many are running and whatever their own --rate. Give all of them the same RPS.
+
+Each request reserves the next free slot and waits for it. The slots are 1/RPS apart, so
+a process that joins or leaves changes nothing for the others. The schedule is a small file
+under an exclusive `flock` (--rate-budget-file). By default that is one file per environment
+in the temp directory, which covers every process on one host. For several hosts, point
+--rate-budget-redis at a Redis they all reach, e.g. the docker-compose one at
+redis://127.0.0.1:6379. There the slots are reserved by a Lua script against the Redis
+server's clock, so host clocks don't need to agree. Redis needs `pip install redis`.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+LOG = logging.getLogger(__name__)
+
+# Slots are only reserved this far ahead, so a crashed process can't hold the budget for long
+MAX_RESERVATION_SECONDS = 300
+
+_RESERVE_SCRIPT = '''
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local slot = math.max(now, tonumber(redis.call('GET', KEYS[1]) or '0'))
+local interval = tonumber(ARGV[1])
+redis.call('SET', KEYS[1], string.format('%.6f', slot + interval), 'PX', math.ceil((slot + interval - now) * 1000) + 60000)
+return string.format('%.6f', slot - now)
+'''
+
+
+class RateBudget(ABC):
+    """Reserves request slots `1 / rate` seconds apart from a schedule shared with other processes."""
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError(f'The rate budget must be positive, got {rate}')
+        self.rate = rate
+        self.interval = 1 / rate
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _reserve(self) -> float:
+        """Reserves the next free slot and returns how long until it comes."""
+
+    def acquire(self):
+        delay = min(self._reserve(), MAX_RESERVATION_SECONDS)
+        if delay > 0:
+            with self._lock:
+                self.waited += delay
+            time.sleep(delay)
+
+    def log(self):
+        if self.waited:
+            LOG.info('Waited %.0fs in total for the shared rate budget of %s requests/s', self.waited, self.rate)
+
+
+class FileRateBudget(RateBudget):
+    def __init__(self, path: str, rate: float):
+        super().__init__(rate)
+        # POSIX only, and only needed when the budget is asked for
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+
+    def _reserve(self) -> float:
+        # flock only excludes other processes, the threads of this one share the file description
+        with self._lock:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                try:
+                    next_free = float(os.pread(self._fd, 64, 0) or 0)
+                except ValueError:
+                    next_free = 0.0
+                slot = max(now, min(next_free, now + MAX_RESERVATION_SECONDS))
+                os.pwrite(self._fd, f'{slot + self.interval:.6f}'.encode('ascii').ljust(32), 0)
+                return slot - now
+            finally:
+                self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+
+class RedisRateBudget(RateBudget):
+    def __init__(self, url: str, key: str, rate: float):
+        super().__init__(rate)
+        try:
+            import redis
+        except ImportError:
+            raise SystemExit('--rate-budget-redis needs redis: pip install redis')
+        self.key = key
+        self._redis = redis.Redis.from_url(url)
+        self._script = self._redis.register_script(_RESERVE_SCRIPT)
+        # Fails fast on a wrong URL rather than on the first request
+        self._redis.ping()
+
+    def _reserve(self) -> float:
+        return float(self._script(keys=[self.key], args=[f'{self.interval:.6f}']))
+
+
+def add_budget_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--rate-budget', type=float,
+                        help='Requests per second for all processes sharing the budget together, e.g. every --shard of a job')
+    location = parser.add_mutually_exclusive_group()
+    location.add_argument('--rate-budget-file',
+                          help='File the shared budget is kept in, one per environment in the temp directory by default')
+    location.add_argument('--rate-budget-redis', metavar='URL',
+                          help='Redis to keep the shared budget in, for processes on several hosts, e.g. redis://127.0.0.1:6379')
+
+
+def create_budget(args: argparse.Namespace) -> Optional[RateBudget]:
+    if not args.rate_budget:
+        if args.rate_budget_file or args.rate_budget_redis:
+            raise SystemExit('--rate-budget is required with --rate-budget-file or --rate-budget-redis')
+        return None
+    if args.rate_budget_redis:
+        budget = RedisRateBudget(args.rate_budget_redis, f'g4j_ops:rate-budget:{args.env}', args.rate_budget)
+        LOG.info('Sharing a budget of %s requests/s through %s', args.rate_budget, args.rate_budget_redis)
+        return budget
+    path = args.rate_budget_file or os.path.join(tempfile.gettempdir(), f'g4j_ops-rate-budget-{args.env}')
+    LOG.info('Sharing a budget of %s requests/s through %s', args.rate_budget, path)
+    return FileRateBudget(path, args.rate_budget)
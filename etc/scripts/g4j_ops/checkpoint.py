@@ -0,0 +1,206 @@
+"""
+Durable progress journal for resumable script runs.
+
+The journal is a SQLite database in WAL mode with one row per entity (status, attempt
+count, last error) and the input offset below which every row is known to be finished.
+Resuming seeks straight to that offset instead of re-reading the whole journal, and each
+batch is committed (and fsync'd) before the next one is recorded, so a crash loses at most
+the batches that were in flight. Several processes can write to the same journal.
+
+Older runs wrote a CSV of `id,status` rows to --output; pointing the journal at such a file
+converts it in place and keeps the original next to it as `<name>.bak`.
+
+Inspect or edit a journal from the command line:
+
+    $ python3 -m g4j_ops.checkpoint output.db status
+    $ python3 -m g4j_ops.checkpoint output.db mark-done 12345 67890
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from g4j_ops.metrics import METRICS
+from typing import Dict, Iterable, List, Optional
+
+LOG = logging.getLogger(__name__)
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+SUCCESS = 'success'
+ERROR = 'error'
+SKIPPED = 'skipped'
+QUARANTINED = 'quarantined'
+DONE_STATUSES = (SUCCESS, SKIPPED, QUARANTINED)
+
+SCHEMA = '''
+create table if not exists entities (
+    key text primary key,
+    status text not null,
+    attempts integer not null default 0,
+    last_error text,
+    updated_at real not null
+);
+create table if not exists cursor (
+    name text primary key,
+    value integer not null
+);
+'''
+
+
+def _read_legacy_csv(path: str) -> Optional[List[List[str]]]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as f:
+        if f.read(len(SQLITE_HEADER)) == SQLITE_HEADER:
+            return None
+    with open(path, newline='') as f:
+        return [row for row in csv.reader(f) if row]
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+        legacy_rows = _read_legacy_csv(path)
+        if legacy_rows is not None:
+            os.replace(path, f'{path}.bak')
+            LOG.info('Converting legacy output file %s into a checkpoint journal, original kept as %s.bak', path, path)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('pragma journal_mode=wal')
+        self._conn.execute('pragma synchronous=full')
+        self._conn.executescript(SCHEMA)
+
+        if legacy_rows:
+            self.record((row[0] for row in legacy_rows), SUCCESS)
+
+    def is_done(self, key) -> bool:
+        with self._lock, METRICS.time('checkpoint'):
+            row = self._conn.execute('select status from entities where key = ?', (str(key),)).fetchone()
+        return row is not None and row[0] in DONE_STATUSES
+
+    def get(self, key) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'select status, attempts, last_error, updated_at from entities where key = ?', (str(key),)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('status', 'attempts', 'last_error', 'updated_at'), row))
+
+    def record(self, keys: Iterable, status: str, error: Optional[str] = None):
+        """Records the outcome of one attempt for `keys` in one transaction."""
+        now = time.time()
+        rows = [(str(key), status, error, now) for key in keys]
+        with self._lock, METRICS.time('checkpoint'):
+            with self._conn:
+                self._conn.execute('begin immediate')
+                self._conn.executemany('''
+                    insert into entities (key, status, attempts, last_error, updated_at) values (?, ?, 1, ?, ?)
+                    on conflict (key) do update set
+                        status = excluded.status,
+                        attempts = attempts + 1,
+                        last_error = excluded.last_error,
+                        updated_at = excluded.updated_at
+                ''', rows)
+
+    def set_input_offset(self, input_offset: int):
+        with self._lock, METRICS.time('checkpoint'):
+            self._conn.execute('''
+                insert into cursor (name, value) values ('input_offset', ?)
+                on conflict (name) do update set value = max(value, excluded.value)
+            ''', (input_offset,))
+
+    @property
+    def input_offset(self) -> int:
+        with self._lock:
+            row = self._conn.execute("select value from cursor where name = 'input_offset'").fetchone()
+        return row[0] if row else 0
+
+    def merge(self, path: str) -> int:
+        """
+        Merges the entities of the journal at `path` into this one, and returns how many of
+        them this one already had. Where both have an entity, the latest outcome is kept,
+        unless that would undo one that is done, and the higher attempt count, so merging the
+        same journal again changes nothing.
+        """
+        done = ', '.join(f"'{status}'" for status in DONE_STATUSES)
+        newer = f'''((excluded.status in ({done})) > (entities.status in ({done}))
+                    or ((excluded.status in ({done})) = (entities.status in ({done}))
+                        and excluded.updated_at >= entities.updated_at))'''
+        with self._lock, METRICS.time('checkpoint'):
+            self._conn.execute('attach database ? as other', (path,))
+            try:
+                with self._conn:
+                    self._conn.execute('begin immediate')
+                    overlap = self._conn.execute(
+                        'select count(*) from other.entities where key in (select key from main.entities)').fetchone()[0]
+                    self._conn.execute(f'''
+                        insert into entities (key, status, attempts, last_error, updated_at)
+                        select key, status, attempts, last_error, updated_at from other.entities where true
+                        on conflict (key) do update set
+                            status = case when {newer} then excluded.status else entities.status end,
+                            last_error = case when {newer} then excluded.last_error else entities.last_error end,
+                            updated_at = max(entities.updated_at, excluded.updated_at),
+                            attempts = max(entities.attempts, excluded.attempts)
+                    ''')
+            finally:
+                self._conn.execute('detach database other')
+        return overlap
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute('select status, count(*) from entities group by status').fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OffsetTracker:
+    """
+    Works out how far into the input a run can safely resume from when batches complete
+    out of order: the end offset of the longest prefix of batches that have all completed.
+    Batches must be added in input order.
+    """
+
+    def __init__(self, start: int = 0):
+        self.watermark = start
+        self._pending = deque()
+        self._completed = set()
+
+    def add(self, end_offset: int):
+        self._pending.append(end_offset)
+
+    def complete(self, end_offset: int) -> int:
+        self._completed.add(end_offset)
+        while self._pending and self._pending[0] in self._completed:
+            self.watermark = self._pending.popleft()
+            self._completed.discard(self.watermark)
+        return self.watermark
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or edit a checkpoint journal')
+    parser.add_argument('journal')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Count entities by status')
+    mark_done = subparsers.add_parser('mark-done', help='Skip entities on the next run')
+    mark_done.add_argument('keys', nargs='+')
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.journal)
+    if args.command == 'mark-done':
+        checkpoint.record(args.keys, SKIPPED)
+    for status, count in sorted(checkpoint.counts().items()):
+        print(f'{status}: {count}')
+    print(f'input offset: {checkpoint.input_offset}')
+    checkpoint.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Command line plumbing shared by the admin scripts.
+"""
+
+import argparse
+from g4j_ops.breaker import add_breaker_arguments, create_breaker
+from g4j_ops.budget import add_budget_arguments, create_budget
+from g4j_ops.client import ALL_STATUS_TYPES, SYNC_TYPES, TASK_TYPES, AdminClient
+from g4j_ops.environment import ENVIRONMENTS, create_environment
+from g4j_ops.metrics import METRICS
+from script_common.logs import LOG_LEVELS, configure_logging
+from script_common.ratelimit import AdaptiveRateLimiter
+from script_common.retry import RetryPolicy
+from script_common.session import DEFAULT_POOL_SIZE, create_session
+from typing import Optional
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--env', choices=tuple(ENVIRONMENTS), required=True)
+    parser.add_argument('--url', help='Override the github-for-jira base URL of the environment')
+    parser.add_argument('--level', default='INFO', choices=LOG_LEVELS)
+
+
+def add_throttle_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--sleep', type=float, default=0, help='How long to wait between requests in seconds')
+    parser.add_argument('--rate', type=float,
+                        help='Target requests per second. The run ramps up to it while the API is healthy and backs off on 429/5xx')
+    parser.add_argument('--max-latency', type=float,
+                        help='Latency SLO in seconds; slower responses are treated like throttling when --rate is set, '
+                             'and --batchsize auto keeps batches under it')
+    parser.add_argument('--max-attempts', type=int, default=5,
+                        help='How many times to try a request that fails with a connection error, 429 or 5xx')
+    add_budget_arguments(parser)
+    add_breaker_arguments(parser)
+
+
+def add_resync_arguments(parser: argparse.ArgumentParser):
+    """Options of the /api/resync endpoint, defaulting to the full resync of pull requests the scripts always started."""
+    parser.add_argument('--sync-type', choices=SYNC_TYPES, default='full')
+    parser.add_argument('--status', nargs='+', choices=ALL_STATUS_TYPES, default=list(ALL_STATUS_TYPES),
+                        help='Only resync subscriptions in these sync states')
+    parser.add_argument('--target-tasks', nargs='*', choices=TASK_TYPES, default=['pull'],
+                        help='Tasks to sync, all of them when given without any')
+    parser.add_argument('--commits-from-date', help='ISO date to backfill commits from, the subscription\'s own setting by default')
+
+
+def create_rate_limiter(args: argparse.Namespace) -> Optional[AdaptiveRateLimiter]:
+    if not args.rate:
+        return None
+    return AdaptiveRateLimiter(target_rate=args.rate, max_latency=args.max_latency)
+
+
+def create_client(args: argparse.Namespace, concurrency: int = 1) -> AdminClient:
+    """Builds the client for the environment and throttling options on the command line."""
+    client = AdminClient(create_environment(args.env, args.url),
+                         create_session(pool_size=max(DEFAULT_POOL_SIZE, concurrency)),
+                         limiter=create_rate_limiter(args),
+                         retry=RetryPolicy(max_attempts=args.max_attempts, sleep=METRICS.sleep),
+                         budget=create_budget(args))
+    # The breaker probes through the client it guards
+    client.breaker = create_breaker(args, client.ping, concurrency=concurrency)
+    return client
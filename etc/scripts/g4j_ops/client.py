@@ -0,0 +1,172 @@
+"""
+HTTP client for the github-for-jira admin API (`/api/*`).
+
+All scripts share one tuned `requests.Session` (see script_common/session.py), and
+transient failures of requests that did reach the server are retried by a `RetryPolicy`,
+with the time spent waiting between attempts counted as the `sleep` phase.
+"""
+
+import json
+import logging
+import requests
+import time
+from g4j_ops.breaker import CircuitBreaker
+from g4j_ops.budget import RateBudget
+from g4j_ops.environment import Environment
+from g4j_ops.metrics import METRICS
+from script_common.ratelimit import AdaptiveRateLimiter, parse_retry_after
+from script_common.retry import RetryPolicy
+from script_common.session import DEFAULT_TIMEOUT_SECONDS, create_session
+from typing import Iterable, Optional, Sequence
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds enforced by the endpoints themselves
+MAX_RESYNC_FAILED_TASKS_BATCH = 500
+MAX_REPLAY_ENTITIES_BATCH = 5000
+MAX_CONFIGURATION_BATCH = 50
+
+ALL_STATUS_TYPES = ('FAILED', 'PENDING', 'ACTIVE', 'COMPLETE')
+SYNC_TYPES = ('full', 'partial')
+# TaskType in src/sync/sync.types.ts
+TASK_TYPES = ('repository', 'pull', 'commit', 'branch', 'build', 'deployment',
+              'dependabotAlert', 'secretScanningAlert', 'codeScanningAlert')
+
+
+class AdminClient:
+    def __init__(self,
+                 env: Environment,
+                 session: requests.Session = None,
+                 timeout=DEFAULT_TIMEOUT_SECONDS,
+                 limiter: Optional[AdaptiveRateLimiter] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 budget: Optional[RateBudget] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.env = env
+        self.session = session or create_session()
+        self.timeout = timeout
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy(sleep=METRICS.sleep)
+        self.budget = budget
+        self.breaker = breaker
+
+    def post(self, path: str, body: dict) -> requests.Response:
+        # Encoded once here rather than by requests on every attempt, and timed on its own
+        with METRICS.time('serialize'):
+            data = json.dumps(body, allow_nan=False).encode('utf-8')
+        return self.request('POST', path, data=data)
+
+    def get(self, path: str) -> requests.Response:
+        return self.request('GET', path)
+
+    def ping(self) -> Optional[int]:
+        """Health check for the circuit breaker: one GET /api, without retries, throttling or the breaker itself."""
+        try:
+            return self.session.get(f'{self.env.github_for_jira_url}/api', auth=self.env.github_for_jira_auth,
+                                    timeout=self.timeout).status_code
+        except requests.RequestException as e:
+            LOG.debug('GET /api failed: %s', e)
+            return None
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        url = f'{self.env.github_for_jira_url}{path}'
+        return self.retry.call(lambda: self._send(method, url, **kwargs), f'{method} {path}')
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        LOG.debug('%s %s', method, url)
+
+        if self.breaker:
+            # Before the limiter and the budget, so nothing is reserved while the circuit is open
+            self.breaker.acquire()
+        status_code = None
+        started = None
+        try:
+            if self.limiter:
+                with METRICS.time('throttle'):
+                    self.limiter.acquire()
+            if self.budget:
+                # After the limiter, so a slot isn't reserved only to wait for the limiter
+                with METRICS.time('throttle'):
+                    self.budget.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, auth=self.env.github_for_jira_auth, timeout=self.timeout, **kwargs)
+            except requests.RequestException:
+                METRICS.observe('network', time.monotonic() - started)
+                METRICS.count_request(None)
+                if self.limiter:
+                    self.limiter.record(None, time.monotonic() - started)
+                raise
+
+            METRICS.observe('network', time.monotonic() - started)
+            METRICS.count_request(response.status_code)
+
+            if self.limiter:
+                self.limiter.record(response.status_code, time.monotonic() - started,
+                                    parse_retry_after(response.headers.get('Retry-After')))
+            status_code = response.status_code
+            return response
+        finally:
+            if self.breaker:
+                # Always gives the slot back; whatever kept the request from a response counts as a failure
+                self.breaker.record(status_code, time.monotonic() - started if started is not None else 0.0)
+
+    def resync(self,
+               installation_ids: Optional[Iterable[int]],
+               sync_type: str = 'full',
+               status_types: Optional[Sequence[str]] = ALL_STATUS_TYPES,
+               target_tasks: Optional[Sequence[str]] = ('pull',),
+               commits_from_date: Optional[str] = None,
+               limit: Optional[int] = None,
+               offset: int = 0,
+               inactive_for_seconds: Optional[int] = None) -> requests.Response:
+        """
+        Starts syncs of the given installations, or with `installation_ids` None, of a page
+        (`limit`, `offset`) of the subscriptions the other filters select, most recently
+        updated first. The response lists the subscriptions it started.
+        """
+        body = {'syncType': sync_type}
+        if installation_ids is not None:
+            body['installationIds'] = list(installation_ids)
+        if status_types:
+            body['statusTypes'] = list(status_types)
+        if target_tasks:
+            body['targetTasks'] = list(target_tasks)
+        if commits_from_date:
+            body['commitsFromDate'] = commits_from_date
+        if limit:
+            body['limit'] = limit
+        if offset:
+            body['offset'] = offset
+        if inactive_for_seconds:
+            body['inactiveForSeconds'] = inactive_for_seconds
+        return self.post('/api/resync', body)
+
+    def resync_failed_tasks(self, subscription_ids: Iterable[int], target_tasks: Sequence[str]) -> requests.Response:
+        return self.post('/api/resync-failed-tasks', {
+            'subscriptionsIds': list(subscription_ids),
+            'targetTasks': list(target_tasks)
+        })
+
+    def replay_rejected_entities(self, replay_entities: Iterable[dict]) -> requests.Response:
+        return self.post('/api/replay-rejected-entities-from-data-depot', {
+            'replayEntities': list(replay_entities)
+        })
+
+    def sync_configuration(self, jira_hosts: Iterable[str]) -> requests.Response:
+        return self.post('/api/configuration', {
+            'jiraHosts': list(jira_hosts)
+        })
+
+    def close(self):
+        if self.budget:
+            self.budget.log()
+        if self.breaker:
+            self.breaker.log()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,137 @@
+"""
+Bounded-memory deduplication and grouping for large streamed inputs.
+
+`Deduplicator` keeps a Bloom filter of every key it has seen. A key the filter has never
+seen is new for certain; only keys the filter might have seen are checked against an exact
+store of 16-byte digests, which lives in memory up to a limit and spills to a temporary
+SQLite database beyond it.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+from g4j_ops.dispatch import BatchSize, next_size
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, TypeVar
+
+LOG = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+DEFAULT_CAPACITY = 10_000_000
+DEFAULT_ERROR_RATE = 0.001
+DEFAULT_MAX_IN_MEMORY = 1_000_000
+
+
+def _digest(key) -> bytes:
+    return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).digest()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: bytes) -> Iterator[int]:
+        # Double hashing: k positions from two independent 64-bit halves of the digest
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, digest: bytes) -> bool:
+        """Adds the digest and returns whether it may have been added before."""
+        seen = True
+        for position in self._positions(digest):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                seen = False
+                self._bits[byte] |= 1 << bit
+        return seen
+
+
+class Deduplicator:
+    def __init__(self,
+                 capacity: int = DEFAULT_CAPACITY,
+                 error_rate: float = DEFAULT_ERROR_RATE,
+                 max_in_memory: int = DEFAULT_MAX_IN_MEMORY):
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._recent = set()
+        self._max_in_memory = max_in_memory
+        self._spill: Optional[sqlite3.Connection] = None
+        self._spill_path: Optional[str] = None
+        self.seen = 0
+        self.duplicates = 0
+
+    def is_new(self, key: Hashable) -> bool:
+        digest = _digest(key)
+        self.seen += 1
+        if self._bloom.add(digest) and self._contains(digest):
+            self.duplicates += 1
+            return False
+        self._store(digest)
+        return True
+
+    def filter(self, items: Iterable[T], key: Optional[Callable[[T], Hashable]] = None) -> Iterator[T]:
+        for item in items:
+            if self.is_new(key(item) if key else item):
+                yield item
+
+    def close(self):
+        if self._spill:
+            self._spill.close()
+            os.unlink(self._spill_path)
+            self._spill = None
+
+    def _contains(self, digest: bytes) -> bool:
+        if digest in self._recent:
+            return True
+        if self._spill:
+            return self._spill.execute('select 1 from seen where digest = ?', (digest,)).fetchone() is not None
+        return False
+
+    def _store(self, digest: bytes):
+        self._recent.add(digest)
+        if len(self._recent) >= self._max_in_memory:
+            if not self._spill:
+                fd, self._spill_path = tempfile.mkstemp(prefix='g4j-dedupe-', suffix='.db')
+                os.close(fd)
+                self._spill = sqlite3.connect(self._spill_path)
+                self._spill.execute('pragma journal_mode=off')
+                self._spill.execute('pragma synchronous=off')
+                self._spill.execute('create table seen (digest blob primary key) without rowid')
+                LOG.info('Spilling dedupe keys to %s', self._spill_path)
+            with self._spill:
+                self._spill.executemany('insert or ignore into seen values (?)', ((d,) for d in self._recent))
+            self._recent.clear()
+
+
+def grouped_batches(items: Iterable[T],
+                    key: Callable[[T], Hashable],
+                    size: BatchSize,
+                    max_open_groups: int = 1000) -> Iterator[List[T]]:
+    """
+    Batches items so that every batch only holds items of one group. Full batches are
+    yielded as soon as they fill up. At most `max_open_groups` partial batches are held at
+    once, and the oldest is flushed early when another group needs room.
+    """
+    open_groups: Dict[Hashable, List[T]] = {}
+    sizes: Dict[Hashable, int] = {}
+    for item in items:
+        group = key(item)
+        batch = open_groups.get(group)
+        if batch is None:
+            if len(open_groups) >= max_open_groups:
+                oldest = next(iter(open_groups))
+                del sizes[oldest]
+                yield open_groups.pop(oldest)
+            batch = open_groups[group] = []
+            sizes[group] = next_size(size)
+        batch.append(item)
+        if len(batch) >= sizes[group]:
+            del sizes[group]
+            yield open_groups.pop(group)
+
+    yield from open_groups.values()
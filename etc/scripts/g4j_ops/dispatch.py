@@ -0,0 +1,101 @@
+"""
+Batching and concurrent dispatch of work items to the admin API.
+"""
+
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Dict, Generic, Hashable, Iterable, Iterator, List, Tuple, TypeVar, Union
+
+LOG = logging.getLogger(__name__)
+
+K = TypeVar('K', bound=Hashable)
+T = TypeVar('T')
+R = TypeVar('R')
+
+# A fixed size, or a function returning the size of the next batch (see g4j_ops/batchsize.py)
+BatchSize = Union[int, Callable[[], int]]
+
+
+def next_size(size: BatchSize) -> int:
+    return size() if callable(size) else size
+
+
+def batched(items: Iterable[T], size: BatchSize) -> Iterator[List[T]]:
+    items = iter(items)
+    while True:
+        batch = list(islice(items, next_size(size)))
+        if not batch:
+            return
+        yield batch
+
+
+def batched_by(items: Iterable[Tuple[K, T]], size: BatchSize) -> Iterator[Tuple[K, List[T]]]:
+    """
+    Batches (key, item) pairs per key. A key's batch is yielded as soon as it is full, and
+    whatever is left of each key at the end, so only one partial batch per key is held.
+    """
+    pending: Dict[K, List[T]] = {}
+    sizes: Dict[K, int] = {}
+    for key, item in items:
+        if key not in pending:
+            pending[key], sizes[key] = [], next_size(size)
+        batch = pending[key]
+        batch.append(item)
+        if len(batch) >= sizes[key]:
+            del sizes[key]
+            yield key, pending.pop(key)
+    yield from pending.items()
+
+
+class BatchDispatcher(Generic[T, R]):
+    """
+    Keeps up to `concurrency` batches in flight and yields (batch, result) pairs as they
+    complete, which may be out of order. Results are always yielded on the calling thread,
+    so checkpointing from the loop body needs no locking.
+
+    Call `stop()` to stop submitting new batches; batches already in flight are still
+    yielded so their outcome can be recorded.
+    """
+
+    def __init__(self, process: Callable[[List[T]], R], concurrency: int = 1):
+        self.process = process
+        self.concurrency = max(1, concurrency)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped.is_set()
+
+    def run(self, batches: Iterable[List[T]]) -> Iterator[Tuple[List[T], R]]:
+        batches = iter(batches)
+        if self.concurrency == 1:
+            for batch in batches:
+                if self._stopped.is_set():
+                    return
+                yield batch, self.process(batch)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='dispatch') as pool:
+            in_flight: Dict[Future, List[T]] = {}
+
+            def submit_next():
+                if self._stopped.is_set():
+                    return
+                batch = next(batches, None)
+                if batch is not None:
+                    in_flight[pool.submit(self.process, batch)] = batch
+
+            for _ in range(self.concurrency):
+                submit_next()
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    yield batch, future.result()
+                    submit_next()
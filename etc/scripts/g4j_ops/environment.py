@@ -0,0 +1,43 @@
+"""
+The github-for-jira deployments the admin scripts can run against.
+"""
+
+import logging
+from g4j_ops.auth import SLAuth
+from typing import NamedTuple
+
+LOG = logging.getLogger(__name__)
+
+SLAUTH_AUDIENCE = 'github-for-jira'
+SLAUTH_GROUP = 'micros-sv--github-for-jira-dl-admins'
+
+ENVIRONMENTS = {
+    'dev': 'https://github-for-jira.ap-southwest-2.dev.atl-paas.net',
+    'staging': 'https://github-for-jira.us-west-1.staging.atl-paas.net',
+    'prod': 'https://github-for-jira.sgw.prod.atl-paas.net',
+}
+
+
+class Environment(NamedTuple):
+    name: str
+    github_for_jira_url: str
+    github_for_jira_auth: object
+
+
+def create_slauth(env: str) -> SLAuth:
+    return SLAuth(
+        audience=SLAUTH_AUDIENCE,
+        group=SLAUTH_GROUP,
+        environment=env
+    )
+
+
+def create_environment(env: str, url: str = None) -> Environment:
+    if env not in ENVIRONMENTS:
+        raise ValueError(f'Invalid environment {env}')
+
+    LOG.info('Running for env %s', env)
+    return Environment(
+        name=env,
+        github_for_jira_url=(url or ENVIRONMENTS[env]).rstrip('/'),
+        github_for_jira_auth=create_slauth(env))
@@ -0,0 +1,423 @@
+"""
+Throughput metrics, progress and per-phase timings of an admin script run.
+
+`METRICS` is shared by everything in a run, like `TOKEN_PROVIDER`. The shared modules
+record where the time goes as it is spent, per phase:
+
+    auth        forking `atlas slauth token` (cache hits cost nothing)
+    serialize   encoding request bodies to JSON
+    network     HTTP requests, one observation per attempt, including any token fetch on the way
+    checkpoint  reads and writes of the checkpoint journal
+    sleep       --sleep between batches and backoff between retries
+    throttle    waiting for the rate limiter or the backfill backlog
+
+together with items by outcome and requests by status code. Phases overlap when batches
+are in flight concurrently, so their totals can add up to more than the run took.
+
+`start_reporting` logs a progress line every --progress-interval seconds with the rate,
+the share of failed requests and, when reading a file, how far through it the run is and
+an ETA. The same numbers go to a Prometheus textfile (for node_exporter's textfile
+collector) with --metrics-textfile, and to StatsD with --statsd, every interval. At the
+end --report writes them all as JSON, and --profile PREFIX writes a cProfile of every
+thread to PREFIX.prof and the top allocations seen by tracemalloc to PREFIX.tracemalloc.txt.
+From Python 3.12 on, cProfile runs on sys.monitoring, which allows only one profiler per
+process. There the profile is a single one enabled on the main thread.
+"""
+
+import argparse
+import bisect
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import pstats
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, IO, List, Optional
+
+LOG = logging.getLogger(__name__)
+
+PHASES = ('auth', 'serialize', 'network', 'checkpoint', 'sleep', 'throttle')
+# Upper bounds in seconds, like Prometheus' default histogram buckets with some room for slow batches
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+DEFAULT_PROGRESS_INTERVAL = 10.0
+TRACEMALLOC_TOP = 25
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The upper bound of the bucket holding the q-quantile, or the maximum seen for the last one."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max), 6)
+        return round(self.max, 6)
+
+    def cumulative(self) -> Dict[str, int]:
+        """Counts at or below each bucket's upper bound, as Prometheus has them."""
+        counts, seen = {}, 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            counts['+Inf' if bound == float('inf') else str(bound)] = seen
+        return counts
+
+    def to_json(self) -> dict:
+        return {
+            'count': self.count,
+            'seconds': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+            'buckets': self.cumulative(),
+        }
+
+
+class Metrics:
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.started_at = clock()
+        self.phases: Dict[str, Histogram] = {phase: Histogram() for phase in PHASES}
+        self.items: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase].observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, phase: str):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(phase, self.clock() - started)
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            with self.time('sleep'):
+                time.sleep(seconds)
+
+    def count_items(self, status: str, count: int = 1):
+        with self._lock:
+            self.items[status] = self.items.get(status, 0) + count
+
+    def count_request(self, status_code: Optional[int]):
+        """Counts a request by its status code, or None for a connection error or timeout."""
+        key = str(status_code) if status_code is not None else 'error'
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            requests = dict(self.requests)
+            failed = sum(count for code, count in requests.items() if not code.startswith('2'))
+            return {
+                'seconds': round(self.clock() - self.started_at, 3),
+                'items': dict(self.items),
+                'requests': requests,
+                'request_error_rate': round(failed / sum(requests.values()), 4) if requests else 0.0,
+                'phases': {phase: histogram.to_json() for phase, histogram in self.phases.items() if histogram.count},
+            }
+
+
+METRICS = Metrics()
+
+
+class _Progress:
+    """Position in the input file, for how far through it a run is."""
+
+    def __init__(self, file: Optional[IO], start: int = 0):
+        # Text files can't tell() while being iterated, the binary buffer underneath can
+        self._file = getattr(file, 'buffer', file)
+        self.total = None
+        # A resumed run seeks to its checkpoint offset only once it starts reading, so the
+        # rate is measured from there rather than from wherever the file is now
+        self.start = start
+        if self._file is not None:
+            try:
+                self.total = os.fstat(self._file.fileno()).st_size
+                self.start = max(start, self._file.tell())
+            except (AttributeError, OSError, ValueError):
+                self._file = None
+
+    def position(self) -> Optional[int]:
+        if self._file is None:
+            return None
+        try:
+            return self._file.tell()
+        except (OSError, ValueError):
+            # Closed once the input has been read
+            return self.total
+
+    def eta(self, elapsed: float) -> Optional[float]:
+        position = self.position()
+        if position is None or not self.total or position <= self.start:
+            return None
+        return elapsed * (self.total - position) / (position - self.start)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}'
+
+
+def _metric_name(key: str) -> str:
+    return key.replace('-', '_').replace('.', '_')
+
+
+class PrometheusTextfile:
+    def __init__(self, path: str, script: str):
+        self.path = path
+        self.script = script
+
+    def export(self, report: dict):
+        labels = f'script="{self.script}"'
+        lines = ['# HELP g4j_ops_items_total Work items by outcome', '# TYPE g4j_ops_items_total counter']
+        lines += [f'g4j_ops_items_total{{{labels},status="{status}"}} {count}' for status, count in sorted(report['items'].items())]
+        lines += ['# HELP g4j_ops_requests_total Admin API requests by status code', '# TYPE g4j_ops_requests_total counter']
+        lines += [f'g4j_ops_requests_total{{{labels},code="{code}"}} {count}' for code, count in sorted(report['requests'].items())]
+        lines += ['# HELP g4j_ops_phase_seconds Time spent per phase', '# TYPE g4j_ops_phase_seconds histogram']
+        for phase, histogram in report['phases'].items():
+            lines += [f'g4j_ops_phase_seconds_bucket{{{labels},phase="{phase}",le="{le}"}} {count}'
+                      for le, count in histogram['buckets'].items()]
+            lines.append(f'g4j_ops_phase_seconds_sum{{{labels},phase="{phase}"}} {histogram["seconds"]}')
+            lines.append(f'g4j_ops_phase_seconds_count{{{labels},phase="{phase}"}} {histogram["count"]}')
+        for name, help_text in (('items_per_second', 'Items per second over the last interval'),
+                                ('progress_ratio', 'Share of the input read'),
+                                ('eta_seconds', 'Estimated seconds until the input is done')):
+            if report.get(name) is not None:
+                lines += [f'# HELP g4j_ops_{name} {help_text}', f'# TYPE g4j_ops_{name} gauge',
+                          f'g4j_ops_{name}{{{labels}}} {report[name]}']
+        lines += ['# TYPE g4j_ops_last_update_timestamp_seconds gauge',
+                  f'g4j_ops_last_update_timestamp_seconds{{{labels}}} {time.time():.0f}']
+
+        # The collector may read at any time, so never let it see a half written file
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temporary, self.path)
+
+
+class StatsD:
+    """Counters as deltas since the last export, phases as their count and total milliseconds, and gauges."""
+
+    def __init__(self, address: str, script: str, prefix: str = 'g4j_ops'):
+        host, _, port = address.rpartition(':')
+        self.address = (host or '127.0.0.1', int(port or 8125))
+        self.prefix = f'{prefix}.{_metric_name(script)}'
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sent: Dict[str, float] = {}
+
+    def _delta(self, name: str, value: float) -> float:
+        delta = value - self._sent.get(name, 0)
+        self._sent[name] = value
+        return delta
+
+    def export(self, report: dict):
+        lines = []
+        for status, count in report['items'].items():
+            lines.append(f'{self.prefix}.items.{status}:{self._delta(f"items.{status}", count)}|c')
+        for code, count in report['requests'].items():
+            lines.append(f'{self.prefix}.requests.{code}:{self._delta(f"requests.{code}", count)}|c')
+        for phase, histogram in report['phases'].items():
+            lines.append(f'{self.prefix}.phase.{phase}.count:{self._delta(f"{phase}.count", histogram["count"])}|c')
+            lines.append(f'{self.prefix}.phase.{phase}.ms:{round(self._delta(f"{phase}.ms", histogram["seconds"] * 1000))}|c')
+        for name in ('items_per_second', 'progress_ratio', 'eta_seconds'):
+            if report.get(name) is not None:
+                lines.append(f'{self.prefix}.{name}:{report[name]}|g')
+        # Small enough packets for any MTU, and a dropped one only loses an interval
+        for start in range(0, len(lines), 10):
+            try:
+                self._socket.sendto('\n'.join(lines[start:start + 10]).encode('utf-8'), self.address)
+            except OSError as e:
+                LOG.debug('Sending metrics to StatsD at %s failed: %s', self.address, e)
+
+
+class _Profiler:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _profile_thread(self, *args):
+        # Runs once as the profile hook of every new thread, and replaces itself with a profiler
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        tracemalloc.start()
+        # A second profiler fails in every new thread there, and a dead worker hangs the run
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profile_thread)
+        self._profile_thread()
+
+    def stop(self) -> dict:
+        # Before merging the profiles allocates anything
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            profile.disable()
+        pstats.Stats(*profiles).dump_stats(f'{self.prefix}.prof')
+
+        with open(f'{self.prefix}.tracemalloc.txt', 'w') as f:
+            f.write(f'Peak traced memory: {peak / 2 ** 20:.1f} MiB\n\n')
+            for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+                f.write(f'{stat}\n')
+        LOG.info('Profile written to %s.prof (python3 -m pstats %s.prof) and allocations to %s.tracemalloc.txt',
+                 self.prefix, self.prefix, self.prefix)
+        return {
+            'cprofile': f'{self.prefix}.prof',
+            'tracemalloc': f'{self.prefix}.tracemalloc.txt',
+            'peak_traced_mb': round(peak / 2 ** 20, 1),
+        }
+
+
+class Reporter:
+    def __init__(self,
+                 metrics: Metrics = METRICS,
+                 interval: float = DEFAULT_PROGRESS_INTERVAL,
+                 input_file: Optional[IO] = None,
+                 input_offset: int = 0,
+                 exporters: Optional[list] = None,
+                 report_path: Optional[str] = None,
+                 profile_prefix: Optional[str] = None,
+                 script: Optional[str] = None):
+        self.metrics = metrics
+        self.interval = interval
+        self.exporters = exporters or []
+        self.report_path = report_path
+        self.script = script or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        self._progress = _Progress(input_file, input_offset)
+        self._profiler = _Profiler(profile_prefix) if profile_prefix else None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_items = 0
+        self._last_at = metrics.clock()
+        self._started_at = time.time()
+
+    def start(self) -> 'Reporter':
+        if self._profiler:
+            self._profiler.start()
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._report()
+
+    def _report(self, final: bool = False) -> dict:
+        report = self.metrics.snapshot()
+        now = self.metrics.clock()
+        items = sum(report['items'].values())
+        # The live rate is over the last interval, the final one over the whole run
+        if final:
+            report['items_per_second'] = round(items / report['seconds'], 1) if report['seconds'] else None
+        else:
+            report['items_per_second'] = round((items - self._last_items) / max(now - self._last_at, 1e-6), 1)
+        self._last_items, self._last_at = items, now
+
+        position = self._progress.position()
+        if position is not None and self._progress.total:
+            report['progress_ratio'] = round(position / self._progress.total, 4)
+            eta = self._progress.eta(report['seconds'])
+            report['eta_seconds'] = round(eta) if eta is not None else None
+
+        message = (f'{"Finished" if final else "Progress"}: {items} items '
+                   f'({", ".join(f"{count} {status}" for status, count in sorted(report["items"].items())) or "none yet"}), '
+                   f'{report["items_per_second"]} items/s, {report["request_error_rate"]:.1%} of requests failed')
+        if report.get('progress_ratio') is not None and not final:
+            message += f', {report["progress_ratio"]:.0%} of the input'
+            if report.get('eta_seconds') is not None:
+                message += f', ETA {_format_duration(report["eta_seconds"])}'
+        LOG.info(message)
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(report)
+            except OSError as e:
+                LOG.warning('Exporting metrics with %s failed: %s', exporter.__class__.__name__, e)
+        return report
+
+    def finish(self, **extra) -> dict:
+        """Stops reporting, and logs, exports and writes the report of the whole run."""
+        from g4j_ops.auth import TOKEN_PROVIDER
+
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        report = self._report(final=True)
+        report.update(script=self.script,
+                      started_at=self._started_at,
+                      finished_at=time.time(),
+                      tokens=TOKEN_PROVIDER.stats(),
+                      **extra)
+        if self._profiler:
+            report['profile'] = self._profiler.stop()
+        phases = ', '.join(f'{phase} {histogram["seconds"]:.1f}s' for phase, histogram in report['phases'].items())
+        if phases:
+            LOG.info('Time per phase: %s', phases)
+        if self.report_path:
+            with open(self.report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            LOG.info('Run report written to %s', self.report_path)
+        return report
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help='Seconds between progress lines and metrics exports, 0 for none')
+    parser.add_argument('--metrics-textfile', help='Prometheus textfile to keep up to date, e.g. in node_exporter\'s textfile directory')
+    parser.add_argument('--statsd', metavar='HOST:PORT', help='StatsD to send metrics to over UDP')
+    parser.add_argument('--report', help='JSON file to write the metrics of the whole run to at the end')
+    parser.add_argument('--profile', metavar='PREFIX', help='Profile the run into PREFIX.prof and PREFIX.tracemalloc.txt')
+
+
+def start_reporting(args: argparse.Namespace, input_file: Optional[IO] = None, input_offset: int = 0) -> Reporter:
+    """`input_offset` is where a resumed run starts reading `input_file`, its checkpoint's input offset."""
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    exporters = []
+    if args.metrics_textfile:
+        exporters.append(PrometheusTextfile(args.metrics_textfile, script))
+    if args.statsd:
+        exporters.append(StatsD(args.statsd, script))
+    return Reporter(interval=args.progress_interval,
+                    input_file=input_file,
+                    input_offset=input_offset,
+                    exporters=exporters,
+                    report_path=args.report,
+                    profile_prefix=args.profile,
+                    script=script).start()
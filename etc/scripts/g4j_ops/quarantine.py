@@ -0,0 +1,37 @@
+"""
+Quarantine file for entities the admin API rejects.
+
+Rejected entities are appended as `key,status_code,error` rows and fsync'd straight
+away, so the file can be inspected, fixed up and fed back in as the input of a new run.
+"""
+
+import csv
+import logging
+import os
+import threading
+from typing import Iterable, Optional
+
+LOG = logging.getLogger(__name__)
+
+
+class Quarantine:
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+
+    def add(self, keys: Iterable, status_code: Optional[int], error: Optional[str]):
+        with self._lock:
+            for key in keys:
+                self._writer.writerow([key, status_code or '', (error or '').strip()])
+                self.count += 1
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        if self.count:
+            LOG.warning('%s entities were quarantined in %s', self.count, self.path)
@@ -0,0 +1,102 @@
+"""
+Checkpointed batch runs shared by the CSV scripts.
+
+Entries read from the input are skipped if the checkpoint already has them or they were
+read before (see g4j_ops/dedupe.py, so memory stays bounded however long the input), batched
+and dispatched, each batch once the backlog allows it when there is a `Backpressure`. With a
+`BatchSizeTuner` for the batch size, every batch is as big as it says and every request
+feeds it. Every batch goes through `send_bisecting`, so a rejected entity is quarantined
+instead of stopping the run, and transient failures that outlast the retry policy are left
+unfinished in the checkpoint for the next run to pick up. A 401, 403, 404 or 405 stops the
+dispatch of new batches, since no batch will get past a bad token or a wrong URL.
+
+Entries not in input order, e.g. reordered by cost (see g4j_ops/schedule.py), leave the resume
+offset where it was, and a resume skips what was finished by looking each entry up instead.
+"""
+
+import logging
+import requests
+from g4j_ops.backpressure import Backpressure
+from g4j_ops.batchsize import BatchSizeTuner
+from g4j_ops.checkpoint import ERROR, QUARANTINED, SUCCESS, Checkpoint, OffsetTracker
+from g4j_ops.dedupe import Deduplicator
+from g4j_ops.dispatch import BatchDispatcher, BatchSize, batched
+from g4j_ops.metrics import METRICS
+from g4j_ops.quarantine import Quarantine
+from g4j_ops.sources import Entry, skip
+from g4j_ops.splitter import SplitStats, fatal_status, send_bisecting
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+LOG = logging.getLogger(__name__)
+
+
+class RunSummary(NamedTuple):
+    succeeded: int
+    quarantined: int
+    failed: int
+
+
+def pending_entries(entries: Iterable[Entry], checkpoint: Checkpoint) -> Iterator[Entry]:
+    """Drops entries the checkpoint has finished, and repeats still in flight, in bounded memory."""
+    deduplicator = Deduplicator()
+    try:
+        yield from deduplicator.filter(skip(entries, lambda entry: checkpoint.is_done(entry.value)), key=lambda entry: entry.value)
+    finally:
+        deduplicator.close()
+
+
+def run_batches(entries: Iterable[Entry],
+                send: Callable[[List[str]], requests.Response],
+                checkpoint: Checkpoint,
+                quarantine: Quarantine,
+                batch_size: BatchSize,
+                concurrency: int = 1,
+                sleep: float = 0,
+                backpressure: Optional[Backpressure] = None,
+                in_input_order: bool = True) -> RunSummary:
+    tracker = OffsetTracker(checkpoint.input_offset)
+
+    def tracked(batches):
+        for batch in batches:
+            tracker.add(batch[-1].offset)
+            yield batch
+
+    stats = SplitStats()
+    tuner = batch_size if isinstance(batch_size, BatchSizeTuner) else None
+    if tuner:
+        send = tuner.measured(send)
+
+    def process_batch(batch: List[Entry]):
+        if backpressure:
+            backpressure.wait()
+        outcomes = send_bisecting([entry.value for entry in batch], send, stats)
+        # Each worker waits before taking its next batch, so the sleep paces every slot
+        METRICS.sleep(sleep)
+        return outcomes
+
+    counts = {SUCCESS: 0, QUARANTINED: 0, ERROR: 0}
+    dispatcher = BatchDispatcher(process_batch, concurrency=concurrency)
+    for batch, outcomes in dispatcher.run(tracked(batched(pending_entries(entries, checkpoint), batch_size))):
+        for outcome in outcomes:
+            checkpoint.record(outcome.items, outcome.status, outcome.error)
+            if outcome.status == QUARANTINED:
+                quarantine.add(outcome.items, outcome.status_code, outcome.error)
+            counts[outcome.status] += len(outcome.items)
+            METRICS.count_items(outcome.status, len(outcome.items))
+        fatal = fatal_status(outcomes)
+        if fatal and not dispatcher.stopped:
+            LOG.error('The API answered %s, stopping the run. Check --env, --url and SLAuth access, then run again', fatal)
+            dispatcher.stop()
+
+        # A batch that still has unfinished entities keeps the resume offset from moving past it
+        if in_input_order and all(outcome.status != ERROR for outcome in outcomes):
+            checkpoint.set_input_offset(tracker.complete(batch[-1].offset))
+
+    stats.log()
+    if tuner:
+        tuner.log()
+    if backpressure:
+        backpressure.log()
+    summary = RunSummary(counts[SUCCESS], counts[QUARANTINED], counts[ERROR])
+    LOG.info('Run finished: %s succeeded, %s quarantined, %s failed', *summary)
+    return summary
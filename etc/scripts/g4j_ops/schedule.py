@@ -0,0 +1,124 @@
+"""
+Cost-aware dispatch order for resyncs.
+
+Each installation started becomes one backfill job, and the backfill workers take jobs
+roughly in the order they were started. In input order, a run of big installations in the
+export keeps the whole fleet busy for hours while the small ones behind them wait, and then
+leaves workers idle at the end. With a cost per installation, like its repository count or
+how long its last sync took, the entries can be dispatched:
+
+    lpt         longest processing time first: the most expensive first, so the long jobs
+                start early and the short ones fill the gaps around them. This gives the
+                shortest makespan.
+    interleave  round-robin across cost buckets (powers of two), heaviest bucket first. Every
+                batch mixes big and small installations, so small customers are never stuck
+                behind a burst of big ones and the load stays even all through the run.
+
+Both need every entry in memory before the first batch goes out. Entries without a known
+cost are given the median cost.
+
+Costs come from a column of the input CSV, or from the app's database as the total
+`totalNumberOfRepos` of each installation's subscriptions (needs psycopg2).
+"""
+
+import csv
+import heapq
+import io
+import logging
+import math
+from g4j_ops.sources import Entry
+from itertools import zip_longest
+from typing import BinaryIO, Dict, Iterable, List, Sequence
+
+LOG = logging.getLogger(__name__)
+
+INPUT = 'input'
+LPT = 'lpt'
+INTERLEAVE = 'interleave'
+ORDERS = (INPUT, LPT, INTERLEAVE)
+
+
+def read_costs(file: BinaryIO, column: str, cost_column: str, encoding: str = 'utf-8') -> Dict[str, float]:
+    """Reads the cost of every value of `column` from `cost_column` of the whole file, leaving its position as it was."""
+    position = file.tell()
+    file.seek(0)
+    text = io.TextIOWrapper(file, encoding=encoding, newline='')
+    costs = {}
+    try:
+        reader = csv.DictReader(text)
+        if cost_column not in (reader.fieldnames or ()):
+            raise SystemExit(f'The input has no {cost_column} column for the cost, only {", ".join(reader.fieldnames or ())}')
+        for row in reader:
+            value = (row.get(column) or '').strip()
+            try:
+                costs[value] = float(row[cost_column])
+            except (TypeError, ValueError):
+                # No cost for it, it gets the median
+                continue
+    finally:
+        text.detach()
+    file.seek(position)
+    return costs
+
+
+def installation_costs(conn) -> Dict[str, float]:
+    """Repositories to backfill per installation, over all of its subscriptions."""
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                select "gitHubInstallationId", sum(coalesce("totalNumberOfRepos", 0))
+                from "Subscriptions"
+                group by "gitHubInstallationId"
+            ''')
+            return {str(installation_id): float(repos) for installation_id, repos in cursor}
+
+
+def _bucket(cost: float) -> int:
+    return int(math.log2(cost + 1))
+
+
+def median_cost(entries: Sequence[Entry], costs: Dict[str, float]) -> float:
+    known = sorted(costs[entry.value] for entry in entries if entry.value in costs)
+    return known[len(known) // 2] if known else 1.0
+
+
+def order_entries(entries: Iterable[Entry], costs: Dict[str, float], order: str) -> List[Entry]:
+    entries = list(entries)
+    if order == INPUT or not entries:
+        return entries
+    default = median_cost(entries, costs)
+    unknown = sum(1 for entry in entries if entry.value not in costs)
+    if unknown:
+        LOG.warning('No cost for %s of %s entries, using the median cost %s for them', unknown, len(entries), default)
+
+    def cost(entry: Entry) -> float:
+        return costs.get(entry.value, default)
+
+    # Sorting is stable, so equal costs keep their input order
+    by_cost = sorted(entries, key=cost, reverse=True)
+    if order == LPT:
+        return by_cost
+
+    buckets: Dict[int, List[Entry]] = {}
+    for entry in by_cost:
+        buckets.setdefault(_bucket(cost(entry)), []).append(entry)
+    LOG.info('Interleaving %s cost buckets: %s', len(buckets),
+             ', '.join(f'{len(members)} below {2 ** (bucket + 1) - 1}' for bucket, members in buckets.items()))
+    return [entry for round_ in zip_longest(*buckets.values()) for entry in round_ if entry is not None]
+
+
+def makespan(costs: Sequence[float], workers: int) -> float:
+    """How long `workers` take for jobs of `costs` taken in this order, each by the first worker free."""
+    free_at = [0.0] * max(1, workers)
+    for cost in costs:
+        heapq.heapreplace(free_at, free_at[0] + cost)
+    return max(free_at)
+
+
+def log_estimate(original: Sequence[Entry], ordered: Sequence[Entry], costs: Dict[str, float], workers: int):
+    """Logs the makespan of the input order and of the chosen one, in units of cost."""
+    default = median_cost(original, costs)
+    before = makespan([costs.get(entry.value, default) for entry in original], workers)
+    after = makespan([costs.get(entry.value, default) for entry in ordered], workers)
+    LOG.info('Estimated makespan with %s backfill workers: %.0f in input order, %.0f now (%.0f%% of it)',
+             workers, before, after, 100 * after / before if before else 100)
@@ -0,0 +1,136 @@
+"""
+Splitting one job between several operators or hosts.
+
+With --shard i/N a run only handles the entities whose stable hash (sha256 of the
+installation id or jiraHost, not Python's per-process `hash`) falls into shard i of N, and
+keeps its own checkpoint journal next to --output, as `<output>.shard-i-of-N.db`. Every
+shard reads the same input, and together the N shards handle every entity exactly once,
+whether they run in turn, side by side or on different hosts. Combine them with
+--rate-budget (see g4j_ops/budget.py) to keep all of them within one request rate.
+
+See how the shards of a job are doing, or merge their journals into --output itself, e.g.
+to finish the job unsharded:
+
+    $ python3 -m g4j_ops.shard output.db status
+    $ python3 -m g4j_ops.shard output.db merge
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+from g4j_ops.checkpoint import Checkpoint
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class Shard(NamedTuple):
+    # 1 to count
+    index: int
+    count: int
+
+    def owns(self, key) -> bool:
+        return shard_of(key, self.count) == self.index
+
+    def __str__(self):
+        return f'{self.index}/{self.count}'
+
+
+def shard_of(key, count: int) -> int:
+    digest = hashlib.sha256(str(key).strip().encode('utf-8')).digest()
+    return 1 + int.from_bytes(digest[:8], 'big') % count
+
+
+def parse_shard(value: str) -> Shard:
+    """argparse type of --shard: `i/N` with i from 1 to N."""
+    match = re.fullmatch(r'(\d+)/(\d+)', value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f'expected i/N, like 1/4, got {value!r}')
+    shard = Shard(int(match.group(1)), int(match.group(2)))
+    if not 1 <= shard.index <= shard.count:
+        raise argparse.ArgumentTypeError(f'the shard must be between 1 and {shard.count}, got {shard.index}')
+    return shard
+
+
+def add_shard_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='Only handle shard i of N of the input, with its own checkpoint journal next to --output')
+
+
+def shard_path(path: str, shard: Optional[Shard]) -> str:
+    """The checkpoint journal of `shard` of the job whose --output is `path`."""
+    if shard is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return f'{root}.shard-{shard.index}-of-{shard.count}{extension}'
+
+
+def select(items: Iterable[T], shard: Optional[Shard], key: Callable[[T], str]) -> Iterator[T]:
+    if shard is None:
+        yield from items
+        return
+    for item in items:
+        if shard.owns(key(item)):
+            yield item
+
+
+def find_shards(path: str) -> Dict[Shard, str]:
+    root, extension = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r'\.shard-(\d+)-of-(\d+)' + re.escape(extension) + '$')
+    shards = {}
+    for candidate in glob.glob(f'{glob.escape(root)}.shard-*-of-*{glob.escape(extension)}'):
+        match = pattern.match(candidate)
+        if match:
+            shards[Shard(int(match.group(1)), int(match.group(2)))] = candidate
+    return dict(sorted(shards.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show or merge the checkpoint journals of a sharded job')
+    parser.add_argument('journal', help='--output of the job')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Count entities by status per shard and in total')
+    subparsers.add_parser('merge', help='Merge the shard journals into the journal itself')
+    args = parser.parse_args()
+
+    shards = find_shards(args.journal)
+    if not shards:
+        raise SystemExit(f'No shard journals found for {args.journal}')
+    counts = {shard.count for shard in shards}
+    if len(counts) > 1:
+        raise SystemExit(f'The shard journals of {args.journal} were split {" and ".join(map(str, sorted(counts)))} ways')
+    count = counts.pop()
+    missing = [index for index in range(1, count + 1) if Shard(index, count) not in shards]
+
+    totals: Dict[str, int] = {}
+    offsets = []
+    for shard, path in shards.items():
+        checkpoint = Checkpoint(path)
+        shard_counts = checkpoint.counts()
+        offsets.append(checkpoint.input_offset)
+        checkpoint.close()
+        for status, n in shard_counts.items():
+            totals[status] = totals.get(status, 0) + n
+        print(f'shard {shard} ({path}): ' +
+              (', '.join(f'{status} {n}' for status, n in sorted(shard_counts.items())) or 'nothing yet') +
+              f', input offset {offsets[-1]}')
+    print('total: ' + (', '.join(f'{status} {n}' for status, n in sorted(totals.items())) or 'nothing yet'))
+    if missing:
+        print(f'no journal yet for shard{"s" if len(missing) > 1 else ""} {", ".join(f"{index}/{count}" for index in missing)}')
+
+    if args.command == 'merge':
+        target = Checkpoint(args.journal)
+        overlap = sum(target.merge(path) for path in shards.values())
+        # Everything before the lowest offset is finished in every shard, but only if all of them ran
+        if not missing:
+            target.set_input_offset(min(offsets))
+        print(f'merged into {args.journal}: ' +
+              ', '.join(f'{status} {n}' for status, n in sorted(target.counts().items())) +
+              f', input offset {target.input_offset}, {overlap} entities were already there')
+        target.close()
+
+
+if __name__ == '__main__':
+    main()
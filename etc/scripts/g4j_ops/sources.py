@@ -0,0 +1,130 @@
+"""
+Streaming readers for the scripts' CSV inputs.
+
+Everything here is a generator, so a multi-million row export is read, parsed and
+batched one row at a time and the first request goes out as soon as the first batch
+is full.
+"""
+
+import csv
+import itertools
+from typing import BinaryIO, Callable, Dict, FrozenSet, Hashable, Iterable, Iterator, NamedTuple, Optional, Sequence, Set, TextIO, Tuple, TypeVar
+
+T = TypeVar('T')
+
+# Splunk exports can carry very long multi-value cells
+csv.field_size_limit(16 * 1024 * 1024)
+
+
+def read_column(file: TextIO, column: str) -> Iterator[str]:
+    """
+    Yields the non-empty values of `column`. Files without a header row are read as a
+    single column of values.
+    """
+    reader = csv.reader(file)
+    first = next(reader, None)
+    if first is None:
+        return
+
+    if column in first:
+        index = first.index(column)
+    else:
+        index = 0
+        if first and first[0].strip():
+            yield first[0].strip()
+
+    for row in reader:
+        if len(row) > index:
+            value = row[index].strip()
+            if value:
+                yield value
+
+
+class Entry(NamedTuple):
+    # Byte offset just past the row the value was read from
+    offset: int
+    value: str
+
+
+def read_column_from(file: BinaryIO, column: str, start: int = 0, encoding: str = 'utf-8') -> Iterator[Entry]:
+    """
+    Like `read_column`, but for single-value-per-line files opened in binary mode, and
+    yields each value with its byte offset so a run can later resume from `start` without
+    reading what came before it.
+    """
+    header = file.readline()
+    position = len(header)
+    first = next(csv.reader([header.decode(encoding)]), [])
+    if column in first:
+        index = first.index(column)
+    else:
+        index = 0
+        if start < position and first and first[0].strip():
+            yield Entry(position, first[0].strip())
+
+    if start > position:
+        if file.seekable():
+            file.seek(start)
+            position = start
+        else:
+            while position < start:
+                line = file.readline()
+                if not line:
+                    return
+                position += len(line)
+
+    for line in file:
+        position += len(line)
+        row = next(csv.reader([line.decode(encoding)]), None)
+        if row and len(row) > index:
+            value = row[index].strip()
+            if value:
+                yield Entry(position, value)
+
+
+def read_failed_tasks(file: TextIO, tasks: Sequence[str], column: str = 'subscriptionId') -> Iterator[Tuple[str, FrozenSet[str]]]:
+    """
+    Yields each value of `column` with the set of `tasks` that failed for it.
+
+    A file with a `<task>Status` column per task, like an export of `RepoSyncStates` with
+    one row per repository, is read to the end first, and a task counts as failed for an id
+    when any of its rows says `failed`. A file with just the ids, like the
+    `select distinct("subscriptionId")` export, means every task failed for every id and is
+    streamed.
+    """
+    reader = csv.reader(file)
+    first = next(reader, None)
+    if first is None:
+        return
+
+    index = first.index(column) if column in first else 0
+    rows = reader if column in first else itertools.chain([first], reader)
+    status_columns = {task: first.index(f'{task}Status') for task in tasks if f'{task}Status' in first}
+    if not status_columns:
+        values = (row[index].strip() for row in rows if len(row) > index and row[index].strip())
+        yield from ((value, frozenset(tasks)) for value in unique(values))
+        return
+
+    failed: Dict[str, Set[str]] = {}
+    for row in rows:
+        if len(row) > index and row[index].strip():
+            failed.setdefault(row[index].strip(), set()).update(
+                task for task, i in status_columns.items() if len(row) > i and row[i].strip() == 'failed')
+    for value, failed_tasks in failed.items():
+        if failed_tasks:
+            yield value, frozenset(failed_tasks)
+
+
+def unique(items: Iterable[T], key: Optional[Callable[[T], Hashable]] = None) -> Iterator[T]:
+    """Drops repeated items, keeping only the keys (not the items) in memory."""
+    seen = set()
+    for item in items:
+        k = key(item) if key else item
+        if k in seen:
+            continue
+        seen.add(k)
+        yield item
+
+
+def skip(items: Iterable[T], done: Callable[[T], bool]) -> Iterator[T]:
+    return (item for item in items if not done(item))
@@ -0,0 +1,132 @@
+"""
+Isolation of entities that make the admin API reject a whole batch.
+
+The admin endpoints accept or reject a batch as a whole. When a batch is rejected for its
+payload (400, 413 or 422) it is split in half and the halves are tried again, recursively, until the
+entities causing the rejection are on their own. Everything else still goes through in
+the largest batch that succeeds.
+
+A rejected batch whose first half then succeeds must owe its rejection to the second half,
+so that half is split straight away rather than sent whole first. A single poison entity in
+a batch of n is therefore isolated with about log2(n) extra requests, and k of them with
+O(k log n).
+
+Any other 4xx, like a 401 or 403 for a bad SLAuth token or a 404 or 405 for a wrong --url,
+says nothing about the entities. Those batches are not split, their entities are left as
+ERROR for the next run to retry, and `fatal_status` tells the caller to stop sending more.
+"""
+
+import logging
+import requests
+import threading
+from g4j_ops.checkpoint import ERROR, QUARANTINED, SUCCESS
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+LOG = logging.getLogger(__name__)
+
+
+class Outcome(NamedTuple):
+    items: List
+    status: str
+    status_code: Optional[int]
+    error: Optional[str]
+
+
+class SplitStats:
+    def __init__(self):
+        self.rejected_batches = 0
+        self.extra_requests = 0
+        self.isolated = 0
+        self._lock = threading.Lock()
+
+    def add(self, rejected_batches=0, extra_requests=0, isolated=0):
+        with self._lock:
+            self.rejected_batches += rejected_batches
+            self.extra_requests += extra_requests
+            self.isolated += isolated
+
+    def log(self):
+        if self.rejected_batches:
+            LOG.info('Isolated %s rejected entities from %s rejected batches with %s extra requests',
+                     self.isolated, self.rejected_batches, self.extra_requests)
+
+
+# Client errors caused by the content of the batch, worth splitting it for
+REJECTION_STATUSES = (400, 413, 422)
+# Client errors no batch will get past: authentication, permissions or a wrong URL
+FATAL_STATUSES = (401, 403, 404, 405)
+
+
+def is_rejection(response: requests.Response) -> bool:
+    return response.status_code in REJECTION_STATUSES
+
+
+def fatal_status(outcomes: Sequence[Outcome]) -> Optional[int]:
+    """The status code that should stop the run, if any of `outcomes` got one."""
+    return next((outcome.status_code for outcome in outcomes if outcome.status_code in FATAL_STATUSES), None)
+
+
+def send_bisecting(items: Sequence,
+                   send: Callable[[List], requests.Response],
+                   stats: Optional[SplitStats] = None) -> List[Outcome]:
+    items = list(items)
+    result = _try(items, send)
+    if not isinstance(result, requests.Response):
+        return result
+
+    counted = _RequestCounter(send)
+    outcomes = _isolate(items, result, counted)
+    if stats:
+        stats.add(rejected_batches=1,
+                  extra_requests=counted.count,
+                  isolated=sum(len(outcome.items) for outcome in outcomes if outcome.status == QUARANTINED))
+    return outcomes
+
+
+class _RequestCounter:
+    def __init__(self, send):
+        self._send = send
+        self.count = 0
+
+    def __call__(self, items):
+        self.count += 1
+        return self._send(items)
+
+
+def _isolate(items: List, rejection: requests.Response, send: Callable[[List], requests.Response]) -> List[Outcome]:
+    """Splits `items`, which are known to be rejected with `rejection`, down to the rejected entities."""
+    if len(items) == 1:
+        LOG.warning('Quarantining %s (%s): %s', items[0], rejection.status_code, rejection.text)
+        return [Outcome(items, QUARANTINED, rejection.status_code, rejection.text)]
+
+    LOG.info('Batch of %s rejected (%s), splitting it to isolate the cause', len(items), rejection.status_code)
+    middle = len(items) // 2
+    left, right = items[:middle], items[middle:]
+
+    left_outcomes = _try(left, send)
+    left_rejection = left_outcomes if isinstance(left_outcomes, requests.Response) else None
+    if left_rejection is not None:
+        left_outcomes = _isolate(left, left_rejection, send)
+
+    if left_rejection is None and all(outcome.status == SUCCESS for outcome in left_outcomes):
+        # The left half went through, so whatever got the batch rejected is on the right
+        return left_outcomes + _isolate(right, rejection, send)
+
+    right_outcomes = _try(right, send)
+    if isinstance(right_outcomes, requests.Response):
+        right_outcomes = _isolate(right, right_outcomes, send)
+    return left_outcomes + right_outcomes
+
+
+def _try(items: List, send: Callable[[List], requests.Response]):
+    """Returns the outcome of sending `items`, or the response if they were rejected."""
+    try:
+        response = send(items)
+    except requests.RequestException as e:
+        return [Outcome(items, ERROR, None, str(e))]
+
+    if response.ok:
+        return [Outcome(items, SUCCESS, response.status_code, None)]
+    if is_rejection(response):
+        return response
+    return [Outcome(items, ERROR, response.status_code, response.text)]
@@ -7,20 +7,20 @@ This script automates the creation of repositories with branches and commits on
 2. Initialize each repository with a README file and a GitHub Actions workflow file.
 3. Create multiple branches within each repository.
 4. Make commits with random file content to each branch.
-5. Push the commits to the respective branches.
+5. Push all branches of the repository at once.
 6. Create pull requests from each branch to the main branch.
 7. Optionally merge the pull requests randomly.
 8. Repeat the above steps for the specified number of repositories, branches, and commits.
 
 Usage:
-1. Set the desired values for the following parameters at the top of the script:
-   - ACCESS_TOKEN: Your GitHub personal access token (PAT).
-   - ORGANIZATION_NAME: The name of your GitHub organization.
+1. Set the desired values for the following parameters at the top of the script, or pass them on the command line:
+   - ACCESS_TOKEN: Your GitHub personal access token (PAT), or set GITHUB_TOKEN.
+   - ORGANIZATION_NAME: The name of your GitHub organization, or pass --org.
 
 2. Open a terminal and navigate to the directory containing this script.
 
 3. Run the script using the following command:
-   $ python3 generate-github-test-data.py.py [--num-repos NUM_REPOS] [--num-branches NUM_BRANCHES] [--num-commits NUM_COMMITS] [--issue-prefix ISSUE_PREFIX]
+   $ python3 generate-github-test-data.py [--num-repos NUM_REPOS] [--num-branches NUM_BRANCHES] [--num-commits NUM_COMMITS] [--issue-prefix ISSUE_PREFIX] [--workers WORKERS] [--seed SEED]
 
    example:
    $ python3 generate-github-test-data.py --num-repos 5 --num-branches 4 --num-commits 11 --issue-prefix CAT
@@ -30,25 +30,64 @@ Usage:
    --num-branches NUM_BRANCHES: Number of branches to create per repository .
    --num-commits NUM_COMMITS: Number of commits to make per branch.
    --issue-prefix ISSUE_PREFIX: Prefix for issue key used on branch, commit.
+   --workers WORKERS: Number of repositories to build at the same time.
+   --seed SEED: Seed for names, issue keys, file contents and merge decisions.
+   --workload SPEC: JSON or YAML workload spec with a seed and distributions, instead of --num-*.
+   --repo-prefix REPO_PREFIX: Prefix of the repository names, repo-<epoch> by default.
+   --workdir WORKDIR: Where to create the local working copies, the current directory by default.
+   --manifest FILE: SQLite file recording progress; rerun with the same FILE to resume an interrupted run.
+   --rest: Create and merge pull requests through REST one at a time instead of GraphQL batches.
+   --content-per-minute, --content-per-hour: Pace of repository, pull request and merge creation.
+   --webhooks FILE: Don't touch GitHub, write the webhooks it would send for the same data to FILE instead.
+   --installation-id, --webhook-secret: Installation and signing secret of those webhooks.
 
 4. The script will start creating repositories, branches, and making commits. Events will be displayed in the terminal.
 
 5. If the script execution runs into an error, it don't give a damn and just moves onto the next task
 
+Each repository's history is written by one worker into its own local repository under
+--workdir with a single `git fast-import` stream, and pushed with a single `git push`. All
+workers share one GitHub API client that waits for the rate limit to reset when it runs
+out, and queues repository creation, pull requests and merges to stay within GitHub's
+secondary rate limits (see github_testdata/client.py). Pull requests are created and merged
+in GraphQL batches unless --rest is given. Every repository draws from its own random generator seeded with the run seed and its
+index, so a run with the same --seed and --repo-prefix produces the same branches, issue
+keys, file contents and merge decisions however many workers build it. The seed of every
+run is logged so that it can be repeated.
+
+With --manifest every repository, push, pull request, merge and workflow run is recorded as
+soon as GitHub confirms it (see github_testdata/manifest.py). Rerunning with the same manifest
+reuses its seed and repository prefix, reconciles it with the repositories and pull requests
+that exist on GitHub, and creates only what is still missing.
+
+With --webhooks the same seeded data is generated offline as signed `push`, `create`,
+`pull_request`, `workflow_run` and `deployment_status` webhooks, one JSON object per line,
+for replaying against a local app with bench/replay_webhooks.py:
+   $ WEBHOOK_SECRETS='["secret"]' python3 generate-github-test-data.py --webhooks events.jsonl --installation-id 1234 --num-repos 100 --num-branches 10 --num-commits 30 --seed 42
+
 Note: Make sure you have the necessary permissions and the GitHub organization exists.
 
 """
 
 import argparse
-import requests
+import hashlib
+import json
+import logging
 import os
-import subprocess
-import time
-import string
 import random
+import shutil
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+from github_testdata import ContentPacer, GitHubClient, HistoryBuilder, LocalRepo, PullRequestRef
+from github_testdata.client import BASE_URL, CONTENT_PER_HOUR, CONTENT_PER_MINUTE, GIT_URL
+from github_testdata.manifest import CREATED, DONE, PUSHED, Manifest, reconcile
+from github_testdata.webhooks import Commit, EventFactory, WebhookEvent, push_events, write_events
+from github_testdata.workload import Workload, load_workload, parse_workload
+from script_common import configure_logging
+from typing import Iterator, List, NamedTuple, Tuple
 
-# GitHub API base URL
-BASE_URL = 'https://api.github.com'
+LOG = logging.getLogger(__name__)
 
 # GitHub access token
 ACCESS_TOKEN = ''
@@ -61,169 +100,343 @@ DEFAULT_NUM_REPOS = 2
 DEFAULT_NUM_BRANCHES = 1
 DEFAULT_NUM_COMMITS = 1
 DEFAULT_ISSUE_PREFIX = "ARC"
+DEFAULT_WORKERS = 1
+DEFAULT_INSTALLATION_ID = 1234
 
-# Parse command-line arguments
-parser = argparse.ArgumentParser(description='Create repositories with branches and commits on GitHub.')
-parser.add_argument('--num-repos', type=int, default=DEFAULT_NUM_REPOS, help='Number of repositories to create')
-parser.add_argument('--num-branches', type=int, default=DEFAULT_NUM_BRANCHES, help='Number of branches to create per repository')
-parser.add_argument('--num-commits', type=int, default=DEFAULT_NUM_COMMITS, help='Number of commits to make per branch')
-parser.add_argument('--issue-prefix', type=str, default=DEFAULT_ISSUE_PREFIX, help='Prefix for issue/commit messages')
-args = parser.parse_args()
-
-# Helper function to make authenticated API requests
-def make_api_request(method, url, headers=None, data=None):
-    headers = headers or {}
-    headers['Authorization'] = f'Bearer {ACCESS_TOKEN}'
-    response = requests.request(method, url, headers=headers, json=data)
-    response.raise_for_status()
-    return response.json()
-
-# Helper function to execute bash commands
-def run_bash_command(command):
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    return process.returncode, stdout, stderr
-
-def create_branch(branch_name):
-    create_branch_command = f'git checkout -b {branch_name}'
-    return_code, stdout, stderr = run_bash_command(create_branch_command)
-    if return_code != 0:
-        raise RuntimeError(f'Error creating branch "{branch_name}": {stderr.decode()}')
-    print(f'Branch "{branch_name}" created successfully.')
-
-def commit_and_push_changes(branch_name, file_name, commit_message):
-    content = generate_random_content()
-    with open(file_name, 'w') as file:
-        file.write(content)
-
-    add_file_command = f'git add {file_name}'
-    return_code, stdout, stderr = run_bash_command(add_file_command)
-    if return_code != 0:
-        raise RuntimeError(f'Error adding file "{file_name}" to Git: {stderr.decode()}')
-
-    commit_command = f'git commit -m "{commit_message}"'
-    return_code, stdout, stderr = run_bash_command(commit_command)
-    if return_code != 0:
-        raise RuntimeError(f'Error committing file "{file_name}": {stderr.decode()}')
-
-    push_command = f'git push origin {branch_name}'
-    return_code, stdout, stderr = run_bash_command(push_command)
-    if return_code != 0:
-        raise RuntimeError(f'Error pushing commits to branch "{branch_name}": {stderr.decode()}')
-    print(f'Commit {commit_message} pushed to branch "{branch_name}" successfully.')
-
-def generate_random_content():
-    # Generate a random string of uppercase letters and digits
-    length = random.randint(10, 20)
-    characters = string.ascii_uppercase + string.digits
-    content = ''.join(random.choice(characters) for _ in range(length))
-    return content
-
-# Function to initialize the repository, add README, and push the initial commit
-def initialize_repository(repo_name):
-    os.makedirs(repo_name)
-    os.chdir(repo_name)
-    subprocess.run('git init', shell=True, check=True)
-    os.system('echo "# README" >> README.md')
-    create_workflow_file()
-    subprocess.run('git add .', shell=True, check=True)
-    subprocess.run('git commit -m "Initial commit"', shell=True, check=True)
-    subprocess.run('git branch -M main', shell=True, check=True)
-    subprocess.run(f'git remote add origin https://github.com/{ORGANIZATION_NAME}/{repo_name}.git', shell=True, check=True)
-    subprocess.run('git push -u origin main', shell=True, check=True)
-    print(f'Repository "{repo_name}" initialized and initial commit pushed successfully.')
-
-# Add main.yml to .github/workflows directory
-def create_workflow_file():
-    workflow_file_name = 'main.yml'
-    workflow_file_path = os.path.join(os.getcwd(), '.github', 'workflows', workflow_file_name)
-    os.makedirs(os.path.dirname(workflow_file_path), exist_ok=True)
-
-    with open('../build-and-deploy-workflow-example.yml', 'r') as source_file:
-        content = source_file.read()
-        with open(workflow_file_path, 'w') as workflow_file:
-            workflow_file.write(content)
-
-    subprocess.run(f'git add .github/workflows/{workflow_file_name}', shell=True, check=True)
-
-def create_pull_request(repo_name, branch_name):
-    create_pull_request_url = f'{BASE_URL}/repos/{ORGANIZATION_NAME}/{repo_name}/pulls'
-    pull_request_data = {
-        'title': f'{args.issue_prefix}-{random.randint(100, 999)}: Pull request',
-        'body': f'{args.issue_prefix}-{random.randint(100, 999)}: Pull request body',
-        'head': branch_name,
-        'base': 'main'
-    }
-    pull_request_response = make_api_request('POST', create_pull_request_url, data=pull_request_data)
-    print(f'Pull request created from "{branch_name}" to main successfully.')
-
-    # Step 9: Randomly decide to merge the pull request (50/50 chance)
-    should_merge = random.choice([True, False])
-    if should_merge:
-        pull_request_number = pull_request_response['number']
-        merge_pull_request_url = f'{BASE_URL}/repos/{ORGANIZATION_NAME}/{repo_name}/pulls/{pull_request_number}/merge'
-        make_api_request('PUT', merge_pull_request_url)
-        print(f'Pull request from "{branch_name}" to main merged successfully.')
-    else:
-        print(f'Pull request from "{branch_name}" to main will not be merged.')
-
-# Generate a unique repository name based on epoch time
-base_repo_name = f'repo-{int(time.time())}'
+WORKFLOW_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build-and-deploy-workflow-example.yml')
+WORKFLOW_FILE = '.github/workflows/main.yml'
 
-try:
 
-    for repo_index  in range(args.num_repos):
-        repo_name = f'{base_repo_name}-{repo_index}'
+class Settings(NamedTuple):
+    workload: Workload
+    workdir: str
+    graphql: bool
 
-        # Step 1: Create the repository
-        create_repo_url = f'{BASE_URL}/orgs/{ORGANIZATION_NAME}/repos'
-        create_repo_data = {'name': repo_name}
-        make_api_request('POST', create_repo_url, data=create_repo_data)
-        print(f'Repository "{repo_name}" created successfully.')
 
+def generate_random_content(rng: random.Random, length: int) -> str:
+    # Generate a random string of uppercase letters and digits
+    characters = string.ascii_uppercase + string.digits
+    return ''.join(rng.choices(characters, k=length))
+
+
+def initialize_repository(client: GitHubClient, repo_name: str, workdir: str) -> LocalRepo:
+    path = os.path.join(workdir, repo_name)
+    # Left over from an interrupted run, the history is rebuilt from scratch
+    shutil.rmtree(path, ignore_errors=True)
+    return LocalRepo.init(path, client.clone_url(repo_name))
+
+
+class BranchPlan(NamedTuple):
+    name: str
+    # (message, file name, content) of each commit
+    commits: List[Tuple[str, str, str]]
+
+
+def plan_branches(settings: Settings, rng: random.Random) -> List[BranchPlan]:
+    plans = []
+    workload = settings.workload
+    for branch_index in range(workload.branches_per_repo(rng)):
+        branch_name = f'{workload.issue_keys.draw(rng)}-{branch_index}'
+        commits = [(f'{workload.issue_keys.draw(rng)}: Commit message',
+                    f'file-{commit_index}.txt',
+                    generate_random_content(rng, workload.file_sizes.draw(rng)))
+                   for commit_index in range(workload.commits_per_branch(rng))]
+        if commits:
+            plans.append(BranchPlan(branch_name, commits))
+    return plans
+
+
+def build_history(repo: LocalRepo, branches: List[BranchPlan], timestamp: int = None) -> int:
+    """
+    Writes the initial commit on main and the commits of every branch in one fast-import
+    stream and returns the number of commits written. The same branches and timestamp give
+    the same commit ids.
+    """
+    with open(WORKFLOW_TEMPLATE) as f:
+        workflow = f.read()
+
+    with HistoryBuilder(repo, timestamp) as history:
+        history.commit('main', 'Initial commit', {'README.md': '# README\n', WORKFLOW_FILE: workflow})
+        for branch in branches:
+            for message, file_name, content in branch.commits:
+                history.commit(branch.name, message, {file_name: content}, start_point='main')
+    return history.commits
+
+
+def push_history(client: GitHubClient, repo: LocalRepo, repo_name: str, branches: List[str]):
+    repo.push(*(f'refs/heads/{branch}' for branch in ['main', *branches]))
+    # Pushing several branches to an empty repository leaves it to GitHub which becomes the default
+    repository = client.set_default_branch(repo_name, 'main')
+    # Only a repository whose main is where it should be is recorded as pushed, anything else is pushed again
+    expected, actual = repo.git('rev-parse', 'refs/heads/main').strip(), client.branch_head(repo_name, 'main')
+    if repository.get('default_branch') != 'main' or actual != expected:
+        raise RuntimeError(f'"{repo_name}" has default branch {repository.get("default_branch")} and main at {actual}, '
+                           f'expected main at {expected}')
+    LOG.info('Pushed main and %s branches to "%s" successfully.', len(branches), repo_name)
+
+
+class PullRequestPlan(NamedTuple):
+    branch: str
+    title: str
+    body: str
+    merge: bool
+    # Extra runs of the build and deploy workflow after the merge, on top of the one its push triggers
+    workflow_runs: int
+
+
+def plan_pull_request(rng: random.Random, workload: Workload, branch_name: str) -> PullRequestPlan:
+    # Draw everything up front so a failed request doesn't shift the rest of the repository's choices
+    title = f'{workload.issue_keys.draw(rng)}: Pull request'
+    body = f'{workload.issue_keys.draw(rng)}: Pull request body'
+    merge = rng.random() < workload.merge_ratio
+    return PullRequestPlan(branch_name, title, body, merge, workload.workflow_runs_per_merge(rng) if merge else 0)
+
+
+def dispatch_workflow_runs(client: GitHubClient, manifest: Manifest, repo_name: str, plan: PullRequestPlan, dispatched: int):
+    for count in range(dispatched + 1, plan.workflow_runs + 1):
+        client.dispatch_workflow(repo_name, os.path.basename(WORKFLOW_FILE), 'main')
+        manifest.record_workflow_runs(repo_name, plan.branch, count)
+    if plan.workflow_runs > dispatched:
+        LOG.info('Dispatched %s workflow runs after merging "%s" in "%s".', plan.workflow_runs - dispatched, plan.branch, repo_name)
+
+
+def create_pull_request(client: GitHubClient, manifest: Manifest, repo_name: str, plan: PullRequestPlan):
+    pull = manifest.pulls(repo_name).get(plan.branch)
+    if pull is None:
+        pull_request = client.create_pull_request(repo_name, plan.branch, plan.title, plan.body)
+        manifest.record_pull(repo_name, plan.branch, pull_request['number'], pull_request.get('node_id'))
+        pull = manifest.pulls(repo_name)[plan.branch]
+        LOG.info('Pull request created from "%s" to main in "%s" successfully.', plan.branch, repo_name)
+
+    if plan.merge:
+        if not pull.merged:
+            client.merge_pull_request(repo_name, pull.number)
+            manifest.record_merge(repo_name, plan.branch)
+            LOG.info('Pull request from "%s" to main in "%s" merged successfully.', plan.branch, repo_name)
+        dispatch_workflow_runs(client, manifest, repo_name, plan, pull.workflow_runs)
+    else:
+        LOG.info('Pull request from "%s" to main in "%s" will not be merged.', plan.branch, repo_name)
+
+
+def create_pull_requests_batched(client: GitHubClient, manifest: Manifest, repo_name: str, repository_id: str,
+                                 plans: List[PullRequestPlan]) -> int:
+    """
+    Creates the pull requests of a repository that don't exist yet, then merges the chosen
+    ones that aren't merged yet, in GraphQL batches. Returns the number of failures.
+    """
+    failures = 0
+    pulls = manifest.pulls(repo_name)
+    to_create = [plan for plan in plans if plan.branch not in pulls]
+    created = client.create_pull_requests(repository_id, [{'head': plan.branch, 'title': plan.title, 'body': plan.body}
+                                                          for plan in to_create]) if to_create else []
+    for plan, result in zip(to_create, created):
+        if isinstance(result, PullRequestRef):
+            manifest.record_pull(repo_name, plan.branch, result.number, result.id)
+        else:
+            LOG.error('ERROR:SKIPPING:PULL %s/%s: %s', repo_name, plan.branch, result)
+            failures += 1
+    LOG.info('Created %s pull requests in "%s".', sum(isinstance(r, PullRequestRef) for r in created), repo_name)
+
+    pulls = manifest.pulls(repo_name)
+    to_merge = [plan for plan in plans if plan.merge and plan.branch in pulls and not pulls[plan.branch].merged]
+    merged = client.merge_pull_requests([pulls[plan.branch].node_id for plan in to_merge]) if to_merge else []
+    for plan, result in zip(to_merge, merged):
+        if result is True:
+            manifest.record_merge(repo_name, plan.branch)
+        else:
+            LOG.error('ERROR:SKIPPING:MERGE %s/%s: %s', repo_name, plan.branch, result)
+            failures += 1
+    LOG.info('Merged %s pull requests in "%s".', merged.count(True), repo_name)
+
+    pulls = manifest.pulls(repo_name)
+    for plan in plans:
+        if plan.merge and plan.branch in pulls and pulls[plan.branch].merged:
+            try:
+                dispatch_workflow_runs(client, manifest, repo_name, plan, pulls[plan.branch].workflow_runs)
+            except Exception as e:
+                LOG.error('ERROR:SKIPPING:WORKFLOW %s/%s: %s', repo_name, plan.branch, e)
+                failures += 1
+    return failures
+
+
+def generate_repository(client: GitHubClient, settings: Settings, manifest: Manifest, repo_name: str, rng: random.Random):
+    """
+    Brings the repository up to its plan, skipping whatever the manifest says was already
+    done, and marks it done in the manifest once nothing failed.
+    """
+    # Plan everything first, so the random draws are the same whichever steps are skipped
+    branches = plan_branches(settings, rng)
+    plans = [plan_pull_request(rng, settings.workload, branch.name) for branch in branches]
+
+    record = manifest.repo(repo_name)
+    if record is None:
+        repository = client.create_repository(repo_name)
+        record = manifest.record_repo(repo_name, CREATED, node_id=repository['node_id'])
+        LOG.info('Repository "%s" created successfully.', repo_name)
+    elif record.state == DONE:
+        LOG.info('Repository "%s" is already done, skipping it.', repo_name)
+        return
+
+    if record.state == CREATED:
         try:
-            initialize_repository(repo_name)
+            repo = initialize_repository(client, repo_name, settings.workdir)
+            started = time.monotonic()
+            commits = build_history(repo, branches, record.created_at)
+            elapsed = time.monotonic() - started
+            LOG.info('Built %s commits for "%s" in %.2fs (%.0f commits/s).', commits, repo_name, elapsed, commits / max(elapsed, 1e-6))
+            push_history(client, repo, repo_name, [branch.name for branch in branches])
         except Exception as e:
-            print('ERROR:SKIPPING:REPO')
-            print(f'{e}')
-            continue
+            LOG.error('ERROR:SKIPPING:REPO %s: %s', repo_name, e)
+            return
+        record = manifest.record_repo(repo_name, PUSHED)
 
-        for branch_index in range(args.num_branches):
-            branch_name = f'{args.issue_prefix}-{random.randint(100, 999)}-{int(time.time())}'
-
-            # Step 4: Create a new branch
+    if settings.graphql:
+        try:
+            failures = create_pull_requests_batched(client, manifest, repo_name, record.node_id, plans)
+        except Exception as e:
+            LOG.error('ERROR:SKIPPING:PULL %s: %s', repo_name, e)
+            return
+    else:
+        failures = 0
+        for plan in plans:
             try:
-                create_branch(branch_name)
+                create_pull_request(client, manifest, repo_name, plan)
             except Exception as e:
-                print('ERROR:SKIPPING:BRANCH')
-                print(f'{e}')
-                continue
-
-            for commit_index in range(args.num_commits):
-                file_name = f'file-{commit_index}.txt'
-                commit_message = f'{args.issue_prefix}-{random.randint(100, 999)}: Commit message'
-
-                try:
-                    # Step 6: Make a commit and push the changes
-                    commit_and_push_changes(branch_name, file_name, commit_message)
-                except Exception as e:
-                    print('ERROR:SKIPPING:COMMIT')
-                    print(f'{e}')
-                    continue
+                LOG.error('ERROR:SKIPPING:PULL %s/%s: %s', repo_name, plan.branch, e)
+                failures += 1
+
+    if not failures:
+        manifest.record_repo(repo_name, DONE)
+
+
+def generate_repository_events(settings: Settings, organization: str, installation_id: int, repo_name: str,
+                               repo_index: int, rng: random.Random) -> Iterator[WebhookEvent]:
+    """
+    The webhooks GitHub would send for the repository the online mode builds with the same
+    seed: a create and pushes per branch, a pull request opened per branch, and for each
+    merge the closed pull request, the push to main, the workflow run and the deployment.
+    """
+    branches = plan_branches(settings, rng)
+    plans = [plan_pull_request(rng, settings.workload, branch.name) for branch in branches]
+
+    repo_id = 100_000 + repo_index
+    factory = EventFactory(rng, installation_id, organization, repo_name, repo_id)
+    main_sha = factory.sha()
+    run_number = 0
+    for number, (branch, plan) in enumerate(zip(branches, plans), start=1):
+        commits = [Commit(factory.sha(), message, file_name) for message, file_name, _ in branch.commits]
+        yield factory.create(branch.name)
+        yield from push_events(factory, branch.name, commits, main_sha)
+        yield factory.pull_request('opened', number, branch.name, commits[-1].sha, plan.title, plan.body)
+        if not plan.merge:
+            continue
 
-            try:
-                # Step 7: Create a pull request
-                create_pull_request(repo_name, branch_name)
-            except Exception as e:
-                print('ERROR:SKIPPING:PULL')
-                print(f'{e}')
-                continue
+        yield factory.pull_request('closed', number, branch.name, commits[-1].sha, plan.title, plan.body, merged=True)
+        merge = Commit(factory.sha(), f'Merge pull request #{number} from {organization}/{branch.name}', commits[-1].file_name)
+        yield factory.push('main', [merge], main_sha)
+        main_sha = merge.sha
+        for _ in range(1 + plan.workflow_runs):
+            run_number += 1
+            yield factory.workflow_run(repo_id * 10_000 + run_number, run_number, 'main', merge)
+            yield factory.deployment_status(repo_id * 10_000 + run_number, merge.sha)
+
+
+def write_webhook_events(args: argparse.Namespace, settings: Settings, base_repo_name: str, seed: int):
+    secret = args.webhook_secret or json.loads(os.environ.get('WEBHOOK_SECRETS') or '[""]')[0]
+    if not secret:
+        raise SystemExit('Pass --webhook-secret or set WEBHOOK_SECRETS to the secret of the app under test')
+
+    def events():
+        for repo_index in range(settings.workload.repos):
+            rng = random.Random(f'{seed}-{repo_index}')
+            yield from generate_repository_events(settings, args.org, args.installation_id,
+                                                  f'{base_repo_name}-{repo_index}', repo_index, rng)
+
+    with open(args.webhooks, 'w') as f:
+        count = write_events(f, events(), secret)
+    LOG.info('Wrote %s signed webhook events to %s', count, args.webhooks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create repositories with branches and commits on GitHub.')
+    parser.add_argument('--num-repos', type=int, default=DEFAULT_NUM_REPOS, help='Number of repositories to create')
+    parser.add_argument('--num-branches', type=int, default=DEFAULT_NUM_BRANCHES, help='Number of branches to create per repository')
+    parser.add_argument('--num-commits', type=int, default=DEFAULT_NUM_COMMITS, help='Number of commits to make per branch')
+    parser.add_argument('--issue-prefix', type=str, default=DEFAULT_ISSUE_PREFIX, help='Prefix for issue/commit messages')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of repositories to build at the same time')
+    parser.add_argument('--seed', type=int, help='Seed for a reproducible run, the workload\'s seed or random by default')
+    parser.add_argument('--workload', help='JSON or YAML workload spec (see github_testdata/workload.py), replaces --num-*')
+    parser.add_argument('--repo-prefix', help='Prefix of the repository names, repo-<epoch> by default')
+    parser.add_argument('--workdir', default=os.getcwd(), help='Where to create the local working copies')
+    parser.add_argument('--org', default=ORGANIZATION_NAME, help='GitHub organization to create the repositories in')
+    parser.add_argument('--api-url', default=BASE_URL, help='GitHub API base URL, for GitHub Enterprise Server')
+    parser.add_argument('--git-url', default=GIT_URL, help='Base URL to push repositories to')
+    parser.add_argument('--manifest', help='SQLite file recording progress, rerun with the same one to resume an interrupted run')
+    parser.add_argument('--rest', action='store_true', help='Create and merge pull requests one REST call at a time instead of in GraphQL batches')
+    parser.add_argument('--content-per-minute', type=float, default=CONTENT_PER_MINUTE,
+                        help='Most content-creating requests (repositories, pull requests, merges) to make per minute')
+    parser.add_argument('--content-per-hour', type=int, default=CONTENT_PER_HOUR,
+                        help='Most content-creating requests to make in any hour')
+    parser.add_argument('--webhooks', help='Write the webhooks GitHub would send for the data to this file instead of creating it on GitHub')
+    parser.add_argument('--installation-id', type=int, default=DEFAULT_INSTALLATION_ID,
+                        help='GitHub installation id to put in the webhooks, one with a Jira subscription in the app under test')
+    parser.add_argument('--webhook-secret', help='Secret to sign the webhooks with, the first of WEBHOOK_SECRETS by default')
+    parser.add_argument('--level', default='INFO')
+    args = parser.parse_args()
+
+    configure_logging(level=args.level)
+
+    if args.workload:
+        with open(args.workload, 'rb') as f:
+            fingerprint = hashlib.sha256(f.read()).hexdigest()
+        workload = load_workload(args.workload, args.issue_prefix)
+    else:
+        fingerprint = f'{args.num_repos}/{args.num_branches}/{args.num_commits}'
+        workload = parse_workload({'repos': args.num_repos,
+                                   'branches_per_repo': args.num_branches,
+                                   'commits_per_branch': args.num_commits}, args.issue_prefix)
+
+    # A resumed run takes its seed and names from the manifest, and refuses a different workload
+    manifest = Manifest(args.manifest or ':memory:')
+    try:
+        manifest.setting('workload', f'{fingerprint}/{args.issue_prefix}')
+        seed = next((str(s) for s in (args.seed, workload.seed) if s is not None), None)
+        seed = int(manifest.setting('seed', seed) or manifest.setting('seed', str(random.SystemRandom().randrange(2 ** 32))))
+        # Generate a unique repository name based on epoch time
+        base_repo_name = manifest.setting('repo_prefix', args.repo_prefix) or manifest.setting('repo_prefix', f'repo-{int(time.time())}')
+    except ValueError as e:
+        raise SystemExit(str(e))
+    LOG.info('Generating %s repositories "%s-*" with seed %s', workload.repos, base_repo_name, seed)
+
+    settings = Settings(workload, args.workdir, not args.rest)
+    if args.webhooks:
+        return write_webhook_events(args, settings, base_repo_name, seed)
+
+    client = GitHubClient(os.environ.get('GITHUB_TOKEN', ACCESS_TOKEN), args.org,
+                          base_url=args.api_url, git_url=args.git_url, pool_size=max(args.workers, 1),
+                          pacer=ContentPacer(args.content_per_minute, args.content_per_hour))
+
+    if manifest.resumed:
+        LOG.info('Resuming from %s: %s', args.manifest, manifest.counts())
+        reconcile(manifest, client, base_repo_name)
+
+    def build(repo_index: int):
+        repo_name = f'{base_repo_name}-{repo_index}'
+        try:
+            generate_repository(client, settings, manifest, repo_name, random.Random(f'{seed}-{repo_index}'))
+        except Exception as e:
+            LOG.error('ERROR:SKIPPING:REPO %s: %s', repo_name, e)
 
-        # move back up to original directory before next repo
-        os.chdir('..')
+    with client, ThreadPoolExecutor(max_workers=max(args.workers, 1), thread_name_prefix='repo') as executor:
+        list(executor.map(build, range(workload.repos)))
 
-    print('Script completed successfully.')
+    counts = manifest.counts()
+    manifest.close()
+    if counts.get(DONE, 0) < workload.repos:
+        LOG.warning('%s of %s repositories are done, run again with the same --manifest to finish the rest',
+                    counts.get(DONE, 0), workload.repos)
+    LOG.info('Script completed successfully.')
 
 
-except Exception as e:
-    print('An error occurred:', str(e))
+if __name__ == '__main__':
+    main()
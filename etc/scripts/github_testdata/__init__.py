@@ -0,0 +1,8 @@
+"""
+Helpers for generate-github-test-data.py, which seeds a GitHub organization with
+repositories, branches, commits and pull requests for backfill load tests.
+"""
+
+from github_testdata.client import ContentPacer, GitHubClient, PullRequestRef, RateLimitBudget
+from github_testdata.git import LocalRepo
+from github_testdata.history import HistoryBuilder
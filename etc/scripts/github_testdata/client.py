@@ -0,0 +1,311 @@
+"""
+Client for the GitHub REST and GraphQL APIs, shared by all generator workers.
+
+One pooled session serves every worker, and all of them share its view of GitHub's limits:
+
+- The primary rate limit budgets GitHub reports per resource (`X-RateLimit-Remaining`,
+  `X-RateLimit-Reset`, `X-RateLimit-Resource`). Once one is spent, callers wait for its
+  reset instead of failing.
+- The secondary limits on content creation. Mutating requests are queued through a pacer
+  that spaces them out to at most `per_minute`, and to no more than
+  `per_hour` in any hour, so a long run uses the hourly allowance evenly instead of
+  tripping abuse detection and then sitting out the penalty.
+
+Throttled requests (403/429 with `Retry-After`, an exhausted budget or a secondary rate
+limit message) are retried after the wait GitHub asks for, and slow down the pacer; 5xxs
+and connection errors are retried with backoff.
+"""
+
+import logging
+import requests
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from script_common.ratelimit import AdaptiveRateLimiter, parse_retry_after
+from script_common.retry import RetryPolicy
+from script_common.session import DEFAULT_TIMEOUT_SECONDS, create_session
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+LOG = logging.getLogger(__name__)
+
+BASE_URL = 'https://api.github.com'
+GIT_URL = 'https://github.com'
+DEFAULT_POOL_SIZE = 16
+
+# https://docs.github.com/en/rest/using-the-rest-api/rate-limits-for-the-rest-api#about-secondary-rate-limits
+# allows 80 a minute, but also asks for at least a second between mutating requests
+CONTENT_PER_MINUTE = 60
+CONTENT_PER_HOUR = 500
+SECONDARY_LIMIT_BACKOFF = 60
+DEFAULT_GRAPHQL_BATCH = 25
+PAGE_SIZE = 100
+
+MUTATING_METHODS = ('POST', 'PATCH', 'PUT', 'DELETE')
+
+
+class RateLimitBudget:
+    """The primary rate limit, per resource (`core`, `graphql`, ...)."""
+
+    def __init__(self, clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.remaining: Dict[str, int] = {}
+        self.reset_at: Dict[str, float] = {}
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def update(self, headers):
+        remaining, reset = headers.get('X-RateLimit-Remaining'), headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        resource = headers.get('X-RateLimit-Resource', 'core')
+        with self._lock:
+            self.remaining[resource], self.reset_at[resource] = int(remaining), float(reset)
+
+    def delay(self, resource: str = 'core') -> float:
+        with self._lock:
+            if self.remaining.get(resource, 1) > 0:
+                return 0
+            return max(0.0, self.reset_at[resource] - self._clock() + 1)
+
+    def wait(self, resource: str = 'core'):
+        delay = self.delay(resource)
+        if delay > 0:
+            LOG.warning('GitHub %s rate limit exhausted, waiting %.0fs for it to reset', resource, delay)
+            self._sleep(delay)
+
+
+class SlidingWindow:
+    """Admits at most `limit` callers in any `window` seconds."""
+
+    def __init__(self, limit: int, window: float,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        self._sleep = sleep
+        self._admitted = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                while self._admitted and self._admitted[0] <= now - self.window:
+                    self._admitted.popleft()
+                if len(self._admitted) < self.limit:
+                    self._admitted.append(now)
+                    return
+                wait = self._admitted[0] + self.window - now
+            LOG.info('Hourly content creation allowance used up, waiting %.0fs', wait)
+            self._sleep(wait)
+
+
+class ContentPacer:
+    """Queues content-creating requests so they stay within GitHub's secondary limits."""
+
+    def __init__(self, per_minute: float = CONTENT_PER_MINUTE, per_hour: int = CONTENT_PER_HOUR):
+        rate = per_minute / 60
+        self._rate = AdaptiveRateLimiter(target_rate=rate, initial_rate=rate, min_rate=1 / SECONDARY_LIMIT_BACKOFF)
+        self._hourly = SlidingWindow(per_hour, 3600)
+
+    def acquire(self, count: int = 1):
+        for _ in range(count):
+            self._hourly.acquire()
+            self._rate.acquire()
+
+    def record(self, response: requests.Response, latency: float, throttle: Optional[float]):
+        # A secondary limit comes back as a 403, the limiter only backs off for 429s
+        self._rate.record(429 if throttle is not None else response.status_code, latency, throttle)
+
+
+def throttle_delay(response: requests.Response, clock: Callable[[], float] = time.time) -> Optional[float]:
+    """Returns how long GitHub wants us to wait before retrying, or None if it didn't throttle us."""
+    if response.status_code not in (403, 429):
+        return None
+    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+    if retry_after is not None:
+        return retry_after
+    if response.headers.get('X-RateLimit-Remaining') == '0' and response.headers.get('X-RateLimit-Reset'):
+        return max(0.0, float(response.headers['X-RateLimit-Reset']) - clock() + 1)
+    if 'secondary rate limit' in response.text.lower() or response.status_code == 429:
+        return SECONDARY_LIMIT_BACKOFF
+    return None
+
+
+class PullRequestRef(NamedTuple):
+    id: str
+    number: int
+
+
+class GitHubClient:
+    def __init__(self,
+                 token: str,
+                 organization: str,
+                 base_url: str = BASE_URL,
+                 git_url: str = GIT_URL,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 session: requests.Session = None,
+                 timeout=DEFAULT_TIMEOUT_SECONDS,
+                 pacer: Optional[ContentPacer] = None,
+                 retry: Optional[RetryPolicy] = None):
+        self.organization = organization
+        self.base_url = base_url
+        self.git_url = git_url
+        self.session = session or create_session(pool_size)
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        self.session.headers['Accept'] = 'application/vnd.github+json'
+        self.timeout = timeout
+        self.budget = RateLimitBudget()
+        self.pacer = pacer or ContentPacer()
+        self.retry = retry or RetryPolicy()
+
+    @property
+    def graphql_url(self) -> str:
+        # GitHub Enterprise Server serves REST under /api/v3 and GraphQL under /api/graphql
+        if self.base_url.endswith('/v3'):
+            return f'{self.base_url[:-len("/v3")]}/graphql'
+        return f'{self.base_url}/graphql'
+
+    def request(self, method: str, path: str, data: dict = None) -> dict:
+        response = self._send(method, f'{self.base_url}{path}', data, 'core', 1 if method in MUTATING_METHODS else 0)
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    def paginate(self, path: str) -> Iterator[dict]:
+        """Yields the items of a REST list, PAGE_SIZE per request, until a page comes back short."""
+        separator = '&' if '?' in path else '?'
+        page = 1
+        while True:
+            items = self.request('GET', f'{path}{separator}per_page={PAGE_SIZE}&page={page}')
+            yield from items
+            if len(items) < PAGE_SIZE:
+                return
+            page += 1
+
+    def graphql(self, query: str, variables: dict = None, mutations: int = 0) -> dict:
+        """Runs a GraphQL document and returns the whole response, with `data` and any `errors`."""
+        response = self._send('POST', self.graphql_url, {'query': query, 'variables': variables or {}}, 'graphql', mutations)
+        response.raise_for_status()
+        return response.json()
+
+    def _send(self, method: str, url: str, data: Optional[dict], resource: str, content: int) -> requests.Response:
+        attempt = 1
+        while True:
+            self.budget.wait(resource)
+            if content:
+                self.pacer.acquire(content)
+            LOG.debug('%s %s', method, url)
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, json=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retry.max_attempts:
+                    raise
+                delay = self.retry.delay(attempt)
+                LOG.warning('%s %s failed (%s), attempt %s/%s, retrying in %.1fs',
+                            method, url, e.__class__.__name__, attempt, self.retry.max_attempts, delay)
+            else:
+                self.budget.update(response.headers)
+                throttle = throttle_delay(response)
+                if content:
+                    self.pacer.record(response, time.monotonic() - started, throttle)
+                if (throttle is None and response.status_code < 500) or attempt >= self.retry.max_attempts:
+                    return response
+                # GitHub's own wait can be an hour for an exhausted budget, so it isn't capped like the backoff is
+                delay = max(throttle or 0, self.retry.delay(attempt))
+                LOG.warning('%s %s throttled (%s), attempt %s/%s, retrying in %.0fs',
+                            method, url, response.status_code, attempt, self.retry.max_attempts, delay)
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def clone_url(self, repo: str) -> str:
+        return f'{self.git_url}/{self.organization}/{repo}.git'
+
+    def create_repository(self, name: str) -> dict:
+        return self.request('POST', f'/orgs/{self.organization}/repos', {'name': name})
+
+    def list_repositories(self) -> Iterator[dict]:
+        return self.paginate(f'/orgs/{self.organization}/repos?type=all')
+
+    def list_pull_requests(self, repo: str) -> Iterator[dict]:
+        return self.paginate(f'/repos/{self.organization}/{repo}/pulls?state=all')
+
+    def set_default_branch(self, repo: str, branch: str) -> dict:
+        return self.request('PATCH', f'/repos/{self.organization}/{repo}', {'default_branch': branch})
+
+    def commit_timestamp(self, repo: str) -> Optional[int]:
+        """Returns the committer time of the latest commit, or None while the repository is empty."""
+        try:
+            commits = self.request('GET', f'/repos/{self.organization}/{repo}/commits?per_page=1')
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 409:
+                return None
+            raise
+        if not commits:
+            return None
+        committed = datetime.strptime(commits[0]['commit']['committer']['date'], '%Y-%m-%dT%H:%M:%SZ')
+        return int(committed.replace(tzinfo=timezone.utc).timestamp())
+
+    def branch_head(self, repo: str, branch: str) -> Optional[str]:
+        """Returns the commit the branch points at, or None if it doesn't exist."""
+        try:
+            return self.request('GET', f'/repos/{self.organization}/{repo}/git/ref/heads/{branch}')['object']['sha']
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in (404, 409):
+                return None
+            raise
+
+    def dispatch_workflow(self, repo: str, workflow: str, ref: str) -> dict:
+        return self.request('POST', f'/repos/{self.organization}/{repo}/actions/workflows/{workflow}/dispatches', {'ref': ref})
+
+    def create_pull_request(self, repo: str, head: str, title: str, body: str, base: str = 'main') -> dict:
+        return self.request('POST', f'/repos/{self.organization}/{repo}/pulls',
+                            {'title': title, 'body': body, 'head': head, 'base': base})
+
+    def merge_pull_request(self, repo: str, number: int) -> dict:
+        return self.request('PUT', f'/repos/{self.organization}/{repo}/pulls/{number}/merge')
+
+    def create_pull_requests(self, repository_id: str, pulls: Sequence[dict], base: str = 'main') -> List:
+        """
+        Creates pull requests (dicts with head, title and body) in one GraphQL request per
+        batch. Returns a `PullRequestRef` or an error message for each, in order.
+        """
+        inputs = [{'repositoryId': repository_id, 'baseRefName': base, 'headRefName': pull['head'],
+                   'title': pull['title'], 'body': pull['body']} for pull in pulls]
+        return self._mutate('createPullRequest', 'CreatePullRequestInput', inputs, 'pullRequest { id number }',
+                            lambda result: PullRequestRef(result['pullRequest']['id'], result['pullRequest']['number']))
+
+    def merge_pull_requests(self, pull_request_ids: Sequence[str]) -> List:
+        """Merges pull requests by node id. Returns True or an error message for each, in order."""
+        inputs = [{'pullRequestId': pull_request_id} for pull_request_id in pull_request_ids]
+        return self._mutate('mergePullRequest', 'MergePullRequestInput', inputs, 'pullRequest { merged }',
+                            lambda result: bool(result['pullRequest']['merged']))
+
+    def _mutate(self, mutation: str, input_type: str, inputs: List[dict], selection: str, parse) -> List:
+        results = []
+        for start in range(0, len(inputs), DEFAULT_GRAPHQL_BATCH):
+            batch = inputs[start:start + DEFAULT_GRAPHQL_BATCH]
+            # One aliased field per input, so each one succeeds or fails on its own
+            query = 'mutation({}) {{ {} }}'.format(
+                ', '.join(f'$i{i}: {input_type}!' for i in range(len(batch))),
+                ' '.join(f'm{i}: {mutation}(input: $i{i}) {{ {selection} }}' for i in range(len(batch))))
+            response = self.graphql(query, {f'i{i}': item for i, item in enumerate(batch)}, mutations=len(batch))
+
+            data = response.get('data') or {}
+            errors = {error['path'][0]: error['message'] for error in response.get('errors', []) if error.get('path')}
+            for i in range(len(batch)):
+                result = data.get(f'm{i}')
+                results.append(parse(result) if result else errors.get(f'm{i}', f'{mutation} failed: {response.get("errors")}'))
+        return results
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
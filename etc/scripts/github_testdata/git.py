@@ -0,0 +1,37 @@
+"""
+Git commands against one local repository.
+
+Every command runs with the repository as its `cwd` and with an argument list rather
+than a shell string, so several repositories can be built from different threads of the
+same process.
+"""
+
+import logging
+import os
+import subprocess
+
+LOG = logging.getLogger(__name__)
+
+
+class LocalRepo:
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def init(cls, path: str, remote_url: str) -> 'LocalRepo':
+        os.makedirs(path)
+        repo = cls(path)
+        # History is written with fast-import (see github_testdata.history), so no working tree is needed
+        repo.git('init', '--bare')
+        repo.git('remote', 'add', 'origin', remote_url)
+        return repo
+
+    def git(self, *args: str) -> str:
+        LOG.debug('%s: git %s', self.path, ' '.join(args))
+        process = subprocess.run(['git', *args], cwd=self.path, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f'git {args[0]} failed in {self.path}: {process.stderr.strip()}')
+        return process.stdout
+
+    def push(self, *refspecs: str):
+        self.git('push', 'origin', *refspecs)
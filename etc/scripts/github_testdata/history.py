@@ -0,0 +1,75 @@
+"""
+Local history building with `git fast-import`.
+
+Commits are streamed into a single `git fast-import` process per repository instead of
+running `git add` and `git commit` for each one, and blobs are written inline, so the
+whole history of a repository is built without a working copy or any further process
+spawns. The result is pushed with one `git push` of every branch.
+"""
+
+import logging
+import subprocess
+import time
+from github_testdata.git import LocalRepo
+from typing import Dict, Optional
+
+LOG = logging.getLogger(__name__)
+
+
+class HistoryBuilder:
+    def __init__(self, repo: LocalRepo, timestamp: Optional[int] = None):
+        self.repo = repo
+        self.identity = repo.git('var', 'GIT_COMMITTER_IDENT').rsplit(' ', 2)[0]
+        self.timestamp = int(time.time()) if timestamp is None else timestamp
+        self.commits = 0
+        self._tips: Dict[str, int] = {}
+        self._process = subprocess.Popen(['git', 'fast-import', '--quiet', '--done'],
+                                         cwd=repo.path, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def commit(self, branch: str, message: str, files: Dict[str, str], start_point: Optional[str] = None):
+        """
+        Adds a commit with `files` to `branch`. The first commit on a branch is based on
+        `start_point`, and starts a new root if that is None.
+        """
+        self.commits += 1
+        mark = self.commits
+        out = [f'commit refs/heads/{branch}\n'.encode(),
+               f'mark :{mark}\n'.encode(),
+               f'committer {self.identity} {self.timestamp} +0000\n'.encode(),
+               _data(message.encode('utf-8'))]
+        if branch not in self._tips and start_point is not None:
+            out.append(f'from :{self._tips[start_point]}\n'.encode())
+        for path, content in files.items():
+            out.append(f'M 100644 inline {path}\n'.encode('utf-8'))
+            out.append(_data(content.encode('utf-8')))
+        self._process.stdin.write(b''.join(out))
+        self._tips[branch] = mark
+
+    @property
+    def branches(self):
+        return list(self._tips)
+
+    def close(self):
+        self._process.stdin.write(b'done\n')
+        self._process.stdin.close()
+        stderr = self._process.stderr.read()
+        if self._process.wait() != 0:
+            raise RuntimeError(f'git fast-import failed in {self.repo.path}: {stderr.decode().strip()}')
+        LOG.debug('Imported %s commits on %s branches into %s', self.commits, len(self._tips), self.repo.path)
+
+    def abort(self):
+        self._process.kill()
+        self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _data(payload: bytes) -> bytes:
+    return b'data %d\n%s\n' % (len(payload), payload)
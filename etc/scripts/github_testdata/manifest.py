@@ -0,0 +1,203 @@
+"""
+Manifest of what a generator run has created, so an interrupted run can be resumed.
+
+The manifest is a SQLite database (WAL mode, like g4j_ops.checkpoint) with a row per
+repository, recording whether it has been created, pushed and finished, and a row per pull
+request with its number, node id, whether it was merged and how many workflow runs were
+dispatched after the merge. Every step is recorded as soon as GitHub has confirmed it.
+
+The run's seed, repository prefix and workload are stored too, so a resume regenerates
+exactly the same plan. History is rebuilt with the timestamp recorded when the repository
+was created, which gives the same commit ids as the first attempt, so pushing it again is
+a no-op for branches that already made it.
+
+Before resuming, `reconcile` lists the organization's repositories and the pull requests
+of unfinished repositories in bulk, and records whatever GitHub has that the manifest
+missed because the run stopped between the request and the write. Repositories it finds are
+recorded as created, whatever they hold, with the time of any commit already pushed, and
+only move on to pushed once their history has been pushed again and `main` is the default
+branch at the expected commit.
+
+    $ python3 -m github_testdata.manifest manifest.db
+"""
+
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+LOG = logging.getLogger(__name__)
+
+CREATED = 'created'
+PUSHED = 'pushed'
+DONE = 'done'
+
+SCHEMA = '''
+create table if not exists run (
+    name text primary key,
+    value text not null
+);
+create table if not exists repos (
+    name text primary key,
+    node_id text,
+    state text not null,
+    created_at integer not null,
+    updated_at real not null
+);
+create table if not exists pulls (
+    repo text not null,
+    branch text not null,
+    number integer not null,
+    node_id text,
+    merged integer not null default 0,
+    workflow_runs integer not null default 0,
+    updated_at real not null,
+    primary key (repo, branch)
+);
+'''
+
+
+class RepoRecord(NamedTuple):
+    name: str
+    node_id: Optional[str]
+    state: str
+    created_at: int
+
+
+class PullRecord(NamedTuple):
+    branch: str
+    number: int
+    node_id: Optional[str]
+    merged: bool
+    workflow_runs: int
+
+
+class Manifest:
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('pragma journal_mode=wal')
+        self._conn.execute('pragma synchronous=full')
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def resumed(self) -> bool:
+        with self._lock:
+            return self._conn.execute('select 1 from repos limit 1').fetchone() is not None
+
+    def setting(self, name: str, value: Optional[str]) -> Optional[str]:
+        """
+        Returns the value the run was started with, storing `value` if this is the first run.
+        A different `value` on a later run is an error, None takes the stored one.
+        """
+        with self._lock:
+            row = self._conn.execute('select value from run where name = ?', (name,)).fetchone()
+            if row is None:
+                if value is not None:
+                    self._conn.execute('insert into run (name, value) values (?, ?)', (name, value))
+                return value
+        if value is not None and value != row[0]:
+            raise ValueError(f'Manifest {self.path} is for {name} {row[0]}, not {value}')
+        return row[0]
+
+    def repo(self, name: str) -> Optional[RepoRecord]:
+        with self._lock:
+            row = self._conn.execute('select name, node_id, state, created_at from repos where name = ?', (name,)).fetchone()
+        return RepoRecord(*row) if row else None
+
+    def repos(self, state: str) -> List[RepoRecord]:
+        with self._lock:
+            rows = self._conn.execute('select name, node_id, state, created_at from repos where state = ?', (state,)).fetchall()
+        return [RepoRecord(*row) for row in rows]
+
+    def record_repo(self, name: str, state: str, node_id: Optional[str] = None, created_at: Optional[int] = None) -> RepoRecord:
+        with self._lock:
+            self._conn.execute('''
+                insert into repos (name, node_id, state, created_at, updated_at) values (?, ?, ?, ?, ?)
+                on conflict (name) do update set
+                    node_id = coalesce(excluded.node_id, node_id),
+                    state = excluded.state,
+                    updated_at = excluded.updated_at
+            ''', (name, node_id, state, created_at or int(time.time()), time.time()))
+        return self.repo(name)
+
+    def pulls(self, repo: str) -> Dict[str, PullRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                'select branch, number, node_id, merged, workflow_runs from pulls where repo = ?', (repo,)).fetchall()
+        return {row[0]: PullRecord(row[0], row[1], row[2], bool(row[3]), row[4]) for row in rows}
+
+    def record_pull(self, repo: str, branch: str, number: int, node_id: Optional[str], merged: bool = False):
+        with self._lock:
+            self._conn.execute('''
+                insert into pulls (repo, branch, number, node_id, merged, updated_at) values (?, ?, ?, ?, ?, ?)
+                on conflict (repo, branch) do update set
+                    number = excluded.number,
+                    node_id = coalesce(excluded.node_id, node_id),
+                    merged = max(merged, excluded.merged),
+                    updated_at = excluded.updated_at
+            ''', (repo, branch, number, node_id, int(merged), time.time()))
+
+    def record_merge(self, repo: str, branch: str):
+        with self._lock:
+            self._conn.execute('update pulls set merged = 1, updated_at = ? where repo = ? and branch = ?',
+                               (time.time(), repo, branch))
+
+    def record_workflow_runs(self, repo: str, branch: str, count: int):
+        with self._lock:
+            self._conn.execute('update pulls set workflow_runs = ?, updated_at = ? where repo = ? and branch = ?',
+                               (count, time.time(), repo, branch))
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute('select state, count(*) from repos group by state').fetchall())
+            pulls, merged = self._conn.execute('select count(*), coalesce(sum(merged), 0) from pulls').fetchone()
+        counts.update(pulls=pulls, merged=merged)
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def reconcile(manifest: Manifest, client, repo_prefix: str):
+    """Records repositories and pull requests that exist on GitHub but not in the manifest."""
+    found_repos = found_pulls = 0
+    for repository in client.list_repositories():
+        if repository['name'].startswith(f'{repo_prefix}-') and manifest.repo(repository['name']) is None:
+            # Content doesn't mean the push finished or the default branch was set. Pushing again is
+            # a no-op for what made it, as long as the history is rebuilt with the time it was committed at
+            created_at = client.commit_timestamp(repository['name']) if repository.get('size') else None
+            manifest.record_repo(repository['name'], CREATED, node_id=repository['node_id'], created_at=created_at)
+            found_repos += 1
+
+    for record in manifest.repos(PUSHED):
+        known = manifest.pulls(record.name)
+        for pull in client.list_pull_requests(record.name):
+            branch, merged = pull['head']['ref'], pull.get('merged_at') is not None
+            if branch not in known or (merged and not known[branch].merged):
+                manifest.record_pull(record.name, branch, pull['number'], pull.get('node_id'), merged)
+                found_pulls += 1
+
+    LOG.info('Reconciled manifest with GitHub: found %s unrecorded repositories and %s unrecorded pull request changes',
+             found_repos, found_pulls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show what a generator run has created so far')
+    parser.add_argument('manifest')
+    args = parser.parse_args()
+
+    manifest = Manifest(args.manifest)
+    for name in ('seed', 'repo_prefix', 'workload'):
+        print(f'{name}: {manifest.setting(name, None)}')
+    for state, count in sorted(manifest.counts().items()):
+        print(f'{state}: {count}')
+    manifest.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Synthetic GitHub webhook events, for load testing the app without github.com.
+
+`EventFactory` builds `push`, `create`, `pull_request`, `workflow_run` and
+`deployment_status` payloads for one repository, with the fields the app's webhook
+handlers read (see test/fixtures for real examples). Events are stored one per line as
+JSON, with the exact body and its `X-Hub-Signature-256` signature, so a replay sends the
+same bytes the signature was computed over.
+"""
+
+import hashlib
+import hmac
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import IO, Iterator, List, NamedTuple, Optional, Sequence
+
+# GitHub lists at most 20 commits in a push payload
+MAX_PUSH_COMMITS = 20
+WORKFLOW_NAME = 'CI'
+WORKFLOW_PATH = '.github/workflows/main.yml'
+DEPLOYMENT_ENVIRONMENT = 'Production'
+
+
+class WebhookEvent(NamedTuple):
+    name: str
+    delivery: str
+    body: bytes
+    signature: Optional[str] = None
+
+
+class Commit(NamedTuple):
+    sha: str
+    message: str
+    file_name: str
+
+
+def sign(body: bytes, secret: str) -> str:
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def write_events(f: IO[str], events: Iterator[WebhookEvent], secret: str) -> int:
+    count = 0
+    for event in events:
+        f.write(json.dumps({
+            'event': event.name,
+            'delivery': event.delivery,
+            'signature': sign(event.body, secret),
+            'body': event.body.decode('utf-8'),
+        }) + '\n')
+        count += 1
+    return count
+
+
+def read_events(f: IO[str]) -> Iterator[WebhookEvent]:
+    for line in f:
+        if line.strip():
+            record = json.loads(line)
+            yield WebhookEvent(record['event'], record['delivery'], record['body'].encode('utf-8'), record.get('signature'))
+
+
+class EventFactory:
+    def __init__(self,
+                 rng: random.Random,
+                 installation_id: int,
+                 organization: str,
+                 repo_name: str,
+                 repo_id: int,
+                 started_at: datetime = None):
+        self.rng = rng
+        self.installation_id = installation_id
+        self.repository = {
+            'id': repo_id,
+            'node_id': f'R_{repo_id}',
+            'name': repo_name,
+            'full_name': f'{organization}/{repo_name}',
+            'html_url': f'https://github.com/{organization}/{repo_name}',
+            'url': f'https://api.github.com/repos/{organization}/{repo_name}',
+            'default_branch': 'main',
+            'private': True,
+            'owner': {'login': organization, 'type': 'Organization'},
+        }
+        self.sender = {'login': 'test-data-bot', 'type': 'User', 'id': 1}
+        self._clock = started_at or datetime.now(timezone.utc).replace(microsecond=0)
+
+    def sha(self) -> str:
+        return '%040x' % self.rng.getrandbits(160)
+
+    def _now(self) -> str:
+        # Every event happens a second after the previous one
+        self._clock += timedelta(seconds=1)
+        return self._clock.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def _event(self, name: str, payload: dict) -> WebhookEvent:
+        payload.update(repository=self.repository, sender=self.sender, installation={'id': self.installation_id})
+        delivery = str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+        return WebhookEvent(name, delivery, json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+    def create(self, branch: str) -> WebhookEvent:
+        return self._event('create', {'ref': branch, 'ref_type': 'branch', 'master_branch': 'main', 'pusher_type': 'user'})
+
+    def push(self, branch: str, commits: Sequence[Commit], before: str) -> WebhookEvent:
+        timestamp = self._now()
+        return self._event('push', {
+            'ref': f'refs/heads/{branch}',
+            'before': before,
+            'after': commits[-1].sha,
+            'created': False,
+            'deleted': False,
+            'commits': [{
+                'id': commit.sha,
+                'message': commit.message,
+                'timestamp': timestamp,
+                'url': f'{self.repository["html_url"]}/commit/{commit.sha}',
+                'author': {'name': 'test-data-bot', 'email': 'test-data-bot@example.com', 'username': 'test-data-bot'},
+                'added': [commit.file_name],
+                'modified': [],
+                'removed': [],
+            } for commit in commits[-MAX_PUSH_COMMITS:]],
+            'head_commit': {'id': commits[-1].sha, 'message': commits[-1].message, 'timestamp': timestamp},
+        })
+
+    def pull_request(self, action: str, number: int, branch: str, head_sha: str, title: str, body: str,
+                     merged: bool = False) -> WebhookEvent:
+        timestamp = self._now()
+        repo = {key: self.repository[key] for key in ('id', 'node_id', 'name', 'full_name', 'html_url', 'private')}
+        return self._event('pull_request', {
+            'action': action,
+            'number': number,
+            'pull_request': {
+                'id': self.repository['id'] * 10_000 + number,
+                'number': number,
+                'state': 'closed' if action == 'closed' else 'open',
+                'title': title,
+                'body': body,
+                'html_url': f'{self.repository["html_url"]}/pull/{number}',
+                'comments': 0,
+                'draft': False,
+                'merged': merged,
+                'merged_at': timestamp if merged else None,
+                'created_at': timestamp,
+                'updated_at': timestamp,
+                'user': self.sender,
+                'head': {'ref': branch, 'sha': head_sha, 'repo': repo},
+                'base': {'ref': 'main', 'repo': repo},
+            },
+        })
+
+    def workflow_run(self, run_id: int, run_number: int, branch: str, head_commit: Commit) -> WebhookEvent:
+        timestamp = self._now()
+        return self._event('workflow_run', {
+            'action': 'completed',
+            'workflow_run': {
+                'id': run_id,
+                'name': WORKFLOW_NAME,
+                'head_branch': branch,
+                'head_sha': head_commit.sha,
+                'head_commit': {
+                    'id': head_commit.sha,
+                    'message': head_commit.message,
+                    'timestamp': timestamp,
+                    'author': {'name': 'test-data-bot', 'email': 'test-data-bot@example.com'},
+                },
+                'pull_requests': [],
+                'run_number': run_number,
+                'event': 'push',
+                'status': 'completed',
+                'conclusion': 'success',
+                'workflow_id': self.repository['id'],
+                'html_url': f'{self.repository["html_url"]}/actions/runs/{run_id}',
+                'created_at': timestamp,
+                'updated_at': timestamp,
+                'repository': {'name': self.repository['name'], 'owner': self.repository['owner']},
+            },
+            'workflow': {'id': self.repository['id'], 'name': WORKFLOW_NAME, 'path': WORKFLOW_PATH, 'state': 'active'},
+        })
+
+    def deployment_status(self, deployment_id: int, sha: str, ref: str = 'main', state: str = 'success') -> WebhookEvent:
+        timestamp = self._now()
+        return self._event('deployment_status', {
+            'action': 'created',
+            'deployment_status': {
+                'id': deployment_id * 10 + 1,
+                'state': state,
+                'environment': DEPLOYMENT_ENVIRONMENT,
+                'description': '',
+                'creator': self.sender,
+                'target_url': f'{self.repository["html_url"]}/actions',
+                'created_at': timestamp,
+                'updated_at': timestamp,
+            },
+            'deployment': {
+                'id': deployment_id,
+                'sha': sha,
+                'ref': ref,
+                'task': 'deploy',
+                'environment': DEPLOYMENT_ENVIRONMENT,
+                'original_environment': DEPLOYMENT_ENVIRONMENT,
+                'description': '',
+                'creator': self.sender,
+                'created_at': timestamp,
+                'updated_at': timestamp,
+            },
+        })
+
+
+def push_events(factory: EventFactory, branch: str, commits: List[Commit], before: str) -> Iterator[WebhookEvent]:
+    """One push per MAX_PUSH_COMMITS commits, as if they had been pushed in chunks."""
+    for start in range(0, len(commits), MAX_PUSH_COMMITS):
+        chunk = commits[start:start + MAX_PUSH_COMMITS]
+        yield factory.push(branch, chunk, before)
+        before = chunk[-1].sha
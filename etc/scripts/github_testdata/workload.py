@@ -0,0 +1,127 @@
+"""
+Workload specs for the test-data generator: how many of everything to create, drawn from
+seeded distributions so the same spec and seed always describe the same dataset.
+
+A spec is a JSON or YAML (needs PyYAML) object; everything but `repos` is optional:
+
+    seed: 42
+    repos: 200
+    branches_per_repo: {distribution: uniform, min: 1, max: 20}
+    commits_per_branch: {distribution: pareto, alpha: 1.3, min: 1, max: 5000}
+    merge_ratio: 0.6
+    issue_keys: {prefix: ARC, cardinality: 300, skew: 1.1}
+    workflow_runs_per_merge: {distribution: poisson, mean: 2}
+    file_sizes:
+      - {weight: 0.9, min: 10, max: 2000}
+      - {weight: 0.1, min: 100000, max: 1000000}
+
+Counts are either a number or a distribution: `constant` (value), `uniform` (min, max),
+`lognormal` (mu, sigma), `pareto` (alpha, min; heavy tailed), `poisson` (mean) or
+`geometric` (mean), each optionally clamped to `min`/`max`. Issue keys are drawn from
+`cardinality` distinct numbers starting at `start`; a `skew` above 0 makes some keys come
+up far more often than others, following a Zipf law with that exponent.
+"""
+
+import bisect
+import itertools
+import json
+import math
+import random
+from typing import Callable, List, NamedTuple, Union
+
+Sampler = Callable[[random.Random], int]
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Knuth's method for small means, a rounded normal approximation for large ones
+    if mean > 50:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def parse_distribution(spec: Union[int, float, dict]) -> Sampler:
+    if isinstance(spec, (int, float)):
+        return lambda rng: int(spec)
+
+    kind = spec.get('distribution', 'constant')
+    low, high = spec.get('min', 0), spec.get('max', math.inf)
+    if kind == 'constant':
+        draw = lambda rng: spec['value']
+    elif kind == 'uniform':
+        draw = lambda rng: rng.randint(spec['min'], spec['max'])
+    elif kind == 'lognormal':
+        draw = lambda rng: rng.lognormvariate(spec['mu'], spec['sigma'])
+    elif kind == 'pareto':
+        draw = lambda rng: spec.get('min', 1) * rng.paretovariate(spec['alpha'])
+    elif kind == 'poisson':
+        draw = lambda rng: _poisson(rng, spec['mean'])
+    elif kind == 'geometric':
+        draw = lambda rng: math.floor(math.log(1 - rng.random()) / math.log(1 - 1 / (spec['mean'] + 1)))
+    else:
+        raise ValueError(f'Unknown distribution "{kind}"')
+    return lambda rng: int(min(high, max(low, round(draw(rng)))))
+
+
+class IssueKeys:
+    def __init__(self, prefix: str, cardinality: int = 900, start: int = 100, skew: float = 0.0):
+        self.prefix = prefix
+        self.start = start
+        self.cardinality = cardinality
+        self._cumulative = list(itertools.accumulate(1 / rank ** skew for rank in range(1, cardinality + 1))) if skew else None
+
+    def draw(self, rng: random.Random) -> str:
+        if self._cumulative is None:
+            return f'{self.prefix}-{self.start + rng.randrange(self.cardinality)}'
+        rank = bisect.bisect_left(self._cumulative, rng.random() * self._cumulative[-1])
+        return f'{self.prefix}-{self.start + min(rank, self.cardinality - 1)}'
+
+
+class FileSizes:
+    """A weighted mix of uniform size ranges, in characters."""
+
+    def __init__(self, ranges: List[dict]):
+        self.ranges = [(r['min'], r['max']) for r in ranges]
+        self.weights = [r.get('weight', 1) for r in ranges]
+
+    def draw(self, rng: random.Random) -> int:
+        low, high = rng.choices(self.ranges, self.weights)[0] if len(self.ranges) > 1 else self.ranges[0]
+        return rng.randint(low, high)
+
+
+class Workload(NamedTuple):
+    repos: int
+    branches_per_repo: Sampler
+    commits_per_branch: Sampler
+    merge_ratio: float
+    issue_keys: IssueKeys
+    workflow_runs_per_merge: Sampler
+    file_sizes: FileSizes
+    seed: int = None
+
+
+def parse_workload(spec: dict, issue_prefix: str = 'ARC') -> Workload:
+    keys = spec.get('issue_keys', {})
+    return Workload(
+        repos=spec['repos'],
+        branches_per_repo=parse_distribution(spec.get('branches_per_repo', 1)),
+        commits_per_branch=parse_distribution(spec.get('commits_per_branch', 1)),
+        merge_ratio=spec.get('merge_ratio', 0.5),
+        issue_keys=IssueKeys(keys.get('prefix', issue_prefix), keys.get('cardinality', 900), keys.get('start', 100), keys.get('skew', 0.0)),
+        workflow_runs_per_merge=parse_distribution(spec.get('workflow_runs_per_merge', 0)),
+        file_sizes=FileSizes(spec.get('file_sizes', [{'min': 10, 'max': 20}])),
+        seed=spec.get('seed'))
+
+
+def load_workload(path: str, issue_prefix: str = 'ARC') -> Workload:
+    with open(path) as f:
+        if path.endswith(('.yml', '.yaml')):
+            import yaml
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    return parse_workload(spec, issue_prefix)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+Script to trigger Backfill of the subscriptions the resync endpoint selects by itself.
+
+No CSV export needed: the subscriptions are selected on the server by sync status and how
+long they have been inactive, and started a page of --page-size at a time with limit/offset.
+Every installation started is recorded in the checkpoint journal (see g4j_ops/checkpoint.py)
+together with the page cursor, so the script can be stopped and resumed. Use a new --output
+for every different filter.
+
+Starting a sync moves a subscription to PENDING and updates it, which also moves it to the
+front of the list the endpoint pages through (most recently updated first). With
+--inactive-for, or with --status leaving out PENDING, the subscriptions started drop out of
+the filter, so every page is requested from offset 0 until the filter comes back empty.
+Otherwise they stay in it, ahead of the rest, and the offset moves on by a page each time.
+
+Paging like that is not stable: the endpoint pages with limit/offset, most recently updated
+first, so any subscription updated by something else during the run, like webhooks or a
+backfill, moves between pages. Subscriptions can then be skipped or resynced twice. Filters
+that drain don't have this problem. For a complete pass over subscriptions that stay in the
+filter, use resync-from-csv.py --source postgres, which pages by installation id.
+
+--backlog-queue-url or --backlog-database-url with --backlog-high hold the next page while the
+backfill backlog is too deep, as in resync-from-csv.py.
+
+Running the script:
+    $ python3 ./resync-by-filter.py --env [ dev | staging | prod ] --status [ FAILED PENDING ACTIVE COMPLETE ] --inactive-for [ seconds ] --output [ checkpoint-file-name.db ]
+Example, resync everything FAILED and inactive for an hour:
+    $ python3 ./resync-by-filter.py --env prod --status FAILED --inactive-for 3600 --sync-type partial --target-tasks --output failed.db
+
+First time setup:
+
+1. virtualenv env -p python3
+2. source env/bin/activate
+3. pip install requests
+"""
+
+import argparse
+import logging
+import sys
+from g4j_ops import (
+    TOKEN_PROVIDER,
+    AdminClient,
+    add_common_arguments,
+    add_resync_arguments,
+    add_throttle_arguments,
+    configure_logging,
+    create_client,
+)
+from g4j_ops.backpressure import add_backpressure_arguments, create_backpressure
+from g4j_ops.checkpoint import SUCCESS, Checkpoint
+from g4j_ops.metrics import METRICS, add_metrics_arguments, start_reporting
+from typing import List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+# What the endpoint selects when no statusTypes are given
+DEFAULT_STATUS_TYPES = ('FAILED', 'PENDING', 'ACTIVE')
+
+
+def drains(status_types: Optional[List[str]], inactive_for: Optional[int]) -> bool:
+    """Whether the subscriptions a page starts leave the filter, as they become PENDING and active."""
+    return bool(inactive_for) or 'PENDING' not in (status_types or DEFAULT_STATUS_TYPES)
+
+
+def resync_page(client: AdminClient, args: argparse.Namespace, offset: int, limit: int) -> Optional[List[Tuple[int, str]]]:
+    """Starts a page of the subscriptions the filter selects, and returns them as (gitHubInstallationId, jiraHost)."""
+    response = client.resync(None,
+                             sync_type=args.sync_type,
+                             status_types=args.status,
+                             target_tasks=args.target_tasks,
+                             commits_from_date=args.commits_from_date,
+                             limit=limit,
+                             offset=offset,
+                             inactive_for_seconds=args.inactive_for)
+    if not response.ok:
+        LOG.error('Resync of the page at offset %s failed (%s): %s', offset, response.status_code, response.text)
+        return None
+    # An installation has a subscription per Jira site, so the installation id alone doesn't identify one
+    return [(subscription['gitHubInstallationId'], subscription['jiraHost']) for subscription in response.json()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_common_arguments(parser)
+    add_resync_arguments(parser)
+    parser.set_defaults(status=None)
+    parser.add_argument('--inactive-for', type=int, help='Only resync subscriptions not updated for this many seconds')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='How many subscriptions to start per request')
+    parser.add_argument('--max-installations', type=int, help='Stop after starting this many subscriptions')
+    parser.add_argument('--output', required=True, help='Checkpoint journal to record progress in and resume from')
+    add_throttle_arguments(parser)
+    add_backpressure_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.status and not args.inactive_for:
+        parser.error('Pass --status and/or --inactive-for, or use resync-from-csv.py to resync given installations')
+
+    configure_logging(level=args.level)
+
+    reporter = start_reporting(args)
+    client = create_client(args)
+    backpressure = create_backpressure(args)
+    checkpoint = Checkpoint(args.output)
+    draining = drains(args.status, args.inactive_for)
+    offset = 0 if draining else checkpoint.input_offset
+    if not draining:
+        LOG.warning('Paging by offset over subscriptions ordered by their last update: any updated during the run '
+                    'may be skipped or resynced twice. resync-from-csv.py --source postgres pages by installation id')
+    LOG.info('Resyncing subscriptions with status %s inactive for %ss, %s from offset %s',
+             args.status or list(DEFAULT_STATUS_TYPES), args.inactive_for or 0,
+             'draining the filter' if draining else 'paging through the filter', offset)
+
+    started = set()
+    failed = False
+    while args.max_installations is None or len(started) < args.max_installations:
+        limit = args.page_size if args.max_installations is None else min(args.page_size, args.max_installations - len(started))
+        if backpressure:
+            backpressure.wait()
+        page = resync_page(client, args, offset, limit)
+        if page is None:
+            failed = True
+            break
+
+        if draining and started.intersection(page):
+            # Subscriptions that didn't leave the filter would come back on every page
+            LOG.error('Subscriptions started by this run were selected again, stopping: %s', sorted(started.intersection(page)))
+            failed = True
+            break
+        started.update(page)
+        checkpoint.record(sorted({installation_id for installation_id, _ in page}), SUCCESS)
+        METRICS.count_items(SUCCESS, len(page))
+        if not draining:
+            offset += len(page)
+            checkpoint.set_input_offset(offset)
+        LOG.info('Started %s syncs, %s so far', len(page), len(started))
+
+        if len(page) < limit:
+            break
+        if args.sleep:
+            METRICS.sleep(args.sleep)
+
+    if backpressure:
+        backpressure.log()
+    checkpoint.close()
+    client.close()
+    TOKEN_PROVIDER.log_stats()
+    reporter.finish(started=len(started))
+
+    LOG.info('Started %s syncs in total', len(started))
+    if failed:
+        LOG.error('Run again with the same --output to carry on')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
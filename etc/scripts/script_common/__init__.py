@@ -0,0 +1,9 @@
+"""
+Helpers shared by every package in etc/scripts: the admin scripts (g4j_ops), the GitHub test
+data generator (github_testdata) and the benchmarks. Nothing here knows about either API.
+"""
+
+from script_common.logs import LOG_LEVELS, configure_logging
+from script_common.ratelimit import AdaptiveRateLimiter, parse_retry_after
+from script_common.retry import RetryPolicy, is_retryable_status
+from script_common.session import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT_SECONDS, create_session
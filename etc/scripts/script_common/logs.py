@@ -0,0 +1,21 @@
+"""
+Logging setup shared by the scripts.
+"""
+
+import logging
+import sys
+
+LOG_LEVELS = ('INFO', 'ERROR', 'WARNING', 'DEBUG', 'CRITICAL')
+
+
+def configure_logging(level='DEBUG'):
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    ch = logging.StreamHandler(sys.stdout)
+    ch.setFormatter(formatter)
+    ch.setLevel(level)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(ch)
@@ -0,0 +1,97 @@
+"""
+Adaptive client-side rate limiting.
+
+A token bucket paces requests, and its rate is tuned with AIMD (additive increase,
+multiplicative decrease): every fast 2xx response nudges the rate up towards the target,
+while 429s, 5xxs, connection failures and responses slower than the latency SLO halve it.
+A `Retry-After` header pauses all callers until the server says it is ready again.
+"""
+
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MIN_RATE = 0.05
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Returns the number of seconds to wait for a Retry-After header value."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    def __init__(self,
+                 target_rate: float,
+                 max_latency: Optional[float] = None,
+                 initial_rate: Optional[float] = None,
+                 min_rate: float = DEFAULT_MIN_RATE,
+                 increase_step: Optional[float] = None,
+                 decrease_factor: float = 0.5,
+                 burst: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.target_rate = target_rate
+        self.max_latency = max_latency
+        self.min_rate = min(min_rate, target_rate)
+        self.rate = initial_rate or max(self.min_rate, target_rate / 4)
+        self.increase_step = increase_step or max(target_rate / 20, 0.01)
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = burst
+        self._updated_at = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until the caller may send its next request."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def record(self, status_code: Optional[int], latency: float, retry_after: Optional[float] = None):
+        """Feeds back the outcome of a request; `status_code` is None for connection failures."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            throttled = status_code is None or status_code == 429 or status_code >= 500
+            slow = self.max_latency is not None and latency > self.max_latency
+            if throttled or slow:
+                previous = self.rate
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._tokens = min(self._tokens, 0)
+                LOG.info('Backing off from %.2f to %.2f requests/s (status %s, %.2fs latency%s)',
+                         previous, self.rate, status_code, latency,
+                         f', retry after {retry_after:.0f}s' if retry_after else '')
+            elif status_code < 400:
+                self.rate = min(self.target_rate, self.rate + self.increase_step)
+                LOG.debug('Rate now %.2f requests/s', self.rate)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
@@ -0,0 +1,66 @@
+"""
+Retrying of transient HTTP failures.
+
+Only failures that are worth repeating are retried: connection errors and timeouts, 429s
+and 5xxs. Everything else, in particular a 4xx caused by the request itself, is returned to
+the caller straight away (see g4j_ops.splitter for what the admin scripts do with those).
+"""
+
+import logging
+import random
+import requests
+import time
+from script_common.ratelimit import parse_retry_after
+from typing import Callable, Optional
+
+LOG = logging.getLogger(__name__)
+
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter, honouring Retry-After as a minimum delay."""
+
+    def __init__(self,
+                 max_attempts: int = 5,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 sleep: Callable[[float], None] = time.sleep,
+                 rand: Callable[[], float] = random.random):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._rand = rand
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * self._rand()
+        return max(backoff, min(retry_after or 0, self.max_delay))
+
+    def call(self, send: Callable[[], requests.Response], description: str = 'request') -> requests.Response:
+        """
+        Calls `send` until it returns a non-retryable response or attempts run out. The last
+        response is returned, and the last connection error re-raised, once attempts run out.
+        """
+        attempt = 1
+        while True:
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_attempts:
+                    raise
+                delay = self.delay(attempt)
+                LOG.warning('%s failed (%s), attempt %s/%s, retrying in %.1fs',
+                            description, e.__class__.__name__, attempt, self.max_attempts, delay)
+            else:
+                if not is_retryable_status(response.status_code) or attempt >= self.max_attempts:
+                    return response
+                delay = self.delay(attempt, parse_retry_after(response.headers.get('Retry-After')))
+                LOG.warning('%s failed (%s), attempt %s/%s, retrying in %.1fs',
+                            description, response.status_code, attempt, self.max_attempts, delay)
+                response.close()
+
+            self._sleep(delay)
+            attempt += 1
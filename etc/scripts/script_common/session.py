@@ -0,0 +1,32 @@
+"""
+The tuned `requests.Session` the scripts share: keep-alive connections in a pool sized for
+concurrent callers, with urllib3 retrying failed connection attempts. Transient failures
+of requests that did reach the server are left to a `RetryPolicy` on top of that.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT_SECONDS = (5, 120)
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    # Only retries connections that never reached the server; RetryPolicy deals with the rest
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.5,
+        allowed_methods=None,
+        raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Content-Type'] = 'application/json'
+    return session
@@ -4,17 +4,25 @@
 Script to set isConfigured value against Jira App properties from CSV of JiraHosts.
 
 Takes an jiraHosts.csv with jiraHosts.
-Keeps track of processed entries in a separate file, so that script can be stopped
-and resumed without having to change the input file.
+Keeps track of processed entries in a checkpoint journal (see g4j_ops/checkpoint.py), so
+that script can be stopped and resumed without having to change the input file.
 
 Input file format:
     jiraHost
     https://www.test.atlassian.net
 
 Running the script:
-    $ python3 ./sync-configured-state-from-csv.py --env [ dev | staging | prod ] --sleep [ sleep-duration ] --input [ input-file-name.csv ] --output [ output-file-name.csv ]
+    $ python3 ./sync-configured-state-from-csv.py --env [ dev | staging | prod ] --sleep [ sleep-duration ] --input [ input-file-name.csv ] --output [ checkpoint-file-name.db ]
 Example
-    $ python3 ./sync-configured-state-from-csv.py --env dev --sleep 10 --input hosts.csv --output configurationOutput.csv
+    $ python3 ./sync-configured-state-from-csv.py --env dev --sleep 10 --input hosts.csv --output configurationOutput.db
+
+jiraHosts the API rejects are written to a quarantine file instead of stopping the run.
+
+--shard i/N splits the jiraHosts between several runs, each with its own journal next to
+--output, see g4j_ops/shard.py. --rate-budget keeps them within one request rate together.
+
+--batchsize auto tunes the batch size to the latency measured as the run goes, see
+g4j_ops/batchsize.py.
 
 First time setup:
 
@@ -24,165 +32,84 @@ First time setup:
 """
 
 import argparse
-import csv
 import logging
 import requests
-import subprocess
 import sys
-import time
-import json
-from dataclasses import dataclass
-from requests import Request
-from requests.auth import AuthBase
-from typing import NamedTuple
+from g4j_ops import (
+    TOKEN_PROVIDER,
+    AdminClient,
+    add_common_arguments,
+    add_throttle_arguments,
+    configure_logging,
+    create_client,
+)
+from g4j_ops.batchsize import AUTO, create_batch_size, parse_batch_size
+from g4j_ops.checkpoint import Checkpoint
+from g4j_ops.client import MAX_CONFIGURATION_BATCH
+from g4j_ops.metrics import add_metrics_arguments, start_reporting
+from g4j_ops.quarantine import Quarantine
+from g4j_ops.runner import run_batches
+from g4j_ops.shard import add_shard_arguments, select, shard_path
+from g4j_ops.sources import read_column_from
 
 LOG = logging.getLogger(__name__)
 
-session = requests.Session()
-
-
-def configure_logging(level='DEBUG'):
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-    ch = logging.StreamHandler(sys.stdout)
-    ch.setFormatter(formatter)
-    ch.setLevel(level)
-
-    root = logging.getLogger()
-    root.setLevel(level)
-    root.addHandler(ch)
-
-
-class SLAuth(AuthBase):
-    def __init__(self, audience, group, environment):
-        self.audience = audience
-        self.group = group
-        self.environment = environment
-
-    def __call__(self, req: Request) -> Request:
-        cmd = ['atlas',
-               'slauth', 'token',
-               '-m',
-               '-g', self.group,
-               '-e', self.environment,
-               '-a', self.audience]
-        data = subprocess.check_output(cmd)
-        jwt = data.decode('utf-8').strip()
-
-        req.headers['Authorization'] = f'slauth {jwt}'
-        return req
-
-
-def create_slauth(env: str) -> SLAuth:
-    return SLAuth(
-        audience=f'github-for-jira',
-        group=f'micros-sv--github-for-jira-dl-admins',
-        environment=env
-    )
-
-
-class Environment(NamedTuple):
-    github_for_jira_url: str
-    github_for_jira_auth: object
-
-
-def create_environment(env: str) -> Environment:
-    print("Running for env", env)
-    if env == 'dev':
-        return Environment(
-            github_for_jira_url='https://github-for-jira.ap-southwest-2.dev.atl-paas.net',
-            github_for_jira_auth=create_slauth(env))
-    elif env == 'staging':
-        return Environment(
-            github_for_jira_url='https://github-for-jira.us-west-1.staging.atl-paas.net',
-            github_for_jira_auth=create_slauth(env))
-    elif env == 'prod':
-        return Environment(
-            github_for_jira_url='https://github-for-jira.us-west-1.prod.atl-paas.net',
-            github_for_jira_auth=create_slauth(env))
-    else:
-        raise ValueError(f'Invalid environment {env}')
-
-@dataclass(frozen=True)
-class JiraHost:
-    jiraHost: str
-
-    @staticmethod
-    def from_dict(d):
-        return JiraHost(d['jiraHost'])
-
-def process_jiraHost(env: Environment, jiraHosts) -> bool:
-    url = '{}/api/configuration'.format(env.github_for_jira_url)
 
-    LOG.debug('Starting rotation of %s with url: %s', jiraHosts, url)
-    response = session.post(url,
-      auth=env.github_for_jira_auth,
-      json={
-        "jiraHosts": list(jiraHosts)
-      },
-      headers = {"Content-Type": "application/json"})
+def process_jiraHost(client: AdminClient, jiraHosts) -> requests.Response:
+    LOG.debug('Starting rotation of %s', jiraHosts)
+    response = client.sync_configuration(jiraHosts)
 
     if response.ok:
         LOG.info('Sync of %s successfully synced: (%s).',
                  jiraHosts, response.status_code)
-        return 'success'
     else:
         LOG.error('Sync of %s failed (%s): %s',
                   jiraHosts, response.status_code, response.text)
-        return 'error'
+    return response
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--env', choices=('dev', 'staging', 'prod'), required=True)
-    parser.add_argument('--batchsize', default=10, type=float, help='How many jiraHosts to process each iteration')
-    parser.add_argument('--input', type=argparse.FileType('r'), required=True)
-    parser.add_argument('--output', type=argparse.FileType('a+'), required=True)
-    parser.add_argument('--sleep', type=float, help='How long to wait between requests in seconds', required=True)
-    parser.add_argument('--level', default='INFO', choices=('INFO', 'ERROR', 'WARNING', 'DEBUG', 'CRITICAL'))
+    add_common_arguments(parser)
+    parser.add_argument('--batchsize', default=10, type=parse_batch_size,
+                        help=f'How many jiraHosts to process each iteration, at most {MAX_CONFIGURATION_BATCH}, or {AUTO} to tune it to the measured latency')
+    parser.add_argument('--input', type=argparse.FileType('rb'), required=True)
+    parser.add_argument('--output', required=True, help='Checkpoint journal to record progress in and resume from')
+    add_shard_arguments(parser)
+    parser.add_argument('--quarantine', help='Where to write jiraHosts the API rejects, <output>.quarantine.csv by default')
+    add_throttle_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
     configure_logging(level=args.level)
 
-    env = create_environment(args.env)
-    input_file = args.input
-    output_file = args.output
-
-    processed = set()
-    output_file.seek(0)
-    output_reader = csv.DictReader(output_file, fieldnames=['jiraHost'])
-    for row in output_reader:
-        processed.add(JiraHost.from_dict(row))
-    output_writer = csv.DictWriter(output_file, fieldnames=['jiraHost', 'status'])
-    input_reader = csv.DictReader(input_file, fieldnames=['jiraHost'])
-
-    jiraHosts = []
-    for row in input_reader:
-        jiraHost = JiraHost.from_dict(row)
-        if jiraHost.jiraHost == 'jiraHost':
-            # Skip header
-            continue
-
-        if jiraHost in processed:
-            # Skip already processed
-            continue
-
-        jiraHosts.append(jiraHost.jiraHost)
-
-    for i in range(0, len(jiraHosts), args.batchsize):
-        jiraHostBatch = jiraHosts[i:i+args.batchsize]
-        print("processing batch: ", jiraHostBatch)
-        status = process_jiraHost(env, jiraHostBatch)
-        if status == 'error':
-            LOG.error('Stopping due to error. To skip a particular jiraHost, add a row to output file')
-            sys.exit(1)
-
-        processed.add(jiraHost)
-        for jiraHostEntry in jiraHostBatch:
-            output_writer.writerow({'jiraHost': jiraHostEntry, 'status': status})
-
-        time.sleep(args.sleep)
+    output = shard_path(args.output, args.shard)
+    checkpoint = Checkpoint(output)
+    reporter = start_reporting(args, args.input, input_offset=checkpoint.input_offset)
+    client = create_client(args)
+    quarantine = Quarantine(args.quarantine or f'{output}.quarantine.csv')
+    if args.shard:
+        LOG.info('Handling shard %s, checkpointed in %s', args.shard, output)
+    LOG.info('Resuming from input offset %s', checkpoint.input_offset)
+
+    entries = select(read_column_from(args.input, 'jiraHost', start=checkpoint.input_offset), args.shard,
+                     key=lambda entry: entry.value)
+    summary = run_batches(entries,
+                          lambda jiraHosts: process_jiraHost(client, jiraHosts),
+                          checkpoint,
+                          quarantine,
+                          batch_size=create_batch_size(args, MAX_CONFIGURATION_BATCH),
+                          sleep=args.sleep)
+
+    quarantine.close()
+    checkpoint.close()
+    client.close()
+    TOKEN_PROVIDER.log_stats()
+    reporter.finish(summary=summary._asdict())
+
+    if summary.failed:
+        LOG.error('%s jiraHosts still failed after retries. Run again with the same --output to retry them', summary.failed)
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
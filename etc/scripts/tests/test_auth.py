@@ -0,0 +1,120 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import base64
+import json
+import threading
+import unittest
+from g4j_ops.auth import DEFAULT_TOKEN_TTL_SECONDS, SLAuthTokenProvider, jwt_expiry
+
+
+def jwt(exp: float, serial: int = 0) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': exp, 'jti': serial}).encode()).decode().rstrip('=')
+    return f'header.{payload}.signature'
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingFetch:
+    def __init__(self, clock: Clock, ttl: float = 600):
+        self.clock = clock
+        self.ttl = ttl
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, group, environment, audience):
+        with self._lock:
+            self.calls.append((group, environment, audience))
+            return jwt(self.clock() + self.ttl, len(self.calls))
+
+
+def join_refreshes():
+    for thread in threading.enumerate():
+        if thread.name == 'slauth-refresh':
+            thread.join()
+
+
+class JwtExpiryTest(unittest.TestCase):
+    def test_reads_exp(self):
+        self.assertEqual(jwt_expiry(jwt(1234)), 1234.0)
+
+    def test_opaque_token_has_no_expiry(self):
+        self.assertIsNone(jwt_expiry('not-a-jwt'))
+        self.assertIsNone(jwt_expiry('a.b.c'))
+
+
+class SLAuthTokenProviderTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.fetch = CountingFetch(self.clock)
+        self.provider = SLAuthTokenProvider(fetch=self.fetch, refresh_margin=60, clock=self.clock)
+
+    def test_token_is_cached_per_key(self):
+        first = self.provider.get_token('group', 'prod', 'audience')
+        self.clock.now += 100
+
+        self.assertEqual(self.provider.get_token('group', 'prod', 'audience'), first)
+        self.assertNotEqual(self.provider.get_token('group', 'staging', 'audience'), first)
+        self.assertEqual(len(self.fetch.calls), 2)
+        self.assertEqual(self.provider.stats(), {'fetches': 2, 'hits': 1, 'saved': 1})
+
+    def test_refreshes_in_background_within_the_margin(self):
+        first = self.provider.get_token('group', 'prod', 'audience')
+        self.clock.now += 550
+
+        # Still valid, so the caller gets it straight away while a new one is fetched
+        self.assertEqual(self.provider.get_token('group', 'prod', 'audience'), first)
+        join_refreshes()
+
+        self.assertEqual(len(self.fetch.calls), 2)
+        self.assertNotEqual(self.provider.get_token('group', 'prod', 'audience'), first)
+        self.assertEqual(len(self.fetch.calls), 2)
+
+    def test_expired_token_is_fetched_again(self):
+        first = self.provider.get_token('group', 'prod', 'audience')
+        self.clock.now += 600
+
+        self.assertNotEqual(self.provider.get_token('group', 'prod', 'audience'), first)
+        self.assertEqual(len(self.fetch.calls), 2)
+
+    def test_invalidate_drops_the_token(self):
+        first = self.provider.get_token('group', 'prod', 'audience')
+        self.provider.invalidate('group', 'prod', 'audience')
+
+        self.assertNotEqual(self.provider.get_token('group', 'prod', 'audience'), first)
+        self.assertEqual(len(self.fetch.calls), 2)
+
+    def test_opaque_token_lives_for_the_default_ttl(self):
+        provider = SLAuthTokenProvider(fetch=lambda *key: 'opaque', clock=self.clock)
+        provider.get_token('group', 'prod', 'audience')
+        self.clock.now += DEFAULT_TOKEN_TTL_SECONDS - 61
+        provider.get_token('group', 'prod', 'audience')
+
+        self.assertEqual(provider.stats()['fetches'], 1)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        started = threading.Barrier(8)
+
+        def call():
+            started.wait()
+            self.provider.get_token('group', 'prod', 'audience')
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.fetch.calls), 1)
+        self.assertEqual(self.provider.stats()['hits'], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
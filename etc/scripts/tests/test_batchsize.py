@@ -0,0 +1,106 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import argparse
+import unittest
+from g4j_ops.batchsize import AUTO, BatchSizeTuner, LatencyModel, fit, parse_batch_size
+
+
+class FitTest(unittest.TestCase):
+    def test_recovers_a_linear_latency(self):
+        model = fit([(size, 0.2 + 0.01 * size) for size in (10, 20, 40, 10, 20)])
+
+        self.assertAlmostEqual(model.a, 0.2)
+        self.assertAlmostEqual(model.b, 0.01)
+        self.assertAlmostEqual(model.c, 0.0)
+
+    def test_recovers_a_quadratic_latency(self):
+        model = fit([(size, 0.5 + 0.002 * size + 0.0001 * size * size) for size in (10, 50, 100, 200)])
+
+        self.assertAlmostEqual(model.a, 0.5)
+        self.assertAlmostEqual(model.b, 0.002)
+        self.assertAlmostEqual(model.c, 0.0001)
+
+    def test_quadratic_term_needs_three_sizes(self):
+        model = fit([(size, 0.5 + 0.0001 * size * size) for size in (10, 100, 10, 100)])
+
+        self.assertEqual(model.c, 0.0)
+
+    def test_needs_two_sizes(self):
+        self.assertIsNone(fit([(10, 0.3), (10, 0.4)]))
+
+    def test_latency_not_growing_with_size_is_flat(self):
+        model = fit([(10, 0.5), (40, 0.3), (10, 0.4)])
+
+        self.assertEqual(model.b, 0.0)
+        self.assertAlmostEqual(model.a, 0.4)
+
+
+class LatencyModelTest(unittest.TestCase):
+    def test_quadratic_throughput_peaks_at_the_square_root_of_a_over_c(self):
+        self.assertEqual(LatencyModel(1.0, 0.0, 0.0001).best_size(ceiling=100, min_size=1, max_size=1000), 100)
+
+    def test_linear_size_is_bounded_by_the_ceiling(self):
+        self.assertEqual(LatencyModel(1.0, 0.01).best_size(ceiling=5, min_size=1, max_size=1000), 400)
+        self.assertEqual(LatencyModel(1.0, 0.01).best_size(ceiling=50, min_size=1, max_size=1000), 1000)
+        self.assertEqual(LatencyModel(10.0, 0.01).best_size(ceiling=5, min_size=1, max_size=1000), 1)
+
+
+class BatchSizeTunerTest(unittest.TestCase):
+    def test_doubles_until_there_is_a_fit(self):
+        tuner = BatchSizeTuner(initial_size=10, max_latency=10)
+
+        tuner.record(10, 0.5)
+
+        self.assertEqual(tuner(), 20)
+        self.assertIsNone(tuner.model)
+
+    def test_settles_on_the_best_size_within_twice_what_was_measured(self):
+        tuner = BatchSizeTuner(initial_size=10, max_latency=5)
+        for size in (10, 20, 40, 80, 160):
+            tuner.record(size, 1.0 + 0.01 * size)
+
+        # 400 items answer within 5s, and 320 is as far as the fit is trusted
+        self.assertEqual(tuner.size, 320)
+        tuner.record(320, 1.0 + 0.01 * 320)
+        # Exact samples still leave the quadratic term a rounding error away from zero
+        self.assertAlmostEqual(tuner.size, 400, delta=10)
+
+    def test_probes_around_the_chosen_size(self):
+        tuner = BatchSizeTuner(initial_size=100, max_latency=5)
+        tuner.record(100, 2.0)
+        tuner.record(200, 3.0)
+
+        sizes = [tuner() for _ in range(16)]
+
+        # 1s + 10ms per item reaches 5s at 400 items, twice the biggest batch measured
+        self.assertEqual(sizes[7], 500)
+        self.assertEqual(sizes[15], 320)
+        self.assertEqual(set(sizes[:7] + sizes[8:15]), {400})
+
+    def test_failures_cap_the_size_for_a_window(self):
+        tuner = BatchSizeTuner(initial_size=100, window=4)
+        tuner.record_failure(100)
+        self.assertEqual(tuner.size, 75)
+
+        # Fast answers would double the size, but not past the cap until the window has gone by
+        sizes = []
+        for _ in range(4):
+            tuner.record(60, 0.1)
+            sizes.append(tuner.size)
+
+        self.assertEqual(sizes, [75, 75, 75, 120])
+
+
+class ParseBatchSizeTest(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(parse_batch_size('25'), 25)
+        self.assertEqual(parse_batch_size(AUTO), AUTO)
+        for value in ('0', 'big'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_batch_size(value)
+
+
+if __name__ == '__main__':
+    unittest.main()
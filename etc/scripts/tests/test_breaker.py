@@ -0,0 +1,139 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import threading
+import time
+import unittest
+from g4j_ops.breaker import CLOSED, HALF_OPEN, MAX_COOLDOWN_SECONDS, OPEN, CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Probe:
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.answers.pop(0)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.probe = Probe()
+
+    def breaker(self, **kwargs) -> CircuitBreaker:
+        kwargs.setdefault('window', 4)
+        kwargs.setdefault('cooldown', 30)
+        return CircuitBreaker(self.probe, clock=self.clock, **kwargs)
+
+    def send(self, breaker: CircuitBreaker, status_code, latency: float = 0.1):
+        breaker.acquire()
+        breaker.record(status_code, latency)
+
+    def open(self, breaker: CircuitBreaker):
+        for _ in range(breaker.window):
+            self.send(breaker, 503)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_opens_once_the_window_is_full_and_bad_enough(self):
+        breaker = self.breaker(error_rate=0.5)
+
+        self.send(breaker, 503)
+        self.send(breaker, None)
+        self.assertEqual(breaker.state, CLOSED)
+        self.send(breaker, 200)
+        self.send(breaker, 200)
+
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.opened, 1)
+
+    def test_slow_responses_count_and_throttling_and_rejections_do_not(self):
+        breaker = self.breaker(error_rate=0.5, max_latency=1.0)
+        for status_code in (429, 400, 429, 404):
+            self.send(breaker, status_code)
+        self.assertEqual(breaker.state, CLOSED)
+
+        self.send(breaker, 200, latency=5.0)
+        self.send(breaker, 200, latency=5.0)
+
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_a_healthy_probe_after_the_cooldown_half_opens_and_enough_successes_close(self):
+        breaker = self.breaker(window=8)
+        self.open(breaker)
+        self.probe.answers = [200]
+
+        self.clock.now += 30
+        breaker.acquire()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertEqual(self.probe.calls, 1)
+        breaker.record(200, 0.1)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.send(breaker, 200)
+
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.open_seconds, 30)
+
+    def test_a_failed_probe_waits_another_cooldown(self):
+        # The wait for the next probe is a real one, so this runs on the real clock
+        breaker = CircuitBreaker(self.probe, window=4, cooldown=0.2)
+        self.open(breaker)
+        self.probe.answers = [503, 200]
+        time.sleep(0.2)
+
+        started = time.monotonic()
+        breaker.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(self.probe.calls, 2)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        breaker.record(200, 0.1)
+
+    def test_failure_while_half_open_reopens_with_a_longer_cooldown(self):
+        breaker = self.breaker(cooldown=200)
+        self.open(breaker)
+        self.probe.answers = [200, 200]
+
+        self.clock.now += 200
+        breaker.acquire()
+        breaker.record(502, 0.1)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.cooldown, MAX_COOLDOWN_SECONDS)
+        self.assertEqual(breaker.opened, 1)
+
+        self.clock.now += MAX_COOLDOWN_SECONDS
+        breaker.acquire()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertEqual(self.probe.calls, 2)
+
+    def test_half_open_lets_a_quarter_of_the_concurrency_through(self):
+        breaker = self.breaker(concurrency=8, window=40)
+        self.open(breaker)
+        self.probe.answers = [200]
+        self.clock.now += 30
+        breaker.acquire()
+        breaker.acquire()
+
+        admitted = threading.Event()
+        thread = threading.Thread(target=lambda: (breaker.acquire(), admitted.set()), daemon=True)
+        thread.start()
+        self.assertFalse(admitted.wait(0.2))
+
+        breaker.record(200, 0.1)
+        self.assertTrue(admitted.wait(5))
+        breaker.record(200, 0.1)
+        breaker.record(200, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from g4j_ops.checkpoint import ERROR, SUCCESS, Checkpoint, OffsetTracker
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Records two batches and dies without closing the journal, as a killed run would
+CRASHING_RUN = '''
+import os, sys
+from g4j_ops.checkpoint import ERROR, SUCCESS, Checkpoint
+checkpoint = Checkpoint(sys.argv[1])
+checkpoint.record(['1', '2', '3'], SUCCESS)
+checkpoint.record(['4'], ERROR, 'Service Unavailable')
+checkpoint.set_input_offset(3)
+os._exit(1)
+'''
+
+
+class OffsetTrackerTest(unittest.TestCase):
+    def test_offset_only_advances_past_a_contiguous_done_prefix(self):
+        tracker = OffsetTracker(start=10)
+        for end_offset in (20, 30, 40, 50):
+            tracker.add(end_offset)
+
+        self.assertEqual(tracker.complete(30), 10)
+        self.assertEqual(tracker.complete(50), 10)
+        self.assertEqual(tracker.complete(20), 30)
+        self.assertEqual(tracker.complete(40), 50)
+        self.assertEqual(tracker.watermark, 50)
+
+    def test_batches_added_after_completions_wait_their_turn(self):
+        tracker = OffsetTracker()
+        tracker.add(5)
+        self.assertEqual(tracker.complete(5), 5)
+        tracker.add(8)
+        tracker.add(12)
+
+        self.assertEqual(tracker.complete(12), 5)
+        self.assertEqual(tracker.complete(8), 12)
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'output.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_journal_reopens_after_a_crash(self):
+        process = subprocess.run([sys.executable, '-c', CRASHING_RUN, self.path], cwd=SCRIPTS_DIR, capture_output=True, text=True)
+        self.assertEqual(process.returncode, 1, process.stderr)
+        # The run never checkpointed the WAL into the database
+        self.assertTrue(os.path.exists(f'{self.path}-wal'))
+
+        checkpoint = Checkpoint(self.path)
+        self.addCleanup(checkpoint.close)
+        self.assertTrue(all(checkpoint.is_done(key) for key in ('1', '2', '3')))
+        self.assertFalse(checkpoint.is_done('4'))
+        self.assertEqual(checkpoint.get('4')['last_error'], 'Service Unavailable')
+        self.assertEqual(checkpoint.input_offset, 3)
+
+    def test_retries_count_attempts_and_the_offset_never_goes_back(self):
+        checkpoint = Checkpoint(self.path)
+        self.addCleanup(checkpoint.close)
+        checkpoint.record(['7'], ERROR, 'timed out')
+        checkpoint.record(['7'], SUCCESS)
+        checkpoint.set_input_offset(20)
+        checkpoint.set_input_offset(15)
+
+        self.assertEqual(checkpoint.get('7')['attempts'], 2)
+        self.assertIsNone(checkpoint.get('7')['last_error'])
+        self.assertEqual(checkpoint.input_offset, 20)
+
+    def test_legacy_csv_is_converted_in_place(self):
+        with open(self.path, 'w') as f:
+            f.write('101,success\n102,success\n\n103,success\n')
+
+        checkpoint = Checkpoint(self.path)
+        self.addCleanup(checkpoint.close)
+
+        self.assertEqual(checkpoint.counts(), {SUCCESS: 3})
+        self.assertTrue(checkpoint.is_done('102'))
+        with open(f'{self.path}.bak') as f:
+            self.assertEqual(f.readline(), '101,success\n')
+
+    def test_converted_journal_is_not_converted_again(self):
+        with open(self.path, 'w') as f:
+            f.write('101,success\n')
+        Checkpoint(self.path).close()
+        os.remove(f'{self.path}.bak')
+
+        checkpoint = Checkpoint(self.path)
+        self.addCleanup(checkpoint.close)
+
+        self.assertFalse(os.path.exists(f'{self.path}.bak'))
+        self.assertEqual(checkpoint.counts(), {SUCCESS: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
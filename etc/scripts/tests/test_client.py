@@ -0,0 +1,73 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import requests
+import threading
+import unittest
+from g4j_ops.breaker import HALF_OPEN, OPEN, CircuitBreaker
+from g4j_ops.client import AdminClient
+from script_common.retry import RetryPolicy
+
+
+class Environment:
+    # Nothing listens on port 1, so a request that does go out fails to connect
+    github_for_jira_url = 'http://127.0.0.1:1'
+    github_for_jira_auth = None
+
+
+class FailingBudget:
+    def acquire(self):
+        raise RuntimeError('budget unavailable')
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class AdminClientBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        # Half-open lets one request through at a time, so a slot that isn't given back blocks every later one
+        self.breaker = CircuitBreaker(lambda: 200, window=4, cooldown=30, concurrency=1, clock=self.clock)
+        for _ in range(self.breaker.window):
+            self.breaker.acquire()
+            self.breaker.record(503, 0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.clock.now += self.breaker.cooldown
+
+    def assert_slot_was_released(self):
+        self.assertEqual(self.breaker.state, OPEN)
+        self.clock.now += self.breaker.cooldown
+
+        admitted = threading.Event()
+        threading.Thread(target=lambda: (self.breaker.acquire(), admitted.set()), daemon=True).start()
+
+        self.assertTrue(admitted.wait(5), 'the half-open slot was never released')
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.record(200, 0.1)
+
+    def test_breaker_slot_is_released_when_the_request_never_goes_out(self):
+        client = AdminClient(Environment(), budget=FailingBudget(), breaker=self.breaker)
+
+        with self.assertRaises(RuntimeError):
+            client.get('/api')
+
+        self.assert_slot_was_released()
+
+    def test_breaker_slot_is_released_when_the_connection_fails(self):
+        # A plain session, without the connection retries of create_session
+        client = AdminClient(Environment(), session=requests.Session(), retry=RetryPolicy(max_attempts=1), breaker=self.breaker)
+
+        with self.assertRaises(requests.ConnectionError):
+            client.get('/api')
+
+        self.assert_slot_was_released()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import os
+import unittest
+from g4j_ops.dedupe import BloomFilter, Deduplicator, _digest, grouped_batches
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        digests = [_digest(i) for i in range(1000)]
+        for digest in digests:
+            bloom.add(digest)
+
+        self.assertTrue(all(bloom.add(digest) for digest in digests))
+
+    def test_false_positives_stay_under_the_error_rate_up_to_capacity(self):
+        bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+
+        # Each add of a new key that says it may have been added before is a false positive
+        false_positives = sum(1 for i in range(10_000) if bloom.add(_digest(i)))
+
+        self.assertLess(false_positives, 100)
+
+
+class DeduplicatorTest(unittest.TestCase):
+    def test_drops_repeats_and_counts_them(self):
+        deduplicator = Deduplicator(capacity=100)
+        self.addCleanup(deduplicator.close)
+
+        kept = list(deduplicator.filter([1, 2, 1, 3, 2, 1]))
+
+        self.assertEqual(kept, [1, 2, 3])
+        self.assertEqual((deduplicator.seen, deduplicator.duplicates), (6, 3))
+
+    def test_filters_on_a_key(self):
+        deduplicator = Deduplicator(capacity=100)
+        self.addCleanup(deduplicator.close)
+
+        kept = list(deduplicator.filter([('a', 1), ('b', 2), ('a', 3)], key=lambda item: item[0]))
+
+        self.assertEqual(kept, [('a', 1), ('b', 2)])
+
+    def test_spills_to_sqlite_past_the_memory_limit(self):
+        # A tiny filter that says "maybe" to nearly everything, so the exact store decides
+        deduplicator = Deduplicator(capacity=10, error_rate=0.5, max_in_memory=100)
+
+        kept = list(deduplicator.filter(list(range(1000)) + list(range(1000))))
+        spill_path = deduplicator._spill_path
+
+        self.assertEqual(kept, list(range(1000)))
+        self.assertEqual(deduplicator.duplicates, 1000)
+        self.assertTrue(os.path.exists(spill_path))
+        deduplicator.close()
+        self.assertFalse(os.path.exists(spill_path))
+
+
+class GroupedBatchesTest(unittest.TestCase):
+    def test_batches_only_hold_one_group(self):
+        items = [('a', 1), ('b', 1), ('a', 2), ('a', 3), ('b', 2), ('c', 1)]
+
+        batches = list(grouped_batches(items, key=lambda item: item[0], size=2))
+
+        self.assertEqual(batches, [[('a', 1), ('a', 2)], [('b', 1), ('b', 2)], [('a', 3)], [('c', 1)]])
+
+    def test_oldest_group_is_flushed_when_too_many_are_open(self):
+        items = [('a', 1), ('b', 1), ('c', 1), ('a', 2)]
+
+        batches = list(grouped_batches(items, key=lambda item: item[0], size=10, max_open_groups=2))
+
+        self.assertEqual(batches, [[('a', 1)], [('b', 1)], [('c', 1)], [('a', 2)]])
+
+
+if __name__ == '__main__':
+    unittest.main()
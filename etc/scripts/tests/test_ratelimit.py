@@ -0,0 +1,101 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import unittest
+from script_common.ratelimit import AdaptiveRateLimiter, parse_retry_after
+
+
+class FakeTime:
+    """A clock that only moves when slept on."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(time: FakeTime, **kwargs) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(clock=time.clock, sleep=time.sleep, **kwargs)
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after('12'), 12.0)
+        self.assertEqual(parse_retry_after('-3'), 0.0)
+
+    def test_http_date_in_the_past(self):
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.time = FakeTime()
+
+    def test_starts_at_a_quarter_of_the_target(self):
+        self.assertEqual(limiter(self.time, target_rate=8).rate, 2)
+
+    def test_success_increases_additively_up_to_the_target(self):
+        rate_limiter = limiter(self.time, target_rate=10, initial_rate=9, increase_step=0.5)
+
+        rate_limiter.record(200, 0.1)
+        self.assertEqual(rate_limiter.rate, 9.5)
+        rate_limiter.record(200, 0.1)
+        rate_limiter.record(200, 0.1)
+        self.assertEqual(rate_limiter.rate, 10)
+
+    def test_throttling_and_failures_halve_the_rate_down_to_the_minimum(self):
+        rate_limiter = limiter(self.time, target_rate=10, initial_rate=8, min_rate=1.5)
+
+        rate_limiter.record(429, 0.1)
+        self.assertEqual(rate_limiter.rate, 4)
+        rate_limiter.record(503, 0.1)
+        self.assertEqual(rate_limiter.rate, 2)
+        rate_limiter.record(None, 0.1)
+        self.assertEqual(rate_limiter.rate, 1.5)
+
+    def test_slow_responses_count_as_throttling(self):
+        rate_limiter = limiter(self.time, target_rate=10, initial_rate=8, max_latency=1.0)
+
+        rate_limiter.record(200, 2.5)
+
+        self.assertEqual(rate_limiter.rate, 4)
+
+    def test_client_errors_leave_the_rate_alone(self):
+        rate_limiter = limiter(self.time, target_rate=10, initial_rate=8)
+
+        rate_limiter.record(400, 0.1)
+
+        self.assertEqual(rate_limiter.rate, 8)
+
+    def test_acquire_paces_at_the_current_rate(self):
+        rate_limiter = limiter(self.time, target_rate=4, initial_rate=4)
+
+        for _ in range(5):
+            rate_limiter.acquire()
+
+        # The burst of one goes straight out, then one every quarter of a second
+        self.assertAlmostEqual(self.time.now, 1.0)
+
+    def test_retry_after_pauses_every_caller(self):
+        rate_limiter = limiter(self.time, target_rate=100, initial_rate=100)
+        rate_limiter.acquire()
+
+        rate_limiter.record(429, 0.1, retry_after=30)
+        rate_limiter.acquire()
+
+        self.assertGreaterEqual(self.time.now, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import io
+import requests
+import unittest
+from script_common.retry import RetryPolicy, is_retryable_status
+
+
+def response(status_code: int, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO()
+    return response
+
+
+class Answers:
+    """Returns, or raises, the given answers in turn."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def __call__(self) -> requests.Response:
+        answer = self.answers[self.calls]
+        self.calls += 1
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.slept = []
+
+    def policy(self, **kwargs) -> RetryPolicy:
+        kwargs.setdefault('rand', lambda: 1.0)
+        return RetryPolicy(sleep=self.slept.append, **kwargs)
+
+    def test_retryable_statuses(self):
+        self.assertTrue(all(is_retryable_status(status) for status in (429, 500, 502, 503, 504)))
+        self.assertFalse(any(is_retryable_status(status) for status in (200, 400, 401, 403, 404, 413, 422)))
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        policy = self.policy(base_delay=1, max_delay=5)
+
+        self.assertEqual([policy.delay(attempt) for attempt in range(1, 6)], [1, 2, 4, 5, 5])
+
+    def test_backoff_has_full_jitter(self):
+        policy = self.policy(base_delay=1, max_delay=60, rand=lambda: 0.25)
+
+        self.assertEqual(policy.delay(3), 1.0)
+
+    def test_retry_after_is_a_minimum_within_the_cap(self):
+        policy = self.policy(base_delay=1, max_delay=60, rand=lambda: 0.0)
+
+        self.assertEqual(policy.delay(1, retry_after=20), 20)
+        self.assertEqual(policy.delay(1, retry_after=3600), 60)
+
+    def test_transient_failures_are_retried(self):
+        send = Answers(response(503), requests.ConnectionError(), response(429, {'Retry-After': '7'}), response(200))
+
+        result = self.policy(base_delay=1).call(send)
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(send.calls, 4)
+        self.assertEqual(self.slept, [1, 2, 7])
+
+    def test_client_errors_are_returned_straight_away(self):
+        send = Answers(response(422))
+
+        self.assertEqual(self.policy().call(send).status_code, 422)
+        self.assertEqual(send.calls, 1)
+        self.assertEqual(self.slept, [])
+
+    def test_last_response_is_returned_once_attempts_run_out(self):
+        send = Answers(response(502), response(503), response(504))
+
+        self.assertEqual(self.policy(max_attempts=3).call(send).status_code, 504)
+        self.assertEqual(len(self.slept), 2)
+
+    def test_last_connection_error_is_raised_once_attempts_run_out(self):
+        send = Answers(requests.Timeout(), requests.ConnectionError())
+
+        with self.assertRaises(requests.ConnectionError):
+            self.policy(max_attempts=2).call(send)
+
+
+if __name__ == '__main__':
+    unittest.main()
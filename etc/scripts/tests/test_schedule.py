@@ -0,0 +1,72 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import io
+import unittest
+from g4j_ops.schedule import INPUT, INTERLEAVE, LPT, makespan, median_cost, order_entries, read_costs
+from g4j_ops.sources import Entry
+
+
+def entries(*values: str):
+    return [Entry(offset, value) for offset, value in enumerate(values, start=1)]
+
+
+def values(ordered):
+    return [entry.value for entry in ordered]
+
+
+class OrderEntriesTest(unittest.TestCase):
+    costs = {'a': 1, 'b': 100, 'c': 3, 'd': 40, 'e': 3}
+
+    def test_input_order_is_kept(self):
+        self.assertEqual(values(order_entries(entries('a', 'b', 'c'), self.costs, INPUT)), ['a', 'b', 'c'])
+
+    def test_lpt_puts_the_most_expensive_first_and_keeps_ties_in_input_order(self):
+        ordered = order_entries(entries('a', 'b', 'c', 'd', 'e'), self.costs, LPT)
+
+        self.assertEqual(values(ordered), ['b', 'd', 'c', 'e', 'a'])
+
+    def test_interleave_takes_one_from_each_cost_bucket_in_turn(self):
+        costs = {'big1': 1000, 'big2': 900, 'mid1': 20, 'mid2': 30, 'small1': 1, 'small2': 1}
+
+        ordered = order_entries(entries(*costs), costs, INTERLEAVE)
+
+        self.assertEqual(values(ordered), ['big1', 'mid2', 'small1', 'big2', 'mid1', 'small2'])
+
+    def test_unknown_costs_get_the_median(self):
+        ordered = order_entries(entries('a', 'unknown', 'b', 'c'), {'a': 1, 'b': 100, 'c': 3}, LPT)
+
+        self.assertEqual(median_cost(entries('a', 'b', 'c'), {'a': 1, 'b': 100, 'c': 3}), 3)
+        self.assertEqual(values(ordered), ['b', 'unknown', 'c', 'a'])
+
+
+class MakespanTest(unittest.TestCase):
+    def test_lpt_beats_a_big_job_at_the_end(self):
+        costs = [1, 1, 1, 1, 1, 1, 6]
+
+        self.assertEqual(makespan(costs, workers=2), 9)
+        self.assertEqual(makespan(sorted(costs, reverse=True), workers=2), 6)
+
+    def test_one_worker_takes_the_sum(self):
+        self.assertEqual(makespan([2, 3, 5], workers=1), 10)
+
+
+class ReadCostsTest(unittest.TestCase):
+    def test_reads_the_cost_column_and_restores_the_position(self):
+        file = io.BytesIO(b'installation_id,repos\n1,10\n2,\n3,7.5\n')
+        file.seek(5)
+
+        costs = read_costs(file, 'installation_id', 'repos')
+
+        self.assertEqual(costs, {'1': 10.0, '3': 7.5})
+        self.assertEqual(file.tell(), 5)
+        self.assertFalse(file.closed)
+
+    def test_missing_cost_column_stops_the_run(self):
+        with self.assertRaises(SystemExit):
+            read_costs(io.BytesIO(b'installation_id\n1\n'), 'installation_id', 'repos')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import unittest
+from g4j_ops.budget import FileRateBudget, RateBudget
+from g4j_ops.checkpoint import ERROR, SKIPPED, SUCCESS, Checkpoint
+from g4j_ops.shard import Shard, find_shards, parse_shard, select, shard_of, shard_path
+
+
+class ShardTest(unittest.TestCase):
+    def test_shards_handle_every_key_exactly_once(self):
+        keys = [str(key) for key in range(1000)]
+
+        selected = [list(select(keys, Shard(index, 4), key=lambda key: key)) for index in range(1, 5)]
+
+        self.assertEqual(sorted(key for shard in selected for key in shard), sorted(keys))
+        # sha256 spreads the keys evenly
+        self.assertTrue(all(200 < len(shard) < 300 for shard in selected))
+
+    def test_shard_is_stable_and_ignores_surrounding_whitespace(self):
+        self.assertEqual(shard_of('12345', 8), shard_of(' 12345\n', 8))
+        self.assertEqual(shard_of(12345, 8), shard_of('12345', 8))
+
+    def test_no_shard_selects_everything(self):
+        self.assertEqual(list(select(['a', 'b'], None, key=lambda key: key)), ['a', 'b'])
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('2/4'), Shard(2, 4))
+        for value in ('0/4', '5/4', '2', 'a/b'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_shard(value)
+
+    def test_shard_journals_are_found_next_to_the_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'output.db')
+            for shard in (Shard(2, 3), Shard(1, 3)):
+                open(shard_path(output, shard), 'w').close()
+            open(os.path.join(directory, 'other.shard-3-of-3.db'), 'w').close()
+
+            self.assertEqual(shard_path(output, None), output)
+            self.assertEqual(find_shards(output), {Shard(1, 3): os.path.join(directory, 'output.shard-1-of-3.db'),
+                                                   Shard(2, 3): os.path.join(directory, 'output.shard-2-of-3.db')})
+
+
+class CheckpointMergeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.target = Checkpoint(os.path.join(self.directory.name, 'output.db'))
+        self.other_path = os.path.join(self.directory.name, 'output.shard-1-of-2.db')
+        self.other = Checkpoint(self.other_path)
+
+    def tearDown(self):
+        self.target.close()
+        self.other.close()
+        self.directory.cleanup()
+
+    def test_merge_adds_the_entities_of_the_other_journal(self):
+        self.target.record(['1'], SUCCESS)
+        self.other.record(['2', '3'], SUCCESS)
+
+        self.assertEqual(self.target.merge(self.other_path), 0)
+        self.assertEqual(self.target.counts(), {SUCCESS: 3})
+
+    def test_merge_never_undoes_a_finished_entity(self):
+        self.target.record(['1'], SUCCESS)
+        time.sleep(0.01)
+        self.other.record(['1'], ERROR, 'Service Unavailable')
+
+        self.assertEqual(self.target.merge(self.other_path), 1)
+        self.assertEqual(self.target.get('1')['status'], SUCCESS)
+
+    def test_merge_keeps_the_latest_outcome_and_most_attempts(self):
+        self.target.record(['1'], ERROR, 'timed out')
+        self.target.record(['1'], ERROR, 'timed out')
+        time.sleep(0.01)
+        self.other.record(['1'], SKIPPED)
+
+        self.target.merge(self.other_path)
+
+        self.assertEqual(self.target.get('1')['status'], SKIPPED)
+        self.assertEqual(self.target.get('1')['attempts'], 2)
+
+    def test_merging_again_changes_nothing(self):
+        self.other.record(['1', '2'], SUCCESS)
+        self.target.merge(self.other_path)
+        before = {key: self.target.get(key) for key in ('1', '2')}
+
+        self.assertEqual(self.target.merge(self.other_path), 2)
+        self.assertEqual({key: self.target.get(key) for key in ('1', '2')}, before)
+
+
+class FileRateBudgetTest(unittest.TestCase):
+    def test_processes_sharing_the_file_get_slots_one_interval_apart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'budget')
+            # Each budget opens the file for itself, like separate processes do
+            first, second = FileRateBudget(path, rate=10), FileRateBudget(path, rate=10)
+
+            delays = [first._reserve(), second._reserve(), first._reserve(), second._reserve()]
+
+        for slot, delay in enumerate(delays):
+            self.assertAlmostEqual(delay, slot * 0.1, delta=0.05)
+
+    def test_rate_must_be_positive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ValueError):
+                FileRateBudget(os.path.join(directory, 'budget'), rate=0)
+
+    def test_base_class_needs_a_schedule(self):
+        with self.assertRaises(TypeError):
+            RateBudget(10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Run from etc/scripts with `python3 -m unittest discover tests`.
+"""
+
+import requests
+import unittest
+from g4j_ops.checkpoint import ERROR, QUARANTINED, SUCCESS
+from g4j_ops.splitter import SplitStats, fatal_status, send_bisecting
+
+
+def response(status_code: int, text: str = '') -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = text.encode('utf-8')
+    return response
+
+
+class RecordingSend:
+    def __init__(self, answer):
+        self.answer = answer
+        self.batches = []
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        return self.answer(items)
+
+
+class SendBisectingTest(unittest.TestCase):
+    def test_forbidden_batch_is_not_quarantined(self):
+        send = RecordingSend(lambda items: response(403, 'Forbidden'))
+        stats = SplitStats()
+
+        outcomes = send_bisecting(list(range(100)), send, stats)
+
+        self.assertEqual(len(send.batches), 1)
+        self.assertEqual([outcome.status for outcome in outcomes], [ERROR])
+        self.assertEqual(outcomes[0].items, list(range(100)))
+        self.assertEqual(fatal_status(outcomes), 403)
+        self.assertEqual(stats.rejected_batches, 0)
+
+    def test_not_found_batch_is_not_quarantined(self):
+        send = RecordingSend(lambda items: response(404))
+
+        outcomes = send_bisecting(['a', 'b'], send)
+
+        self.assertEqual([outcome.status for outcome in outcomes], [ERROR])
+        self.assertEqual(fatal_status(outcomes), 404)
+
+    def test_bad_request_isolates_the_rejected_entity(self):
+        send = RecordingSend(lambda items: response(400, 'bad id') if 7 in items else response(200))
+
+        outcomes = send_bisecting(list(range(16)), send)
+
+        quarantined = [item for outcome in outcomes if outcome.status == QUARANTINED for item in outcome.items]
+        succeeded = [item for outcome in outcomes if outcome.status == SUCCESS for item in outcome.items]
+        self.assertEqual(quarantined, [7])
+        self.assertEqual(sorted(succeeded), [i for i in range(16) if i != 7])
+        self.assertIsNone(fatal_status(outcomes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import { GitHubServerApp } from "models/github-server-app";
 import { getLogger } from "config/logger";
 import { v4 as uuid } from "uuid";
 import { ApiRouter } from "routes/api/api-router";
+import * as syncUtils from "~/src/sync/sync-utils";
 
 describe("API Resync POST", () => {
 	const gitHubInstallationId = 1234;
@@ -113,6 +114,39 @@ describe("API Resync POST", () => {
 			});
 	});
 
+	describe("without installationIds", () => {
+		let findOrStartSync: jest.SpyInstance;
+
+		beforeEach(() => {
+			findOrStartSync = jest.spyOn(syncUtils, "findOrStartSync").mockResolvedValue(undefined);
+		});
+
+		afterEach(() => {
+			findOrStartSync.mockRestore();
+		});
+
+		it("should resync by the other filters", async () => {
+			app = createApp();
+
+			await supertest(app)
+				.post(`/api/resync`)
+				.send({
+					statusTypes: ["PENDING"],
+					syncType: "full",
+					targetTasks: ["pull"],
+					limit: 10,
+					offset: 0
+				})
+				.set("X-Slauth-Mechanism", "asap")
+				.then((res) => {
+					expect(res.statusCode).toBe(200);
+					expect(res.body).toEqual([expect.objectContaining({ gitHubInstallationId })]);
+					expect(findOrStartSync).toBeCalledWith(expect.objectContaining({ gitHubInstallationId }),
+						expect.anything(), "full", undefined, ["pull"], { source: "api-resync" });
+				});
+		});
+	});
+
 	it("should return 200 if all checks are met", async () => {
 		app = createApp();
 
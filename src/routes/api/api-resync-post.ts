@@ -43,16 +43,19 @@ export const ApiResyncPost = async (req: Request, res: Response): Promise<void>
 		return;
 	}
 
-	if (!gitHubInstallationIds.length) {
-		res.status(400).send("GitHub installation IDs missing or invalid format");
-		return;
-	}
+	// Without installation IDs the other filters select the subscriptions, a page at a time with limit/offset
+	if (gitHubInstallationIds !== undefined) {
+		if (!Array.isArray(gitHubInstallationIds) || !gitHubInstallationIds.length) {
+			res.status(400).send("GitHub installation IDs missing or invalid format");
+			return;
+		}
 
-	const existingInstallationIds = await getIdsForExistingSubscriptions(gitHubInstallationIds, req.log);
+		const existingInstallationIds = await getIdsForExistingSubscriptions(gitHubInstallationIds, req.log);
 
-	if (!existingInstallationIds.length) {
-		res.status(400).json("No subscriptions exist for provided gitHubInstallation IDs");
-		return;
+		if (!existingInstallationIds.length) {
+			res.status(400).json("No subscriptions exist for provided gitHubInstallation IDs");
+			return;
+		}
 	}
 
 	if (commitsFromDate && commitsFromDate.valueOf() > Date.now()) {